@@ -35,6 +35,130 @@ AUTH_USER_MODEL = 'auth.User'
 
 MEDIA_ROOT = os.path.join(BASE_DIR, 'files')
 
+# Хранилище содержимого файлов (mycloud.backends): local - MEDIA_ROOT на диске сервера,
+# s3 - S3-совместимое хранилище (AWS S3, MinIO), при котором серверы приложения не хранят файлов
+STORAGE_BACKEND = os.getenv('STORAGE_BACKEND', 'local')
+S3_BUCKET = os.getenv('S3_BUCKET', '')
+# Префикс ключей внутри бакета, если бакет общий с другими приложениями
+S3_PREFIX = os.getenv('S3_PREFIX', '')
+# Адрес MinIO или другого S3-совместимого сервиса; пусто - AWS S3
+S3_ENDPOINT_URL = os.getenv('S3_ENDPOINT_URL', '')
+S3_REGION = os.getenv('S3_REGION', '')
+S3_ACCESS_KEY_ID = os.getenv('S3_ACCESS_KEY_ID', '')
+S3_SECRET_ACCESS_KEY = os.getenv('S3_SECRET_ACCESS_KEY', '')
+# Скачивание перенаправлением на подписанную ссылку хранилища и время её жизни, секунды
+S3_PRESIGNED_DOWNLOADS = os.getenv('S3_PRESIGNED_DOWNLOADS', 'True') == 'True'
+S3_PRESIGNED_EXPIRES = int(os.getenv('S3_PRESIGNED_EXPIRES', 60 * 60))
+
+STORAGES = {
+    'default': {
+        'BACKEND': {
+            'local': 'mycloud.backends.LocalStorage',
+            's3': 'mycloud.backends.S3Storage',
+        }[STORAGE_BACKEND],
+    },
+    'staticfiles': {
+        'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage',
+    },
+}
+
+# Раскладка файлов по подкаталогам user_<id>/ab/cd/<имя>: глубина вложенности и количество
+# шестнадцатеричных символов на уровень (16^MEDIA_SHARD_WIDTH подкаталогов). 0 - все файлы в одном каталоге.
+# Существующие файлы переносятся в новую раскладку командой reshard_files
+MEDIA_SHARD_DEPTH = int(os.getenv('MEDIA_SHARD_DEPTH', 2))
+MEDIA_SHARD_WIDTH = int(os.getenv('MEDIA_SHARD_WIDTH', 2))
+
+# Алгоритм хэша содержимого файлов (любой из hashlib): ETag при скачивании, проверка целостности, дедупликация.
+# Смена алгоритма действует для новых загрузок, хэши старых файлов не пересчитываются
+FILE_DIGEST_ALGORITHM = os.getenv('FILE_DIGEST_ALGORITHM', 'sha256')
+
+# Дедупликация: содержимое хранится один раз на каждый уникальный хэш в MEDIA_ROOT/blobs
+FILE_DEDUPLICATION = os.getenv('FILE_DEDUPLICATION', 'True') == 'True'
+
+# Сжатие содержимого в хранилище (mycloud.compression): пусто - выключено, gzip или zstd (нужен пакет zstandard).
+# Файл сжимается, если пробное сжатие первых FILE_COMPRESSION_PROBE_SIZE байт уменьшило их хотя бы
+# до доли FILE_COMPRESSION_MAX_RATIO; файлы меньше FILE_COMPRESSION_MIN_SIZE байт не сжимаются
+FILE_COMPRESSION = os.getenv('FILE_COMPRESSION', '')
+FILE_COMPRESSION_LEVEL = int(os.getenv('FILE_COMPRESSION_LEVEL')) if os.getenv('FILE_COMPRESSION_LEVEL') else None
+FILE_COMPRESSION_MIN_SIZE = int(os.getenv('FILE_COMPRESSION_MIN_SIZE', 4 * 1024))
+FILE_COMPRESSION_PROBE_SIZE = int(os.getenv('FILE_COMPRESSION_PROBE_SIZE', 64 * 1024))
+FILE_COMPRESSION_MAX_RATIO = float(os.getenv('FILE_COMPRESSION_MAX_RATIO', 0.8))
+
+# Превью изображений и первых страниц PDF (mycloud.previews): строятся фоновой задачей после загрузки
+# и хранятся в каталоге previews хранилища. Нужен пакет Pillow, для PDF - pypdfium2.
+# PREVIEW_SIZE - наибольшая сторона превью, пиксели; файлы больше PREVIEW_MAX_SOURCE_SIZE байт не обрабатываются;
+# PREVIEW_CACHE_MAX_AGE - время кэширования превью браузером, секунды
+PREVIEW_ENABLED = os.getenv('PREVIEW_ENABLED', 'True') == 'True'
+PREVIEW_SIZE = int(os.getenv('PREVIEW_SIZE', 256))
+PREVIEW_QUALITY = int(os.getenv('PREVIEW_QUALITY', 80))
+PREVIEW_MAX_SOURCE_SIZE = int(os.getenv('PREVIEW_MAX_SOURCE_SIZE', 50 * 1024 * 1024))
+PREVIEW_CACHE_MAX_AGE = int(os.getenv('PREVIEW_CACHE_MAX_AGE', 30 * 24 * 60 * 60))
+
+# Квота хранилища на пользователя, байт (0 - без ограничения), проверяется по счётчикам UserUsage
+USER_STORAGE_QUOTA = int(os.getenv('USER_STORAGE_QUOTA', 0))
+
+# Обработчики загрузки считают хэш файла в том же проходе, в котором пишут его на диск
+FILE_UPLOAD_HANDLERS = [
+    'mycloud.upload_handlers.HashingMemoryFileUploadHandler',
+    'mycloud.upload_handlers.HashingTemporaryFileUploadHandler',
+]
+
+# Скачивание файлов: размер блока потоковой отдачи и максимум диапазонов в заголовке Range
+DOWNLOAD_CHUNK_SIZE = int(os.getenv('DOWNLOAD_CHUNK_SIZE', 64 * 1024))
+DOWNLOAD_MAX_RANGES = int(os.getenv('DOWNLOAD_MAX_RANGES', 16))
+
+# Возобновляемая загрузка частями: размер части по умолчанию, допустимые пределы, наибольший
+# размер файла (под него сразу выделяется промежуточный файл; 0 - без ограничения) и время жизни
+# брошенной сессии (секунды), после которого её удаляет команда cleanup_uploads
+UPLOAD_CHUNK_SIZE = int(os.getenv('UPLOAD_CHUNK_SIZE', 8 * 1024 * 1024))
+UPLOAD_MIN_CHUNK_SIZE = int(os.getenv('UPLOAD_MIN_CHUNK_SIZE', 256 * 1024))
+UPLOAD_MAX_CHUNK_SIZE = int(os.getenv('UPLOAD_MAX_CHUNK_SIZE', 64 * 1024 * 1024))
+UPLOAD_MAX_SIZE = int(os.getenv('UPLOAD_MAX_SIZE', 20 * 1024 * 1024 * 1024))
+UPLOAD_SESSION_TTL = int(os.getenv('UPLOAD_SESSION_TTL', 24 * 60 * 60))
+
+# Интервал (секунды) пакетной записи даты и счётчика скачиваний; 0 - записывать сразу
+DOWNLOAD_STATS_FLUSH_INTERVAL = float(os.getenv('DOWNLOAD_STATS_FLUSH_INTERVAL', 5))
+
+# Способ отдачи файлов: python (воркер, для разработки), nginx (X-Accel-Redirect), sendfile (X-Sendfile)
+DOWNLOAD_BACKEND = os.getenv('DOWNLOAD_BACKEND', 'python')
+# internal location nginx, который смотрит в MEDIA_ROOT
+DOWNLOAD_ACCEL_LOCATION = os.getenv('DOWNLOAD_ACCEL_LOCATION', '/protected-files/')
+
+# Очередь фоновых задач (mycloud.jobs), выполняется командой run_jobs
+# JOB_QUEUE_EAGER - выполнять задачи сразу в процессе запроса, без воркера (для разработки)
+JOB_QUEUE_EAGER = os.getenv('JOB_QUEUE_EAGER', 'False') == 'True'
+JOB_MAX_ATTEMPTS = int(os.getenv('JOB_MAX_ATTEMPTS', 5))
+# Задержка перед повтором, секунды; удваивается с каждой неудачной попыткой
+JOB_RETRY_DELAY = int(os.getenv('JOB_RETRY_DELAY', 30))
+# Через сколько секунд задача, захваченная упавшим воркером, снова становится доступной
+JOB_LOCK_TIMEOUT = int(os.getenv('JOB_LOCK_TIMEOUT', 60 * 60))
+JOB_POLL_INTERVAL = float(os.getenv('JOB_POLL_INTERVAL', 1))
+# Сколько секунд хранятся выполненные задачи
+JOB_RETENTION = int(os.getenv('JOB_RETENTION', 7 * 24 * 60 * 60))
+
+# Метрики запросов в формате Prometheus на /metrics (mycloud.metrics, нужен пакет prometheus-client).
+# METRICS_TOKEN - если задан, /metrics требует заголовок Authorization: Bearer <токен>; без токена
+# /metrics отдаётся только при METRICS_PUBLIC=True (по умолчанию при DEBUG=True, для разработки);
+# METRICS_SERVER_TIMING - добавлять в ответы заголовок Server-Timing
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'True') == 'True'
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+METRICS_PUBLIC = os.getenv('METRICS_PUBLIC', os.getenv('DEBUG', 'False')) == 'True'
+METRICS_SERVER_TIMING = os.getenv('METRICS_SERVER_TIMING', 'False') == 'True'
+
+# Сверка MEDIA_ROOT с базой (команда reconcile_storage): размер пачки, возраст файла,
+# после которого файл без записи считается брошенным (секунды), и файл с позицией для продолжения
+RECONCILE_BATCH_SIZE = int(os.getenv('RECONCILE_BATCH_SIZE', 1000))
+RECONCILE_GRACE_PERIOD = int(os.getenv('RECONCILE_GRACE_PERIOD', 60 * 60))
+RECONCILE_CHECKPOINT = os.getenv('RECONCILE_CHECKPOINT', os.path.join(BASE_DIR, 'reconcile.checkpoint.json'))
+# Исправлять ли расхождения в периодической задаче reconcile_storage (иначе только отчёт)
+RECONCILE_REPAIR = os.getenv('RECONCILE_REPAIR', 'False') == 'True'
+# Доля записей пачки без файлов, при которой исправление отменяется (хранилище недоступно или
+# не смонтировано); обойти проверку можно флагом --force команды reconcile_storage
+RECONCILE_MAX_MISSING = float(os.getenv('RECONCILE_MAX_MISSING', 0.2))
+
+# Асинхронные представления скачивания и приёма частей (mycloud.async_views) для запуска под ASGI
+ASYNC_TRANSFER_VIEWS = os.getenv('ASYNC_TRANSFER_VIEWS', 'False') == 'True'
+
 
 # Application definition
 
@@ -52,46 +176,65 @@ INSTALLED_APPS = [
     'djoser',
 ]
 
+# Логирование (mycloud.log): записи в формате JSON с request_id пишет в файл с ротацией фоновый поток,
+# поток запроса не ждёт диска. LOG_MAX_BYTES - размер файла до ротации, LOG_BACKUP_COUNT - сколько
+# старых файлов хранить, LOG_QUEUE_SIZE - предел очереди записей (лишние отбрасываются).
+# Под gunicorn с несколькими воркерами укажите в LOG_FILE {pid}, чтобы каждый процесс ротировал свой файл
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+LOG_FILE = os.getenv('LOG_FILE', os.path.join(BASE_DIR, 'debug.log')).format(pid=os.getpid())
+LOG_MAX_BYTES = int(os.getenv('LOG_MAX_BYTES', 50 * 1024 * 1024))
+LOG_BACKUP_COUNT = int(os.getenv('LOG_BACKUP_COUNT', 5))
+LOG_QUEUE_SIZE = int(os.getenv('LOG_QUEUE_SIZE', 10000))
+# Доля записываемых событий уровня ниже WARNING по именам логгеров (предупреждения и ошибки пишутся всегда)
+LOG_SAMPLING = {
+    'mycloud.downloads': float(os.getenv('LOG_DOWNLOAD_SAMPLE_RATE', 0.1)),
+}
+
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
-    'formatters': {
-        'verbose': {
-            'format': '{levelname} {asctime} {module} {message}',
-            'style': '{',
+    'filters': {
+        'request_id': {
+            '()': 'mycloud.log.RequestIdFilter',
         },
-        'simple': {
-            'format': '{levelname} {message}',
-            'style': '{',
+        'sampling': {
+            '()': 'mycloud.log.SamplingFilter',
+            'rates': LOG_SAMPLING,
+        },
+    },
+    'formatters': {
+        'json': {
+            '()': 'mycloud.log.JsonFormatter',
         },
     },
     'handlers': {
         'file': {
-            'level': 'DEBUG',
-            'class': 'logging.FileHandler',
-            'filename': os.path.join(BASE_DIR, 'debug.log'),
-            'formatter': 'verbose',
+            '()': 'mycloud.log.BackgroundRotatingFileHandler',
+            'filename': LOG_FILE,
+            'max_bytes': LOG_MAX_BYTES,
+            'backup_count': LOG_BACKUP_COUNT,
+            'queue_size': LOG_QUEUE_SIZE,
+            'formatter': 'json',
+            'filters': ['request_id', 'sampling'],
         },
     },
+    # Обработчик только у корневого логгера: записи django и mycloud доходят до него один раз
     'root': {
         'handlers': ['file'],
-        'level': 'DEBUG',
+        'level': LOG_LEVEL,
     },
     'loggers': {
-        'django': {
-            'handlers': ['file'],
-            'level': 'DEBUG',
-            'propagate': True,
-        },
-        'mycloud': {  # Ваше приложение
-            'handlers': ['file'],
-            'level': 'DEBUG',
-            'propagate': True,
+        # SQL-запросы пишутся только при явном LOG_LEVEL=DEBUG для этого логгера
+        'django.db.backends': {
+            'level': 'INFO',
         },
     },
 }
 
 MIDDLEWARE = [
+    'mycloud.log.RequestIdMiddleware',
+    'mycloud.metrics.MetricsMiddleware',
+    'mycloud.routers.ReplicaMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -125,6 +268,12 @@ WSGI_APPLICATION = 'backend_diplom.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.0/ref/settings/#databases
 
+# Постоянные соединения: соединение воркера живёт DB_CONN_MAX_AGE секунд и используется повторно
+# (0 - новое соединение на каждый запрос, пусто - без ограничения); перед повторным использованием
+# оно проверяется, если DB_CONN_HEALTH_CHECKS. Под ASGI задайте DB_CONN_MAX_AGE=0 и используйте PgBouncer
+DB_CONN_MAX_AGE = int(os.getenv('DB_CONN_MAX_AGE', 60)) if os.getenv('DB_CONN_MAX_AGE') != '' else None
+DB_CONN_HEALTH_CHECKS = os.getenv('DB_CONN_HEALTH_CHECKS', 'True') == 'True'
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.postgresql',
@@ -133,9 +282,57 @@ DATABASES = {
         'PORT': os.getenv('DB_PORT'),
         'USER': os.getenv('DB_USER'),
         'PASSWORD': os.getenv('DB_PASSWORD'),
+        'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+        'CONN_HEALTH_CHECKS': DB_CONN_HEALTH_CHECKS,
     }
 }
 
+# Реплика для чтения (mycloud.routers): адрес реплики PostgreSQL; пусто - все запросы в основную базу.
+# Остальные параметры подключения по умолчанию те же, что у основной базы
+DB_REPLICA_HOST = os.getenv('DB_REPLICA_HOST', '')
+DB_REPLICA_ALIAS = 'replica' if DB_REPLICA_HOST else ''
+if DB_REPLICA_HOST:
+    DATABASES[DB_REPLICA_ALIAS] = {
+        **DATABASES['default'],
+        'HOST': DB_REPLICA_HOST,
+        'PORT': os.getenv('DB_REPLICA_PORT', DATABASES['default']['PORT']),
+        'USER': os.getenv('DB_REPLICA_USER', DATABASES['default']['USER']),
+        'PASSWORD': os.getenv('DB_REPLICA_PASSWORD', DATABASES['default']['PASSWORD']),
+        # В тестах реплика - та же база
+        'TEST': {'MIRROR': 'default'},
+    }
+DATABASE_ROUTERS = ['mycloud.routers.ReplicaRouter']
+# Время после записи, в течение которого клиент и пользователь читают из основной базы (read-your-writes);
+# должно превышать задержку репликации
+DB_REPLICA_STICKY_SECONDS = int(os.getenv('DB_REPLICA_STICKY_SECONDS', 10))
+
+
+# Cache
+# По умолчанию локальный LRU-кэш в памяти процесса; для общего кэша между воркерами укажите, например,
+# CACHE_BACKEND=django.core.cache.backends.redis.RedisCache и CACHE_LOCATION=redis://127.0.0.1:6379
+
+CACHE_BACKEND = os.getenv('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache')
+
+CACHES = {
+    'default': {
+        'BACKEND': CACHE_BACKEND,
+        'LOCATION': os.getenv('CACHE_LOCATION', 'mycloud'),
+    },
+}
+if CACHE_BACKEND.endswith('LocMemCache'):
+    CACHES['default']['OPTIONS'] = {'MAX_ENTRIES': int(os.getenv('CACHE_MAX_ENTRIES', 10000))}
+
+# Алиас кэша приложения и время жизни записей hash -> файл для скачивания, секунды
+MYCLOUD_CACHE = 'default'
+FILE_INFO_CACHE_TIMEOUT = int(os.getenv('FILE_INFO_CACHE_TIMEOUT', 60 * 60))
+# Время жизни проверенных токенов и паролей Basic в кэше аутентификации, секунды (0 - без кэша).
+# Сброс записи при отзыве доступа виден только в процессах с тем же кэшем, поэтому по умолчанию
+# кэш аутентификации включается только с общим кэшем (Redis, Memcached); с локальным кэшем процесса
+# явно заданное значение - предельная задержка отзыва доступа в других воркерах
+AUTH_CACHE_TIMEOUT = int(os.getenv(
+    'AUTH_CACHE_TIMEOUT', 0 if CACHE_BACKEND.endswith(('LocMemCache', 'DummyCache')) else 5 * 60
+))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
@@ -177,19 +374,25 @@ USE_TZ = True
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Размер страницы по умолчанию и максимальный для курсорной пагинации списков API
+API_PAGE_SIZE = int(os.getenv('API_PAGE_SIZE', 100))
+API_MAX_PAGE_SIZE = int(os.getenv('API_MAX_PAGE_SIZE', 1000))
+# Максимальное количество файлов в одном пакетном запросе (удаление, изменение, ZIP)
+BULK_MAX_FILES = int(os.getenv('BULK_MAX_FILES', 1000))
+
 REST_FRAMEWORK = {
+    # JSON через orjson; браузерный интерфейс API только при отладке
     'DEFAULT_RENDERER_CLASSES': [
-        'rest_framework.renderers.JSONRenderer',
-        'rest_framework.renderers.BrowsableAPIRenderer',
-    ],
+        'mycloud.renderers.ORJSONRenderer',
+    ] + (['rest_framework.renderers.BrowsableAPIRenderer'] if os.getenv('DEBUG') == 'True' else []),
 
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.AllowAny',
     ],
 
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework.authentication.TokenAuthentication',
-        'rest_framework.authentication.BasicAuthentication',
+        'mycloud.authentication.CachedTokenAuthentication',
+        'mycloud.authentication.CachedBasicAuthentication',
         'rest_framework.authentication.SessionAuthentication',
 
     ),
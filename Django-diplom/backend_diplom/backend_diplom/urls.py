@@ -14,13 +14,24 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+from django.conf import settings
 from django.contrib import admin
 from django.urls import path, include, re_path
 
-from mycloud import views
+from mycloud import async_views, views
+from mycloud.metrics import metrics_view
 from mycloud.views import UserPostList, FileAPIUpdate, FileDownloadView, FileAPIDestroy, \
-    UserListView, UserFileListView, UserDetailView  # , index
+    UserListView, UserFileListView, UserDetailView, UploadSessionCreateView, UploadSessionDetailView, \
+    UploadChunkView, UploadSessionCompleteView, FilePreviewView, FileBulkDeleteView, FileBulkUpdateView, FileBulkDownloadView, \
+    JobDetailView  # , index
 
+# Под ASGI скачивание и приём частей обслуживаются асинхронными представлениями
+if settings.ASYNC_TRANSFER_VIEWS:
+    download_view = async_views.download_file
+    upload_chunk_view = async_views.upload_chunk
+else:
+    download_view = FileDownloadView.as_view()
+    upload_chunk_view = UploadChunkView.as_view()
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -28,11 +39,21 @@ urlpatterns = [
     path('api/v1/admin/users/<int:user_id>/files/', UserFileListView.as_view(), name='user-file-list'),
     path('api/v1/admin/users/<int:pk>/', UserDetailView.as_view(), name='user-detail'),
     path('api/v1/filelist/', UserPostList.as_view()),
-    path('api/v1/download/<str:hash>/', FileDownloadView.as_view()), # URL для скачивания файла
+    path('api/v1/download/<str:hash>/', download_view), # URL для скачивания файла
+    path('api/v1/preview/<str:hash>/', FilePreviewView.as_view()), # Превью файла
     path('api/v1/filelist/<int:pk>/', FileAPIUpdate.as_view()),
     path('api/v1/filedelete/<int:pk>/', FileAPIDestroy.as_view()), # Удаление
+    path('api/v1/filelist/bulk-delete/', FileBulkDeleteView.as_view()), # Пакетные операции
+    path('api/v1/filelist/bulk-update/', FileBulkUpdateView.as_view()),
+    path('api/v1/filelist/zip/', FileBulkDownloadView.as_view()),
+    path('api/v1/jobs/<uuid:pk>/', JobDetailView.as_view()), # Состояние фоновой задачи
+    path('api/v1/uploads/', UploadSessionCreateView.as_view()), # Возобновляемая загрузка частями
+    path('api/v1/uploads/<uuid:session_id>/', UploadSessionDetailView.as_view()),
+    path('api/v1/uploads/<uuid:session_id>/chunks/<int:index>/', upload_chunk_view),
+    path('api/v1/uploads/<uuid:session_id>/complete/', UploadSessionCompleteView.as_view()),
     path('api/v1/filelist/1', FileDownloadView.as_view()), # URL ТЕСТОВЫЙ для скачивания файла
     path('api/v1/auth/', include('djoser.urls')),
+    path('metrics', metrics_view), # Метрики Prometheus
     re_path(r'^auth/', include('djoser.urls.authtoken')),
     #TODO Все настройки для files static
     re_path(r'^.*$', views.index, name='index'),
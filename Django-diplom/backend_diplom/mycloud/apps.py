@@ -5,5 +5,13 @@ class MycloudConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'mycloud'
 
-    # def ready(self):
-    #     import mycloud.signals
+    def ready(self):
+        from django.db.backends.signals import connection_created
+        from .metrics import instrument_connection
+
+        # Регистрация обработчиков фоновых задач
+        import mycloud.tasks  # noqa: F401
+        # Учёт запросов к базе в метриках (mycloud.metrics)
+        connection_created.connect(instrument_connection)
+        # Сброс кэша аутентификации при выходе и изменении пользователей
+        import mycloud.signals  # noqa: F401
@@ -0,0 +1,146 @@
+"""
+Асинхронные варианты представлений передачи файлов для запуска под ASGI (uvicorn, daphne).
+
+Под WSGI каждый медленный клиент занимает поток воркера на всё время передачи. Здесь чтение и
+запись файла выполняются в пуле потоков короткими операциями, а между блоками соединение
+ждёт в цикле событий, поэтому тысячи медленных соединений не занимают потоки.
+Маршруты подключаются вместо синхронных при ASYNC_TRANSFER_VIEWS = True.
+"""
+
+import asyncio
+import logging
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import Http404, HttpResponse, JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_http_methods
+from rest_framework import exceptions, status
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+from . import uploads
+from .cache import aget_file_info
+from .download_stats import download_recorder
+from .backends import local_path
+from .downloads import AsyncFileBody, AsyncStorageFileBody, not_modified, offload_file, serve_encoded, \
+    serve_file, storage_redirect
+from .models import UploadSession
+from .routers import read_from_primary, read_from_replica
+from .utils import seconds_since_epoch
+
+logger = logging.getLogger('mycloud')
+# Частые события скачивания пишутся с долей LOG_SAMPLING
+download_logger = logging.getLogger('mycloud.downloads')
+
+
+def _authenticate(request):
+    """
+    Аутентифицирует запрос классами из DEFAULT_AUTHENTICATION_CLASSES, как это делает APIView.
+
+    Raises:
+        exceptions.APIException: неверные учётные данные или, для сессии браузера, неверный токен CSRF.
+    """
+    drf_request = Request(request, authenticators=[auth() for auth in api_settings.DEFAULT_AUTHENTICATION_CLASSES])
+    user = drf_request.user
+    if user is None or not user.is_authenticated:
+        raise exceptions.NotAuthenticated()
+    return user
+
+
+def _error_response(exc):
+    """
+    Ответ на ошибку DRF с её статусом, как у обработчика исключений APIView.
+    """
+    headers = {}
+    if isinstance(exc, (exceptions.NotAuthenticated, exceptions.AuthenticationFailed)):
+        headers['WWW-Authenticate'] = 'Token'
+    return JsonResponse({'detail': exc.detail}, status=exc.status_code, headers=headers)
+
+
+@require_http_methods(['GET', 'HEAD'])
+async def download_file(request, hash):
+    """
+    Асинхронный вариант FileDownloadView.
+
+    Args:
+        request (HttpRequest): HTTP запрос.
+        hash (str): хеш файла.
+
+    Returns:
+        HttpResponse: файл для скачивания или сообщение об ошибке.
+    """
+    read_from_replica(request)
+    file_info = await aget_file_info(hash)
+    if file_info is None and read_from_primary():
+        file_info = await aget_file_info(hash)
+    if file_info is None:
+        return HttpResponse("File not found", status=404)
+
+    file_path = file_info['path']
+    file_name = file_info['name']
+    download_logger.info(f'Download requested for file: {file_name} with hash: {hash}')
+    if '.' not in file_name:
+        file_name += '.bin'
+    # Подписанная ссылка формируется локально, без запроса к хранилищу
+    encoding = file_info.get('encoding', '')
+    response = storage_redirect(request, file_path, file_name, file_info['etag'], encoding)
+    if response is None:
+        path_file_obj = local_path(file_path)
+        body = AsyncFileBody(path_file_obj) if path_file_obj else AsyncStorageFileBody(file_path)
+        try:
+            stat = await asyncio.to_thread(body.stat)
+        except FileNotFoundError:
+            logger.error(f'File not found: {file_path}')
+            return HttpResponse("File not found", status=404)
+
+        backend = settings.DOWNLOAD_BACKEND
+        if encoding:
+            response = serve_encoded(
+                request, body, file_name, file_info['etag'], encoding, file_info['size'], stat=stat
+            )
+        elif backend == 'python' or path_file_obj is None:
+            response = serve_file(request, path_file_obj, file_name, file_info['etag'], body=body, stat=stat)
+        else:
+            response = not_modified(request, file_info['etag']) or \
+                offload_file(path_file_obj, file_path, file_name, file_info['etag'], backend)
+
+    if response.status_code in (status.HTTP_200_OK, status.HTTP_206_PARTIAL_CONTENT, status.HTTP_302_FOUND):
+        # Докачка диапазонов обновляет дату, но не считается новым скачиванием
+        counted = response.status_code != status.HTTP_206_PARTIAL_CONTENT or \
+            response.get('Content-Range', '').startswith('bytes 0-')
+        await download_recorder.arecord(file_info['id'], seconds_since_epoch(), counted)
+        download_logger.info(f'File {file_name} ready for download')
+    return response
+
+
+@csrf_exempt
+@require_http_methods(['PUT'])
+async def upload_chunk(request, session_id, index):
+    """
+    Асинхронный вариант UploadChunkView: записывает часть по её смещению.
+
+    Args:
+        request (HttpRequest): HTTP запрос.
+        session_id (UUID): ID сессии загрузки.
+        index (int): номер части.
+
+    Returns:
+        JsonResponse: смещение и размер принятой части или сообщение об ошибке.
+    """
+    try:
+        user = await sync_to_async(_authenticate)(request)
+    except exceptions.APIException as e:
+        return _error_response(e)
+
+    try:
+        session = await UploadSession.objects.aget(pk=session_id, creator=user)
+    except UploadSession.DoesNotExist:
+        raise Http404
+
+    try:
+        chunk = await uploads.awrite_chunk(session, index, request, request.headers.get('Content-Range'))
+    except uploads.ChunkError as e:
+        logger.error(f'Upload session {session_id}: {e}')
+        return JsonResponse({'detail': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    return JsonResponse({'index': chunk.index, 'offset': chunk.offset, 'size': chunk.size})
@@ -0,0 +1,101 @@
+"""
+Аутентификация по токену и Basic с кэшированием проверенных учётных данных (AUTH_CACHE_TIMEOUT).
+
+Без кэша каждый запрос с токеном выполняет запрос Token JOIN User, а Basic считает PBKDF2
+от пароля, что занимает десятки миллисекунд процессора. Здесь результат проверки хранится
+в кэше приложения (MYCLOUD_CACHE), и повторные запросы не обращаются к базе. Кэш сбрасывается
+при выходе, удалении токена, изменении и удалении пользователя (mycloud.signals), а если
+сигнал не дошёл до другого процесса с локальным кэшем, запись устаревает через AUTH_CACHE_TIMEOUT.
+Поэтому по умолчанию кэш аутентификации включён только с общим кэшем между процессами.
+
+Для Basic в кэше хранится не пароль, а HMAC от него на SECRET_KEY. Запись сверяется только
+с самой собой, без обращения к базе, поэтому после смены пароля старый продолжает приниматься,
+пока запись не удалит сигнал post_save пользователя: сразу при общем кэше и не позже
+AUTH_CACHE_TIMEOUT при локальном кэше в других процессах. Неверные пароли не кэшируются
+и по-прежнему проверяются полным PBKDF2.
+"""
+
+import hashlib
+
+from django.conf import settings
+from django.utils.crypto import constant_time_compare, salted_hmac
+from rest_framework.authentication import BasicAuthentication, TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+from .cache import get_cache
+
+AUTH_TOKEN_KEY = 'auth-token:{0}'
+AUTH_BASIC_KEY = 'auth-basic:{0}'
+
+
+def _token_key(key):
+    # Сам токен не попадает в ключи кэша
+    return AUTH_TOKEN_KEY.format(hashlib.sha256(key.encode()).hexdigest())
+
+
+def _basic_key(username):
+    return AUTH_BASIC_KEY.format(hashlib.sha256(username.encode()).hexdigest())
+
+
+def _password_verifier(user, password):
+    return salted_hmac('mycloud.authentication.basic', f'{user.password}:{password}', algorithm='sha256').hexdigest()
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    TokenAuthentication, хранящая токен вместе с пользователем в кэше.
+    """
+
+    def authenticate_credentials(self, key):
+        if not settings.AUTH_CACHE_TIMEOUT:
+            return super().authenticate_credentials(key)
+        cache = get_cache()
+        cache_key = _token_key(key)
+        token = cache.get(cache_key)
+        if token is not None:
+            return token.user, token
+        user, token = super().authenticate_credentials(key)
+        cache.set(cache_key, token, settings.AUTH_CACHE_TIMEOUT)
+        return user, token
+
+
+class CachedBasicAuthentication(BasicAuthentication):
+    """
+    BasicAuthentication, которая после успешной проверки пароля запоминает её результат.
+    """
+
+    def authenticate_credentials(self, userid, password, request=None):
+        if not settings.AUTH_CACHE_TIMEOUT:
+            return super().authenticate_credentials(userid, password, request)
+        cache = get_cache()
+        cache_key = _basic_key(userid)
+        cached = cache.get(cache_key)
+        if cached is not None:
+            user, verifier = cached
+            if constant_time_compare(verifier, _password_verifier(user, password)):
+                return user, None
+        user, auth = super().authenticate_credentials(userid, password, request)
+        cache.set(cache_key, (user, _password_verifier(user, password)), settings.AUTH_CACHE_TIMEOUT)
+        return user, auth
+
+
+def invalidate_token(key):
+    """
+    Удаляет токен из кэша аутентификации.
+
+    Args:
+        key (str): ключ токена.
+    """
+    get_cache().delete(_token_key(key))
+
+
+def invalidate_user_auth(user):
+    """
+    Удаляет из кэша аутентификации токен и проверенный пароль Basic пользователя.
+
+    Args:
+        user (User): объект пользователя.
+    """
+    keys = [_basic_key(user.get_username())]
+    keys.extend(_token_key(key) for key in Token.objects.filter(user_id=user.pk).values_list('key', flat=True))
+    get_cache().delete_many(keys)
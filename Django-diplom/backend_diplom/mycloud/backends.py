@@ -0,0 +1,405 @@
+"""
+Хранилища содержимого файлов, подключаемые через настройку STORAGES['default'].
+
+Приложение обращается к содержимому только через default_storage, поэтому файлы могут лежать
+на локальном диске (LocalStorage, MEDIA_ROOT) или в S3-совместимом хранилище (S3Storage: AWS S3,
+MinIO, Ceph). Во втором случае серверы приложения не хранят состояния на диске и масштабируются
+горизонтально. Кроме API django.core.files.storage.Storage оба хранилища реализуют:
+
+- stat(name): размер и время изменения одним запросом;
+- move(old, new): перенос содержимого без передачи через приложение, существующий файл new
+  заменяется одной операцией (rename на диске, запись объекта в S3);
+- delete_prefix(prefix): удаление всех файлов с префиксом (каталога пользователя);
+- iter_files(after, exclude): обход файлов в порядке сортировки с продолжением после имени;
+- download_url(name, file_name, content_type, content_encoding): прямая ссылка на скачивание или None;
+- create_upload / write_upload_part / complete_upload / abort_upload: загрузка частями.
+"""
+
+import os
+import io
+import shutil
+import logging
+import tempfile
+from collections import namedtuple
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.base import File
+from django.core.files.move import file_move_safe
+from django.core.files.storage import FileSystemStorage, Storage, default_storage
+from django.utils.deconstruct import deconstructible
+from django.utils.functional import cached_property
+
+from .metrics import count_storage, metered
+
+logger = logging.getLogger('mycloud')
+
+COPY_BLOCK_SIZE = 64 * 1024
+
+FileStat = namedtuple('FileStat', ('st_size', 'st_mtime'))
+
+
+def local_path(name, storage=None):
+    """
+    Возвращает путь к файлу на локальном диске или None, если хранилище не локальное.
+
+    Args:
+        name (str): имя файла в хранилище.
+        storage (Storage | None): хранилище, по умолчанию default_storage.
+
+    Returns:
+        str | None: абсолютный путь к файлу.
+    """
+    try:
+        return (storage or default_storage).path(name)
+    except NotImplementedError:
+        return None
+
+
+def _sorted_entries(path):
+    try:
+        with os.scandir(path) as entries:
+            return sorted(entries, key=lambda entry: entry.name)
+    except FileNotFoundError:
+        return []
+
+
+def iter_media_files(root, after=None, exclude=()):
+    """
+    Обходит файлы в каталоге в глубину в порядке сортировки путей.
+
+    В памяти держатся только списки каталогов на текущем пути обхода. Порядок обхода совпадает
+    с порядком сравнения путей по компонентам, поэтому обход можно продолжить с любого файла.
+
+    Args:
+        root (str): корневой каталог.
+        after (str | None): путь относительно root, после которого продолжить обход.
+        exclude (iterable): имена каталогов верхнего уровня, которые нужно пропустить.
+
+    Yields:
+        tuple: (путь относительно root через '/', os.DirEntry).
+    """
+    after = tuple(after.split('/')) if after else ()
+    stack = [((), iter(_sorted_entries(root)))]
+    while stack:
+        parts, entries = stack[-1]
+        entry = next(entries, None)
+        if entry is None:
+            stack.pop()
+            continue
+        path = parts + (entry.name,)
+        if entry.is_dir(follow_symlinks=False):
+            # Каталог целиком до точки продолжения уже обработан
+            if (parts or entry.name not in exclude) and path >= after[:len(path)]:
+                stack.append((path, iter(_sorted_entries(entry.path))))
+        elif entry.is_file(follow_symlinks=False) and path > after:
+            yield '/'.join(path), entry
+
+
+@deconstructible(path='mycloud.backends.LocalStorage')
+class LocalStorage(FileSystemStorage):
+    """
+    Хранилище на локальном диске в MEDIA_ROOT.
+
+    Загрузка частями пишет части по смещениям в один заранее выделенный файл,
+    скачивание отдаётся приложением или фронт-прокси (DOWNLOAD_BACKEND).
+    """
+    min_upload_part_size = 0
+
+    def stat(self, name):
+        stat = os.stat(self.path(name))
+        return FileStat(stat.st_size, stat.st_mtime)
+
+    def move(self, old_name, new_name):
+        destination = self.path(new_name)
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+        file_move_safe(self.path(old_name), destination, allow_overwrite=True)
+
+    def delete_prefix(self, prefix):
+        shutil.rmtree(self.path(prefix), ignore_errors=True)
+
+    def iter_files(self, after=None, exclude=()):
+        for name, entry in iter_media_files(self.location, after, exclude):
+            yield name, entry.stat().st_mtime
+
+    def download_url(self, name, file_name, content_type, content_encoding=''):
+        return None
+
+    def create_upload(self, name, size):
+        path = self.path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as file:
+            file.truncate(size)
+        return ''
+
+    def _open(self, name, mode='rb'):
+        return File(metered(open(self.path(name), mode)), name)
+
+    def _save(self, name, content):
+        name = super()._save(name, content)
+        count_storage(written=content.size if hasattr(content, 'temporary_file_path') else self.size(name))
+        return name
+
+    def write_upload_part(self, name, upload_id, index, offset, stream):
+        with open(self.path(name), 'r+b') as file:
+            file.seek(offset)
+            shutil.copyfileobj(stream, file, COPY_BLOCK_SIZE)
+            count_storage(written=file.tell() - offset)
+        return ''
+
+    def complete_upload(self, name, upload_id, parts):
+        # Части уже лежат на своих местах в файле
+        pass
+
+    def abort_upload(self, name, upload_id):
+        self.delete(name)
+
+
+class S3ObjectReader(io.RawIOBase):
+    """
+    Файлоподобный объект для чтения объекта S3 с произвольной позиции.
+
+    Объект читается одним потоковым GET от текущей позиции до конца, seek() закрывает
+    поток, и следующее чтение начинает новый запрос с заголовком Range.
+    """
+
+    def __init__(self, storage, key):
+        super().__init__()
+        self._storage = storage
+        self._key = key
+        self._position = 0
+        self._body = None
+        self._size = None
+
+    @property
+    def size(self):
+        if self._size is None:
+            self._size = self._storage._head(self._key)['ContentLength']
+        return self._size
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence == io.SEEK_END:
+            offset += self.size
+        if offset != self._position:
+            self._close_body()
+            self._position = offset
+        return self._position
+
+    def readinto(self, buffer):
+        if self._body is None:
+            if self._size is not None and self._position >= self._size:
+                return 0
+            try:
+                response = self._storage.client.get_object(
+                    Bucket=self._storage.bucket, Key=self._key, Range=f'bytes={self._position}-'
+                )
+            except self._storage.client.exceptions.ClientError as e:
+                code = e.response['Error']['Code']
+                if code == 'InvalidRange':
+                    return 0
+                if code == 'NoSuchKey':
+                    raise FileNotFoundError(self._key)
+                raise
+            self._body = response['Body']
+        data = self._body.read(len(buffer))
+        buffer[:len(data)] = data
+        self._position += len(data)
+        count_storage(read=len(data))
+        return len(data)
+
+    def _close_body(self):
+        if self._body is not None:
+            self._body.close()
+            self._body = None
+
+    def close(self):
+        self._close_body()
+        super().close()
+
+
+@deconstructible(path='mycloud.backends.S3Storage')
+class S3Storage(Storage):
+    """
+    Хранилище в S3-совместимом сервисе (AWS S3, MinIO) на основе boto3.
+
+    Загрузка частями использует multipart upload: каждая часть сессии становится частью
+    объекта, сборка выполняется на стороне хранилища. Скачивание отдаётся перенаправлением
+    на подписанную ссылку (S3_PRESIGNED_DOWNLOADS), поэтому байты не проходят через приложение.
+    """
+    # Минимальный размер части multipart upload, кроме последней
+    min_upload_part_size = 5 * 1024 * 1024
+
+    def __init__(self, bucket=None, prefix=None, endpoint_url=None, region_name=None,
+                 access_key=None, secret_key=None, presigned_downloads=None, presigned_expires=None):
+        self.bucket = bucket or settings.S3_BUCKET
+        if not self.bucket:
+            raise ImproperlyConfigured('S3_BUCKET is required for S3Storage')
+        prefix = settings.S3_PREFIX if prefix is None else prefix
+        self.prefix = prefix.strip('/') + '/' if prefix.strip('/') else ''
+        self.endpoint_url = endpoint_url or settings.S3_ENDPOINT_URL or None
+        self.region_name = region_name or settings.S3_REGION or None
+        self.access_key = access_key or settings.S3_ACCESS_KEY_ID or None
+        self.secret_key = secret_key or settings.S3_SECRET_ACCESS_KEY or None
+        self.presigned_downloads = settings.S3_PRESIGNED_DOWNLOADS if presigned_downloads is None \
+            else presigned_downloads
+        self.presigned_expires = presigned_expires or settings.S3_PRESIGNED_EXPIRES
+
+    @cached_property
+    def client(self):
+        try:
+            import boto3
+            from botocore.config import Config
+        except ImportError:
+            raise ImproperlyConfigured('S3Storage requires boto3: pip install boto3')
+        return boto3.client(
+            's3',
+            endpoint_url=self.endpoint_url,
+            region_name=self.region_name,
+            aws_access_key_id=self.access_key,
+            aws_secret_access_key=self.secret_key,
+            config=Config(signature_version='s3v4', retries={'mode': 'standard'}),
+        )
+
+    def _key(self, name):
+        return self.prefix + name.replace('\\', '/').lstrip('/')
+
+    def _name(self, key):
+        return key[len(self.prefix):]
+
+    def _head(self, key):
+        try:
+            return self.client.head_object(Bucket=self.bucket, Key=key)
+        except self.client.exceptions.ClientError as e:
+            if e.response['Error']['Code'] in ('404', 'NoSuchKey', 'NotFound'):
+                raise FileNotFoundError(key)
+            raise
+
+    def _open(self, name, mode='rb'):
+        if 'r' not in mode or '+' in mode:
+            raise ValueError('S3Storage files can only be opened for reading')
+        return File(S3ObjectReader(self, self._key(name)), name)
+
+    def _save(self, name, content):
+        if hasattr(content, 'seekable') and content.seekable():
+            content.seek(0)
+        # upload_fileobj сам переходит на multipart upload для больших файлов
+        self.client.upload_fileobj(metered(content, written=True), self.bucket, self._key(name))
+        return name
+
+    def delete(self, name):
+        self.client.delete_object(Bucket=self.bucket, Key=self._key(name))
+
+    def exists(self, name):
+        try:
+            self._head(self._key(name))
+        except FileNotFoundError:
+            return False
+        return True
+
+    def size(self, name):
+        return self._head(self._key(name))['ContentLength']
+
+    def stat(self, name):
+        head = self._head(self._key(name))
+        return FileStat(head['ContentLength'], head['LastModified'].timestamp())
+
+    def get_modified_time(self, name):
+        return self._head(self._key(name))['LastModified']
+
+    def listdir(self, path):
+        prefix = self._key(path).rstrip('/') + '/' if path.strip('/') else self.prefix
+        directories, files = [], []
+        paginator = self.client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=prefix, Delimiter='/'):
+            directories.extend(item['Prefix'][len(prefix):].rstrip('/') for item in page.get('CommonPrefixes', ()))
+            files.extend(item['Key'][len(prefix):] for item in page.get('Contents', ()))
+        return directories, files
+
+    def url(self, name):
+        return self.client.generate_presigned_url(
+            'get_object', Params={'Bucket': self.bucket, 'Key': self._key(name)}, ExpiresIn=self.presigned_expires
+        )
+
+    def move(self, old_name, new_name):
+        # Управляемое копирование само делит большие объекты на части (UploadPartCopy)
+        self.client.copy({'Bucket': self.bucket, 'Key': self._key(old_name)}, self.bucket, self._key(new_name))
+        self.delete(old_name)
+
+    def delete_prefix(self, prefix):
+        paginator = self.client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self._key(prefix).rstrip('/') + '/'):
+            objects = [{'Key': item['Key']} for item in page.get('Contents', ())]
+            if objects:
+                self.client.delete_objects(Bucket=self.bucket, Delete={'Objects': objects, 'Quiet': True})
+
+    def iter_files(self, after=None, exclude=()):
+        options = {'Bucket': self.bucket, 'Prefix': self.prefix}
+        if after:
+            options['StartAfter'] = self._key(after)
+        paginator = self.client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(**options):
+            for item in page.get('Contents', ()):
+                name = self._name(item['Key'])
+                if name.partition('/')[0] in exclude:
+                    continue
+                yield name, item['LastModified'].timestamp()
+
+    def download_url(self, name, file_name, content_type, content_encoding=''):
+        if not self.presigned_downloads:
+            return None
+        params = {
+            'Bucket': self.bucket,
+            'Key': self._key(name),
+            'ResponseContentDisposition': f"attachment; filename*=UTF-8''{quote(file_name)}",
+            'ResponseContentType': content_type,
+        }
+        if content_encoding:
+            params['ResponseContentEncoding'] = content_encoding
+        return self.client.generate_presigned_url('get_object', Params=params, ExpiresIn=self.presigned_expires)
+
+    def create_upload(self, name, size):
+        return self.client.create_multipart_upload(Bucket=self.bucket, Key=self._key(name))['UploadId']
+
+    def write_upload_part(self, name, upload_id, index, offset, stream):
+        # Для подписи запроса нужна длина тела, поэтому часть сначала собирается во временный файл
+        with tempfile.SpooledTemporaryFile(max_size=COPY_BLOCK_SIZE * 16) as buffer:
+            shutil.copyfileobj(stream, buffer, COPY_BLOCK_SIZE)
+            length = buffer.tell()
+            count_storage(written=length)
+            buffer.seek(0)
+            response = self.client.upload_part(
+                Bucket=self.bucket, Key=self._key(name), UploadId=upload_id,
+                PartNumber=index + 1, Body=buffer, ContentLength=length,
+            )
+        return response['ETag']
+
+    def complete_upload(self, name, upload_id, parts):
+        try:
+            self.client.complete_multipart_upload(
+                Bucket=self.bucket, Key=self._key(name), UploadId=upload_id,
+                MultipartUpload={'Parts': [{'PartNumber': index + 1, 'ETag': etag} for index, etag in parts]},
+            )
+        except self.client.exceptions.NoSuchUpload:
+            # Повтор задачи сборки: объект уже собран прошлой попыткой
+            if not self.exists(name):
+                raise
+
+    def abort_upload(self, name, upload_id):
+        if upload_id:
+            try:
+                self.client.abort_multipart_upload(Bucket=self.bucket, Key=self._key(name), UploadId=upload_id)
+            except self.client.exceptions.NoSuchUpload:
+                pass
+        self.delete(name)
@@ -0,0 +1,312 @@
+"""
+Общие функции команд нагрузочного тестирования (bench_serializers, bench_load, bench_connections).
+
+Результаты команд сохраняются в JSON вместе с коммитом и окружением запуска. Отчёт можно сравнить
+с отчётом другого коммита (--baseline): метрики времени, выросшие больше порога, и пропускная
+способность, упавшая больше порога, считаются регрессиями.
+"""
+
+import os
+import sys
+import json
+import time
+import platform
+import resource
+import statistics
+import subprocess
+import threading
+from datetime import datetime, timezone
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+SIZE_UNITS = {'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}
+# Метрики отчёта: для времени рост - регрессия, для пропускной способности - падение
+LATENCY_METRICS = ('p50', 'p95', 'p99', 'mean')
+THROUGHPUT_METRICS = ('per_second', 'bytes_per_second')
+
+
+def percentile(values, percent):
+    """
+    Возвращает перцентиль методом ближайшего ранга или None для пустого списка.
+    """
+    if not values:
+        return None
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, round(percent / 100 * len(values)) - 1))
+    return values[index]
+
+
+def parse_size(value):
+    """
+    Переводит размер вида 512, 64K, 10M, 2G в байты.
+
+    Raises:
+        ValueError: если размер записан неверно.
+    """
+    value = value.strip().upper().removesuffix('B')
+    if value and value[-1] in SIZE_UNITS:
+        return int(float(value[:-1]) * SIZE_UNITS[value[-1]])
+    return int(value)
+
+
+def summarize(durations, elapsed=None, items=0, size=0):
+    """
+    Сводка измерений: перцентили времени операции и пропускная способность.
+
+    Args:
+        durations (list): длительности операций, секунды.
+        elapsed (float): общее время серии; если не задано, сумма длительностей.
+        items (int): количество обработанных объектов (строк, файлов) за серию.
+        size (int): количество переданных байт за серию.
+
+    Returns:
+        dict: count, p50, p95, p99, mean, max, секунды; per_second - операций или объектов в секунду;
+        bytes_per_second при size.
+    """
+    elapsed = elapsed if elapsed is not None else sum(durations)
+    result = {
+        'count': len(durations),
+        'p50': percentile(durations, 50),
+        'p95': percentile(durations, 95),
+        'p99': percentile(durations, 99),
+        'mean': statistics.fmean(durations) if durations else None,
+        'max': max(durations, default=None),
+        'per_second': (items or len(durations)) / elapsed if elapsed else None,
+    }
+    if size:
+        result['bytes_per_second'] = size / elapsed if elapsed else None
+    return result
+
+
+def measure(func, repeat, warmup=1):
+    """
+    Вызывает func warmup раз без учёта и repeat раз с замером.
+
+    Returns:
+        list: длительности вызовов, секунды.
+    """
+    for _ in range(warmup):
+        func()
+    durations = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        durations.append(time.perf_counter() - started)
+    return durations
+
+
+def own_peak_rss():
+    """
+    Возвращает пиковый RSS текущего процесса, байт.
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux возвращает килобайты, macOS - байты
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def _process_tree(pid):
+    pids = [pid]
+    for task in os.listdir(f'/proc/{pid}/task'):
+        try:
+            with open(f'/proc/{pid}/task/{task}/children') as file:
+                children = file.read().split()
+        except OSError:
+            continue
+        for child in children:
+            pids.extend(_process_tree(int(child)))
+    return pids
+
+
+def tree_rss(pid):
+    """
+    Возвращает суммарный текущий RSS процесса pid и его потомков (воркеров gunicorn), байт.
+    Работает только в Linux; без /proc возвращает None.
+    """
+    total = 0
+    try:
+        pids = _process_tree(pid)
+    except OSError:
+        return None
+    for process in pids:
+        try:
+            with open(f'/proc/{process}/status') as file:
+                for line in file:
+                    if line.startswith('VmRSS:'):
+                        total += int(line.split()[1]) * 1024
+                        break
+        except OSError:
+            continue
+    return total
+
+
+class RssSampler:
+    """
+    Фоновый поток, снимающий RSS дерева процессов сервера и запоминающий пик.
+
+    Args:
+        pid (int): PID процесса сервера (мастер gunicorn или runserver).
+        interval (float): период опроса, секунды.
+    """
+
+    def __init__(self, pid, interval=0.2):
+        self.pid = pid
+        self.interval = interval
+        self.peak = None
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='mycloud-bench-rss', daemon=True)
+
+    def _run(self):
+        while True:
+            rss = tree_rss(self.pid)
+            if rss is not None:
+                self.peak = max(self.peak or 0, rss)
+            if self._stopped.wait(self.interval):
+                return
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stopped.set()
+        self._thread.join()
+
+
+def git_commit():
+    """
+    Возвращает коммит рабочей копии или None вне git.
+    """
+    try:
+        result = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR, capture_output=True, text=True, timeout=5
+        )
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return result.stdout.strip() or None
+
+
+def environment():
+    """
+    Сведения о запуске для сравнения отчётов: коммит, версии, база данных и хранилище.
+    """
+    return {
+        'commit': git_commit(),
+        'time': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'host': platform.node(),
+        'cpu_count': os.cpu_count(),
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'database': connection.vendor,
+        'storage': settings.STORAGE_BACKEND,
+        'compression': settings.FILE_COMPRESSION,
+        'deduplication': settings.FILE_DEDUPLICATION,
+    }
+
+
+def save_report(path, report):
+    """
+    Сохраняет отчёт в JSON, создавая каталог при необходимости.
+    """
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as file:
+        json.dump(report, file, indent=2, ensure_ascii=False)
+
+
+def compare_reports(results, baseline, threshold):
+    """
+    Сравнивает результаты с результатами базового отчёта.
+
+    Args:
+        results (dict): {имя замера: сводка summarize}.
+        baseline (dict): results из базового отчёта.
+        threshold (float): допустимое относительное ухудшение, например 0.1 - 10%.
+
+    Returns:
+        list: (имя замера, метрика, базовое значение, новое значение, относительное изменение)
+        для метрик, ухудшившихся больше порога.
+    """
+    regressions = []
+    for name, summary in results.items():
+        previous = baseline.get(name)
+        if not isinstance(previous, dict):
+            continue
+        for metric in LATENCY_METRICS + THROUGHPUT_METRICS:
+            old, new = previous.get(metric), summary.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            worse = change > threshold if metric in LATENCY_METRICS else change < -threshold
+            if worse:
+                regressions.append((name, metric, old, new, change))
+    return regressions
+
+
+def load_baseline(path):
+    """
+    Читает results базового отчёта.
+    """
+    with open(path, encoding='utf-8') as file:
+        return json.load(file).get('results', {})
+
+
+def format_summary(name, summary):
+    """
+    Форматирует сводку одной строкой: перцентили в миллисекундах и пропускная способность.
+    """
+    parts = [f'{name:<28}', f'n={summary["count"]:<6}']
+    for metric in ('p50', 'p95', 'p99'):
+        value = summary.get(metric)
+        parts.append(f'{metric}={value * 1000:9.2f}ms' if value is not None else f'{metric}=        -')
+    if summary.get('per_second') is not None:
+        parts.append(f'{summary["per_second"]:10.1f}/s')
+    if summary.get('bytes_per_second') is not None:
+        parts.append(f'{summary["bytes_per_second"] / SIZE_UNITS["M"]:9.1f} MiB/s')
+    return ' '.join(parts)
+
+
+class BenchCommand(BaseCommand):
+    """
+    Основа команд замеров: параметры --output, --baseline, --threshold и вывод отчёта.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', help='Файл для сохранения отчёта в JSON')
+        parser.add_argument('--baseline', help='Отчёт другого коммита для сравнения')
+        parser.add_argument(
+            '--threshold', type=float, default=0.1, help='Допустимое ухудшение метрик относительно --baseline'
+        )
+
+    def finish(self, name, options, parameters, results, **extra):
+        """
+        Выводит сводки, сохраняет отчёт и сравнивает его с базовым.
+
+        Raises:
+            CommandError: если при --baseline найдены регрессии.
+        """
+        report = {
+            'benchmark': name,
+            'environment': environment(),
+            'parameters': parameters,
+            'results': results,
+            **extra,
+        }
+        for key, summary in results.items():
+            self.stdout.write(format_summary(key, summary))
+        for key, value in extra.items():
+            self.stdout.write(f'{key}: {value}')
+        if options['output']:
+            save_report(options['output'], report)
+            self.stdout.write(f'Report saved to {options["output"]}')
+        if options['baseline']:
+            regressions = compare_reports(results, load_baseline(options['baseline']), options['threshold'])
+            for key, metric, old, new, change in regressions:
+                self.stderr.write(f'{key} {metric}: {old:.6g} -> {new:.6g} ({change:+.1%})')
+            if regressions:
+                raise CommandError(f'{len(regressions)} metrics regressed by more than {options["threshold"]:.0%}')
+            self.stdout.write(self.style.SUCCESS('No regressions against baseline'))
+        return report
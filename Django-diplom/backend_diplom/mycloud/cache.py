@@ -0,0 +1,113 @@
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import ValidationError
+
+from .models import File
+
+FILE_INFO_KEY = 'file-info:{0}'
+DELETE_BATCH_SIZE = 1000
+
+
+def get_cache():
+    """
+    Функция для получения кэша приложения (алиас из настройки MYCLOUD_CACHE)
+    """
+    return caches[settings.MYCLOUD_CACHE]
+
+
+def _file_info_key(hash):
+    try:
+        return FILE_INFO_KEY.format(uuid.UUID(hash))
+    except ValueError:
+        return None
+
+
+def _file_info(file_obj):
+    return {
+        'id': file_obj.id,
+        'path': str(file_obj.file),
+        'name': str(file_obj.name),
+        'size': file_obj.size,
+        'encoding': file_obj.encoding,
+        # Хэш содержимого - сильный валидатор; у старых файлов без хэша ETag остаётся по hash ссылки
+        'etag': file_obj.digest or str(file_obj.hash),
+    }
+
+
+def _file_info_queryset():
+    return File.objects.only('id', 'file', 'name', 'size', 'encoding', 'hash', 'digest')
+
+
+def get_file_info(hash):
+    """
+    Возвращает сведения о файле по его hash, обращаясь к базе только при промахе кэша.
+
+    Args:
+        hash (str): hash файла из ссылки на скачивание.
+
+    Returns:
+        dict | None: id, path (имя в хранилище), name, size, encoding и etag файла или None, если файла нет.
+    """
+    key = _file_info_key(hash)
+    if key is None:
+        return None
+
+    cache = get_cache()
+    info = cache.get(key)
+    if info is None:
+        try:
+            file_obj = _file_info_queryset().get(hash=hash)
+        except (File.DoesNotExist, ValidationError):
+            return None
+        info = _file_info(file_obj)
+        cache.set(key, info, settings.FILE_INFO_CACHE_TIMEOUT)
+    return info
+
+
+async def aget_file_info(hash):
+    """
+    Асинхронный вариант get_file_info для ASGI-представлений.
+    """
+    key = _file_info_key(hash)
+    if key is None:
+        return None
+
+    cache = get_cache()
+    info = await cache.aget(key)
+    if info is None:
+        try:
+            file_obj = await _file_info_queryset().aget(hash=hash)
+        except (File.DoesNotExist, ValidationError):
+            return None
+        info = _file_info(file_obj)
+        await cache.aset(key, info, settings.FILE_INFO_CACHE_TIMEOUT)
+    return info
+
+
+def invalidate_file_info(*hashes):
+    """
+    Удаляет из кэша сведения о файлах после переименования или удаления.
+
+    Args:
+        hashes (str | UUID): hash файлов.
+    """
+    get_cache().delete_many([FILE_INFO_KEY.format(hash) for hash in hashes])
+
+
+def invalidate_user_files(user):
+    """
+    Удаляет из кэша сведения обо всех файлах пользователя, пачками.
+
+    Args:
+        user (User): объект пользователя.
+    """
+    batch = []
+    for hash in File.objects.filter(creator=user).values_list('hash', flat=True).iterator():
+        batch.append(hash)
+        if len(batch) >= DELETE_BATCH_SIZE:
+            invalidate_file_info(*batch)
+            batch = []
+    if batch:
+        invalidate_file_info(*batch)
@@ -0,0 +1,230 @@
+"""
+Прозрачное сжатие содержимого файлов в хранилище (FILE_COMPRESSION).
+
+При сохранении начало файла пробно сжимается, и если выигрыш достаточный, содержимое пишется
+в хранилище сжатым потоково, блоками, не держа файл в памяти целиком. Хэш, размер и квоты
+считаются по исходному содержимому, поле stored_size хранит размер в хранилище.
+"""
+
+import io
+import zlib
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.base import File
+from django.core.files.storage import default_storage
+
+GZIP = 'gzip'
+ZSTD = 'zstd'
+ENCODINGS = (GZIP, ZSTD)
+
+READ_BLOCK_SIZE = 64 * 1024
+
+
+def _zstandard():
+    try:
+        import zstandard
+    except ImportError:
+        raise ImproperlyConfigured('zstd compression requires zstandard: pip install zstandard')
+    return zstandard
+
+
+def compressor(encoding):
+    """
+    Возвращает объект потокового сжатия с методами compress() и flush().
+    """
+    if encoding == GZIP:
+        # wbits 31 - формат gzip с заголовком и CRC, который понимают браузеры
+        level = settings.FILE_COMPRESSION_LEVEL
+        return zlib.compressobj(6 if level is None else level, zlib.DEFLATED, 31)
+    if encoding == ZSTD:
+        level = settings.FILE_COMPRESSION_LEVEL
+        return _zstandard().ZstdCompressor(level=3 if level is None else level).compressobj()
+    raise ValueError(f'Unknown encoding: {encoding}')
+
+
+def decompressor(encoding):
+    """
+    Возвращает объект потоковой распаковки с методом decompress().
+    """
+    if encoding == GZIP:
+        return zlib.decompressobj(31)
+    if encoding == ZSTD:
+        return _zstandard().ZstdDecompressor().decompressobj()
+    raise ValueError(f'Unknown encoding: {encoding}')
+
+
+def _read_sample(source):
+    if isinstance(source, str):
+        with default_storage.open(source, 'rb') as file:
+            return file.read(settings.FILE_COMPRESSION_PROBE_SIZE)
+    source.seek(0)
+    sample = source.read(settings.FILE_COMPRESSION_PROBE_SIZE)
+    source.seek(0)
+    return sample
+
+
+def choose_encoding(source, size):
+    """
+    Решает, сжимать ли содержимое: пробно сжимает начало файла и сравнивает размеры.
+
+    Args:
+        source (str | UploadedFile): имя файла в хранилище или загруженный файл.
+        size (int): размер содержимого, байт.
+
+    Returns:
+        str: кодировка сжатия или пустая строка, если сжимать не нужно.
+    """
+    encoding = settings.FILE_COMPRESSION
+    if not encoding or size < settings.FILE_COMPRESSION_MIN_SIZE:
+        return ''
+    sample = _read_sample(source)
+    if not sample:
+        return ''
+    packer = compressor(encoding)
+    compressed = len(packer.compress(sample)) + len(packer.flush())
+    # Уже сжатые форматы (архивы, видео, изображения) почти не уменьшаются
+    return encoding if compressed <= len(sample) * settings.FILE_COMPRESSION_MAX_RATIO else ''
+
+
+class CompressingReader(io.RawIOBase):
+    """
+    Файлоподобный объект, отдающий сжатое содержимое исходного потока по мере чтения.
+
+    После чтения до конца в written лежит размер сжатых данных.
+    """
+
+    def __init__(self, source, encoding):
+        super().__init__()
+        self._source = source
+        self._packer = compressor(encoding)
+        self._buffer = b''
+        self._finished = False
+        self.written = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while not self._buffer and not self._finished:
+            data = self._source.read(READ_BLOCK_SIZE)
+            if data:
+                self._buffer = self._packer.compress(data)
+            else:
+                self._buffer = self._packer.flush()
+                self._finished = True
+        size = min(len(buffer), len(self._buffer))
+        buffer[:size] = self._buffer[:size]
+        self._buffer = self._buffer[size:]
+        self.written += size
+        return size
+
+
+def iter_decompressed(file, encoding, chunk_size=READ_BLOCK_SIZE):
+    """
+    Генератор распакованного содержимого блоками не больше chunk_size.
+
+    Размер блока ограничивается и на выходе, поэтому сильно сжатые данные
+    (гигабайт нулей) не раскрываются в память целиком.
+
+    Args:
+        file: файлоподобный объект со сжатым содержимым.
+        encoding (str): кодировка сжатия.
+        chunk_size (int): размер блока чтения и распаковки.
+
+    Yields:
+        bytes: очередной блок исходного содержимого.
+    """
+    if encoding == ZSTD:
+        blocks = _zstandard().ZstdDecompressor().read_to_iter(file, read_size=chunk_size, write_size=chunk_size)
+        yield from (block for block in blocks if block)
+        return
+    unpacker = decompressor(encoding)
+    for block in iter(lambda: file.read(chunk_size), b''):
+        while block:
+            data = unpacker.decompress(block, chunk_size)
+            block = unpacker.unconsumed_tail
+            if data:
+                yield data
+    data = unpacker.flush()
+    if data:
+        yield data
+
+
+class DecompressingReader(io.RawIOBase):
+    """
+    Файлоподобный объект, отдающий распакованное содержимое сжатого потока по мере чтения.
+    """
+
+    def __init__(self, source, encoding):
+        super().__init__()
+        self._source = source
+        self._blocks = iter_decompressed(source, encoding)
+        self._buffer = b''
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        if not self._buffer:
+            self._buffer = next(self._blocks, b'')
+        size = min(len(buffer), len(self._buffer))
+        buffer[:size] = self._buffer[:size]
+        self._buffer = self._buffer[size:]
+        return size
+
+    def close(self):
+        self._source.close()
+        super().close()
+
+
+def compressed_file(source, encoding):
+    """
+    Оборачивает источник для сохранения в хранилище сжатым.
+
+    Args:
+        source: файлоподобный объект с исходным содержимым.
+        encoding (str): кодировка сжатия.
+
+    Returns:
+        tuple: (File для Storage.save, CompressingReader для получения размера после сохранения).
+    """
+    reader = CompressingReader(source, encoding)
+    return File(io.BufferedReader(reader, READ_BLOCK_SIZE)), reader
+
+
+def open_stored(name, encoding=''):
+    """
+    Открывает файл хранилища для чтения исходного содержимого, распаковывая его при необходимости.
+
+    Args:
+        name (str): имя файла в хранилище.
+        encoding (str): кодировка сжатия файла или пустая строка.
+
+    Returns:
+        файлоподобный объект только для чтения.
+    """
+    file = default_storage.open(name, 'rb')
+    if not encoding:
+        return file
+    return io.BufferedReader(DecompressingReader(file, encoding), READ_BLOCK_SIZE)
+
+
+def accepts_encoding(request, encoding):
+    """
+    Проверяет, принимает ли клиент ответ в кодировке encoding (заголовок Accept-Encoding).
+    """
+    accepted = {}
+    for item in request.META.get('HTTP_ACCEPT_ENCODING', '').split(','):
+        coding, _, params = item.partition(';')
+        quality = 1.0
+        for param in params.split(';'):
+            key, _, value = param.strip().partition('=')
+            if key == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        accepted[coding.strip().lower()] = quality
+    quality = accepted.get(encoding, accepted.get('*', 0.0))
+    return quality > 0
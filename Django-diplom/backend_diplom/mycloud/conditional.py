@@ -0,0 +1,70 @@
+"""
+Условные GET для списков файлов и пользователей (слабые ETag).
+
+ETag списка считается до выборки и сериализации файлов из маркера изменений UserUsage.version
+(см. mycloud.usage), адреса запроса с фильтрами и курсором, пользователя и формата ответа.
+Периодическое обновление списка в интерфейсе с If-None-Match получает HTTP 304 за один запрос
+к базе. Ответ помечается Cache-Control: private, no-cache, поэтому браузер хранит его
+и перепроверяет при каждом запросе.
+"""
+
+import hashlib
+
+from django.http import HttpResponseNotModified
+from django.utils.http import parse_etags
+
+LIST_CACHE_CONTROL = 'private, no-cache'
+
+
+def list_etag(request, marker):
+    """
+    Формирует слабый ETag списка.
+
+    Args:
+        request (Request): запрос DRF после согласования формата ответа.
+        marker: маркер изменений данных списка.
+
+    Returns:
+        str: значение заголовка ETag вида W/"...".
+    """
+    source = '\n'.join((
+        str(request.user.pk), repr(marker), request.get_full_path(), str(getattr(request, 'accepted_media_type', '')),
+    ))
+    return f'W/"{hashlib.sha1(source.encode()).hexdigest()}"'
+
+
+def list_not_modified(request, etag):
+    """
+    Проверяет If-None-Match запроса списка (слабое сравнение).
+
+    Args:
+        request (Request): запрос DRF.
+        etag (str): ETag списка из list_etag.
+
+    Returns:
+        HttpResponseNotModified | None: ответ 304, если у клиента актуальный список.
+    """
+    if request.method not in ('GET', 'HEAD'):
+        return None
+    opaque = etag.removeprefix('W/')
+    etags = parse_etags(request.META.get('HTTP_IF_NONE_MATCH', ''))
+    if opaque not in (candidate.removeprefix('W/') for candidate in etags):
+        return None
+    response = HttpResponseNotModified()
+    return with_list_etag(response, etag)
+
+
+def with_list_etag(response, etag):
+    """
+    Добавляет к ответу списка ETag и Cache-Control.
+
+    Args:
+        response (HttpResponse): ответ со списком или 304.
+        etag (str): ETag списка из list_etag.
+
+    Returns:
+        HttpResponse: тот же ответ.
+    """
+    response['ETag'] = etag
+    response['Cache-Control'] = LIST_CACHE_CONTROL
+    return response
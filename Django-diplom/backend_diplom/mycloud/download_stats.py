@@ -0,0 +1,122 @@
+import atexit
+import logging
+import threading
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import Case, F, Value, When
+
+from .models import File
+from .usage import mark_files_changed
+
+logger = logging.getLogger('mycloud')
+
+FLUSH_BATCH_SIZE = 500
+
+
+class DownloadRecorder:
+    """
+    Буфер событий скачивания с отложенной пакетной записью в базу.
+
+    Скачивания накапливаются в памяти процесса: для каждого файла хранится время последнего
+    скачивания и количество новых скачиваний. Фоновый поток раз в DOWNLOAD_STATS_FLUSH_INTERVAL
+    секунд записывает их одним UPDATE на пачку файлов, несколько скачиваний одного файла
+    схлопываются в одно изменение строки. При DOWNLOAD_STATS_FLUSH_INTERVAL = 0 запись синхронная.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._thread = None
+        self._stopped = threading.Event()
+
+    def record(self, file_id, timestamp, counted=True):
+        """
+        Добавляет событие скачивания в буфер.
+
+        Args:
+            file_id (int): ID файла.
+            timestamp (int): время скачивания, секунды с начала эпохи.
+            counted (bool): увеличивать ли счётчик скачиваний (False для докачки диапазонов).
+        """
+        with self._lock:
+            last_download, count = self._pending.get(file_id, (0, 0))
+            self._pending[file_id] = (max(last_download, timestamp), count + int(counted))
+
+        if not settings.DOWNLOAD_STATS_FLUSH_INTERVAL:
+            self.flush()
+        else:
+            self._ensure_started()
+
+    async def arecord(self, file_id, timestamp, counted=True):
+        """
+        Асинхронный вариант record: при отложенной записи только кладёт событие в буфер,
+        при синхронной выполняет запись в базу вне цикла событий.
+        """
+        if settings.DOWNLOAD_STATS_FLUSH_INTERVAL:
+            self.record(file_id, timestamp, counted)
+        else:
+            await sync_to_async(self.record)(file_id, timestamp, counted)
+
+    def flush(self):
+        """
+        Записывает накопленные события в базу пачками.
+
+        Returns:
+            int: количество обновлённых файлов.
+        """
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+
+        items = list(pending.items())
+        try:
+            for start in range(0, len(items), FLUSH_BATCH_SIZE):
+                batch = items[start:start + FLUSH_BATCH_SIZE]
+                files = File.objects.filter(pk__in=[file_id for file_id, _ in batch])
+                files.update(
+                    date_download=Case(*(When(pk=file_id, then=Value(last)) for file_id, (last, _) in batch)),
+                    download_count=F('download_count') + Case(
+                        *(When(pk=file_id, then=Value(count)) for file_id, (_, count) in batch), default=Value(0)
+                    ),
+                )
+                # Дата и счётчик скачиваний видны в списке файлов, его ETag должен смениться
+                mark_files_changed(files)
+        except Exception:
+            logger.exception(f'Failed to flush {len(items)} download events')
+            self._requeue(pending)
+            return 0
+        return len(items)
+
+    def shutdown(self):
+        """
+        Останавливает фоновый поток и записывает оставшиеся события.
+        """
+        self._stopped.set()
+        self.flush()
+
+    def _requeue(self, pending):
+        with self._lock:
+            for file_id, (last_download, count) in pending.items():
+                current_last, current_count = self._pending.get(file_id, (0, 0))
+                self._pending[file_id] = (max(last_download, current_last), count + current_count)
+
+    def _ensure_started(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='download-stats', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while not self._stopped.wait(settings.DOWNLOAD_STATS_FLUSH_INTERVAL):
+            close_old_connections()
+            self.flush()
+        close_old_connections()
+
+
+download_recorder = DownloadRecorder()
+atexit.register(download_recorder.shutdown)
@@ -0,0 +1,561 @@
+import os
+import time
+import uuid
+import asyncio
+import zipfile
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.storage import default_storage
+from django.http import FileResponse, HttpResponse, HttpResponseNotModified, HttpResponseRedirect, \
+    StreamingHttpResponse
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.encoding import iri_to_uri
+from django.utils.http import http_date, parse_etags, parse_http_date_safe, quote_etag
+
+from .backends import local_path
+from .compression import accepts_encoding, iter_decompressed, open_stored
+from .metrics import count_storage, metered
+
+DOWNLOAD_CONTENT_TYPE = 'application/force-download'
+# Формат ZIP не умеет хранить даты раньше 1980 года
+ZIP_EPOCH = 315532800
+
+
+def parse_range_header(header, size):
+    """
+    Разбирает заголовок Range для файла указанного размера.
+
+    Args:
+        header (str): значение заголовка Range.
+        size (int): размер файла в байтах.
+
+    Returns:
+        list | None: список диапазонов (start, end) включительно, пустой список если ни один
+        диапазон не удовлетворим, None если заголовок некорректен и его нужно проигнорировать.
+    """
+    unit, _, spec = header.partition('=')
+    if unit.strip().lower() != 'bytes' or not spec:
+        return None
+
+    parts = spec.split(',')
+    if len(parts) > settings.DOWNLOAD_MAX_RANGES:
+        return None
+
+    ranges = []
+    for part in parts:
+        start, sep, end = part.strip().partition('-')
+        if not sep:
+            return None
+        if not start:
+            # Суффиксный диапазон: последние N байт файла
+            if not end.isdigit():
+                return None
+            length = int(end)
+            if length and size:
+                ranges.append((max(size - length, 0), size - 1))
+            continue
+        if not start.isdigit() or (end and not end.isdigit()):
+            return None
+        start = int(start)
+        if end and int(end) < start:
+            return None
+        if start < size:
+            end = min(int(end), size - 1) if end else size - 1
+            ranges.append((start, end))
+    return ranges
+
+
+def _multipart_part_header(boundary, content_type, start, end, size):
+    return (
+        f'--{boundary}\r\n'
+        f'Content-Type: {content_type}\r\n'
+        f'Content-Range: bytes {start}-{end}/{size}\r\n\r\n'
+    ).encode()
+
+
+def _multipart_closing(boundary):
+    return f'--{boundary}--\r\n'.encode()
+
+
+class FileBody:
+    """
+    Источник тела ответа: файл на диске, читаемый блоками синхронно.
+
+    Полный ответ отдаётся через FileResponse, что позволяет WSGI-серверу использовать sendfile.
+    """
+
+    def __init__(self, path, chunk_size=None):
+        self.path = path
+        self.chunk_size = chunk_size or settings.DOWNLOAD_CHUNK_SIZE
+
+    def open(self):
+        return metered(open(self.path, 'rb'))
+
+    def stat(self):
+        return os.stat(self.path)
+
+    def full_response(self, size, content_type):
+        # Файл передаётся без прокси учёта, чтобы сервер мог использовать sendfile
+        response = FileResponse(open(self.path, 'rb'), content_type=content_type)
+        response.block_size = self.chunk_size
+        count_storage(read=size)
+        return response
+
+    def iter_range(self, start, end):
+        """
+        Генератор, читающий файл блоками в диапазоне [start, end].
+        """
+        with self.open() as file:
+            file.seek(start)
+            remaining = end - start + 1
+            while remaining > 0:
+                data = file.read(min(self.chunk_size, remaining))
+                if not data:
+                    break
+                remaining -= len(data)
+                yield data
+
+    def iter_multipart(self, ranges, size, content_type, boundary):
+        """
+        Генератор тела ответа multipart/byteranges для нескольких диапазонов.
+        """
+        for start, end in ranges:
+            yield _multipart_part_header(boundary, content_type, start, end, size)
+            yield from self.iter_range(start, end)
+            yield b'\r\n'
+        yield _multipart_closing(boundary)
+
+    def iter_decoded(self, encoding):
+        """
+        Генератор распакованного содержимого сжатого файла.
+        """
+        with self.open() as file:
+            yield from iter_decompressed(file, encoding, self.chunk_size)
+
+
+class StorageFileBody(FileBody):
+    """
+    Источник тела ответа: файл в хранилище без локального пути (S3), читаемый через default_storage.
+    """
+
+    def __init__(self, name, chunk_size=None):
+        super().__init__(None, chunk_size)
+        self.name = name
+
+    def open(self):
+        return default_storage.open(self.name, 'rb')
+
+    def stat(self):
+        return default_storage.stat(self.name)
+
+    def full_response(self, size, content_type):
+        response = StreamingHttpResponse(self.iter_range(0, size - 1), content_type=content_type)
+        response['Content-Length'] = size
+        return response
+
+
+class AsyncFileBody(FileBody):
+    """
+    Источник тела ответа для ASGI: асинхронные итераторы, чтение с диска выполняется в пуле потоков,
+    поэтому медленный клиент не блокирует цикл событий.
+    """
+
+    def full_response(self, size, content_type):
+        response = StreamingHttpResponse(self.iter_range(0, size - 1), content_type=content_type)
+        response['Content-Length'] = size
+        return response
+
+    async def iter_range(self, start, end):
+        file = await asyncio.to_thread(self.open)
+        try:
+            await asyncio.to_thread(file.seek, start)
+            remaining = end - start + 1
+            while remaining > 0:
+                data = await asyncio.to_thread(file.read, min(self.chunk_size, remaining))
+                if not data:
+                    break
+                remaining -= len(data)
+                yield data
+        finally:
+            await asyncio.to_thread(file.close)
+
+    async def iter_multipart(self, ranges, size, content_type, boundary):
+        for start, end in ranges:
+            yield _multipart_part_header(boundary, content_type, start, end, size)
+            async for data in self.iter_range(start, end):
+                yield data
+            yield b'\r\n'
+        yield _multipart_closing(boundary)
+
+    async def iter_decoded(self, encoding):
+        file = await asyncio.to_thread(self.open)
+        try:
+            blocks = iter_decompressed(file, encoding, self.chunk_size)
+            while (data := await asyncio.to_thread(next, blocks, None)) is not None:
+                yield data
+        finally:
+            await asyncio.to_thread(file.close)
+
+
+class AsyncStorageFileBody(AsyncFileBody, StorageFileBody):
+    """
+    Асинхронный источник тела ответа для файла в хранилище без локального пути.
+    """
+
+
+def _if_range_passes(request, etag, last_modified):
+    """
+    Проверяет заголовок If-Range: диапазон отдаётся, только если файл не изменился.
+    """
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if not if_range:
+        return True
+    if if_range.startswith(('"', 'W/"')):
+        # If-Range допускает только сильное сравнение ETag, слабый никогда не совпадёт
+        return if_range == etag
+    return parse_http_date_safe(if_range) == last_modified
+
+
+def _conditional(request, etag, last_modified):
+    """
+    Проверяет условные заголовки (If-None-Match, If-Match, If-Modified-Since и др.).
+
+    Returns:
+        HttpResponse | None: ответ 304 или 412, None если файл нужно отдать.
+    """
+    validators = HttpResponse()
+    validators['ETag'] = etag
+    validators['Last-Modified'] = http_date(last_modified)
+    conditional = get_conditional_response(request, etag=etag, last_modified=last_modified, response=validators)
+    return None if conditional is validators else conditional
+
+
+def serve_file(request, path, file_name, etag, content_type=DOWNLOAD_CONTENT_TYPE, body=None, stat=None):
+    """
+    Формирует потоковый ответ с файлом с поддержкой Range, If-Range и условных запросов.
+
+    Файл никогда не читается в память целиком: полный ответ отдаётся через FileResponse,
+    частичные - генераторами, читающими файл блоками.
+
+    Args:
+        request (HttpRequest): HTTP запрос.
+        path (str | None): абсолютный путь к файлу на диске, если body не передан.
+        file_name (str): имя файла для заголовка Content-Disposition.
+        etag (str): значение ETag без кавычек.
+        content_type (str): MIME тип ответа.
+        body (FileBody | None): источник тела ответа, по умолчанию синхронное чтение path.
+        stat (os.stat_result | FileStat | None): заранее полученные сведения о файле.
+
+    Returns:
+        HttpResponse: 200, 206, 304, 412 или 416 ответ.
+    """
+    body = body or FileBody(path)
+    stat = stat or body.stat()
+    size = stat.st_size
+    last_modified = int(stat.st_mtime)
+    etag = quote_etag(etag)
+
+    conditional = _conditional(request, etag, last_modified)
+    if conditional is not None:
+        return conditional
+
+    range_header = request.META.get('HTTP_RANGE')
+    ranges = None
+    if range_header and _if_range_passes(request, etag, last_modified):
+        ranges = parse_range_header(range_header, size)
+
+    if ranges is None:
+        response = body.full_response(size, content_type)
+    elif not ranges:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        return response
+    elif len(ranges) == 1:
+        start, end = ranges[0]
+        response = StreamingHttpResponse(body.iter_range(start, end), status=206, content_type=content_type)
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        response['Content-Length'] = end - start + 1
+    else:
+        boundary = uuid.uuid4().hex
+        response = StreamingHttpResponse(
+            body.iter_multipart(ranges, size, content_type, boundary),
+            status=206,
+            content_type=f'multipart/byteranges; boundary={boundary}',
+        )
+        response['Content-Length'] = sum(
+            len(_multipart_part_header(boundary, content_type, start, end, size)) + end - start + 1 + 2
+            for start, end in ranges
+        ) + len(_multipart_closing(boundary))
+
+    response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    response['Content-Disposition'] = 'attachment; filename=' + iri_to_uri(file_name)
+    return response
+
+
+def encoded_etag(etag, encoding):
+    """
+    Возвращает ETag сжатого представления файла: оно отличается от исходного побайтно,
+    поэтому сильный валидатор у него свой.
+    """
+    return f'{etag}-{encoding}'
+
+
+def serve_encoded(request, body, file_name, etag, encoding, size, stat=None, content_type=DOWNLOAD_CONTENT_TYPE):
+    """
+    Отдаёт файл, хранящийся сжатым (FILE_COMPRESSION).
+
+    Если клиент принимает кодировку хранения (Accept-Encoding), сжатые байты отдаются как есть
+    с заголовком Content-Encoding, Range применяется к сжатому представлению. Иначе файл
+    распаковывается на лету блоками, такой ответ отдаётся целиком, без поддержки Range.
+
+    Args:
+        request (HttpRequest): HTTP запрос.
+        body (FileBody): источник сжатого содержимого.
+        file_name (str): имя файла для заголовка Content-Disposition.
+        etag (str): ETag исходного содержимого без кавычек.
+        encoding (str): кодировка сжатия файла.
+        size (int): исходный размер файла, байт.
+        stat (os.stat_result | FileStat | None): заранее полученные сведения о сжатом файле.
+        content_type (str): MIME тип ответа.
+
+    Returns:
+        HttpResponse: 200, 206, 304, 412 или 416 ответ.
+    """
+    if accepts_encoding(request, encoding):
+        response = serve_file(request, None, file_name, encoded_etag(etag, encoding), content_type, body, stat)
+        if response.status_code in (200, 206):
+            response['Content-Encoding'] = encoding
+    else:
+        stat = stat or body.stat()
+        last_modified = int(stat.st_mtime)
+        etag = quote_etag(etag)
+        response = _conditional(request, etag, last_modified)
+        if response is None:
+            response = StreamingHttpResponse(body.iter_decoded(encoding), content_type=content_type)
+            response['Content-Length'] = size
+            response['Accept-Ranges'] = 'none'
+            response['ETag'] = etag
+            response['Last-Modified'] = http_date(last_modified)
+            response['Content-Disposition'] = 'attachment; filename=' + iri_to_uri(file_name)
+    patch_vary_headers(response, ('Accept-Encoding',))
+    return response
+
+
+def not_modified(request, etag):
+    """
+    Проверяет If-None-Match до передачи файла прокси: прокси отвечает со своим ETag,
+    поэтому сравнение с хэшем содержимого выполняется в приложении.
+
+    Args:
+        request (HttpRequest): HTTP запрос.
+        etag (str): значение ETag без кавычек.
+
+    Returns:
+        HttpResponseNotModified | None: ответ 304, если у клиента актуальная версия файла.
+    """
+    if request.method not in ('GET', 'HEAD'):
+        return None
+    etags = parse_etags(request.META.get('HTTP_IF_NONE_MATCH', ''))
+    etag = quote_etag(etag)
+    # If-None-Match использует слабое сравнение
+    if etags == ['*'] or etag in (candidate.removeprefix('W/') for candidate in etags):
+        response = HttpResponseNotModified()
+        response['ETag'] = etag
+        return response
+    return None
+
+
+def offload_file(path, relative_path, file_name, etag, backend, content_type=DOWNLOAD_CONTENT_TYPE):
+    """
+    Формирует пустой ответ с заголовком, по которому файл отдаёт фронт-прокси.
+
+    Range, условные запросы и сама передача данных выполняются прокси-сервером,
+    воркер приложения в передаче байт не участвует.
+
+    Args:
+        path (str): абсолютный путь к файлу на диске.
+        relative_path (str): путь к файлу относительно MEDIA_ROOT.
+        file_name (str): имя файла для заголовка Content-Disposition.
+        etag (str): значение ETag без кавычек.
+        backend (str): 'nginx' для X-Accel-Redirect или 'sendfile' для X-Sendfile.
+        content_type (str): MIME тип ответа.
+
+    Returns:
+        HttpResponse: ответ без тела с заголовком для прокси.
+    """
+    response = HttpResponse(content_type=content_type)
+    if backend == 'nginx':
+        location = settings.DOWNLOAD_ACCEL_LOCATION.rstrip('/') + '/' + relative_path.lstrip('/')
+        response['X-Accel-Redirect'] = quote(location)
+    elif backend == 'sendfile':
+        response['X-Sendfile'] = path
+    else:
+        raise ImproperlyConfigured(f'Unknown DOWNLOAD_BACKEND: {backend}')
+    response['ETag'] = quote_etag(etag)
+    response['Content-Disposition'] = 'attachment; filename=' + iri_to_uri(file_name)
+    return response
+
+
+def storage_redirect(request, name, file_name, etag, encoding='', content_type=DOWNLOAD_CONTENT_TYPE):
+    """
+    Перенаправляет на прямую ссылку хранилища (подписанная ссылка S3), если хранилище её выдаёт.
+
+    Сжатый файл отдаётся по ссылке, только если клиент принимает его кодировку,
+    иначе его распаковывает приложение.
+
+    Args:
+        request (HttpRequest): HTTP запрос.
+        name (str): имя файла в хранилище.
+        file_name (str): имя файла для заголовка Content-Disposition.
+        etag (str): значение ETag без кавычек.
+        encoding (str): кодировка сжатия файла или пустая строка.
+        content_type (str): MIME тип ответа.
+
+    Returns:
+        HttpResponse | None: ответ 302 или 304, None если прямой ссылкой отдать нельзя.
+    """
+    if encoding and not accepts_encoding(request, encoding):
+        return None
+    url = default_storage.download_url(name, file_name, content_type, encoding)
+    if url is None:
+        return None
+    if encoding:
+        etag = encoded_etag(etag, encoding)
+    response = not_modified(request, etag)
+    if response is None:
+        response = HttpResponseRedirect(url)
+        response['ETag'] = quote_etag(etag)
+    if encoding:
+        patch_vary_headers(response, ('Accept-Encoding',))
+    return response
+
+
+def send_file(request, name, file_name, etag, encoding='', size=None):
+    """
+    Отдаёт файл из хранилища.
+
+    Если хранилище выдаёт прямые ссылки (S3), клиент перенаправляется на подписанную ссылку.
+    Сжатый файл отдаёт приложение (serve_encoded). Остальные файлы на локальном диске
+    отдаются способом, выбранным в настройке DOWNLOAD_BACKEND:
+
+    - python: потоковая отдача из воркера (serve_file), подходит для разработки.
+    - nginx: заголовок X-Accel-Redirect на internal location из DOWNLOAD_ACCEL_LOCATION.
+    - sendfile: заголовок X-Sendfile (Apache mod_xsendfile, lighttpd).
+
+    Args:
+        request (HttpRequest): HTTP запрос.
+        name (str): имя файла в хранилище.
+        file_name (str): имя файла для заголовка Content-Disposition.
+        etag (str): значение ETag без кавычек.
+        encoding (str): кодировка сжатия файла или пустая строка.
+        size (int | None): исходный размер файла, нужен для сжатого файла.
+
+    Returns:
+        HttpResponse: ответ с файлом.
+
+    Raises:
+        FileNotFoundError: если файла нет в хранилище.
+    """
+    response = storage_redirect(request, name, file_name, etag, encoding)
+    if response is not None:
+        return response
+    path = local_path(name)
+    if encoding:
+        body = FileBody(path) if path else StorageFileBody(name)
+        return serve_encoded(request, body, file_name, etag, encoding, size)
+    if path is None:
+        return serve_file(request, None, file_name, etag, body=StorageFileBody(name))
+    backend = settings.DOWNLOAD_BACKEND
+    if backend == 'python':
+        return serve_file(request, path, file_name, etag)
+    if not os.path.isfile(path):
+        raise FileNotFoundError(path)
+    return not_modified(request, etag) or offload_file(path, name, file_name, etag, backend)
+
+
+class _ZipStream:
+    """
+    Несдвигаемый поток для zipfile: записанные байты накапливаются до очередного drain().
+    """
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def iter_zip_archive(entries, chunk_size=None):
+    """
+    Генератор ZIP-архива, собираемого на лету.
+
+    Архив не сохраняется ни на диск, ни в память целиком: файлы пишутся без сжатия блоками,
+    каждый блок сразу отдаётся клиенту, а размеры и CRC записываются в дескрипторы после данных.
+
+    Args:
+        entries (list): кортежи (имя в архиве, имя файла в хранилище, кодировка сжатия, размер,
+            время изменения в секундах).
+        chunk_size (int | None): размер блока чтения, по умолчанию DOWNLOAD_CHUNK_SIZE.
+
+    Yields:
+        bytes: очередной фрагмент архива.
+    """
+    chunk_size = chunk_size or settings.DOWNLOAD_CHUNK_SIZE
+    stream = _ZipStream()
+    with zipfile.ZipFile(stream, 'w', compression=zipfile.ZIP_STORED, allowZip64=True) as archive:
+        for arcname, name, encoding, size, timestamp in entries:
+            info = zipfile.ZipInfo(arcname, date_time=time.localtime(max(timestamp, ZIP_EPOCH))[:6])
+            info.file_size = size
+            with open_stored(name, encoding) as source, archive.open(info, 'w') as target:
+                for block in iter(lambda: source.read(chunk_size), b''):
+                    target.write(block)
+                    yield stream.drain()
+    data = stream.drain()
+    if data:
+        yield data
+
+
+def archive_member_name(name):
+    """
+    Приводит имя файла пользователя к имени элемента ZIP-архива: без каталогов и без ведущих точек,
+    чтобы при распаковке файл не попал за пределы каталога архива (zip slip) и не стал скрытым.
+
+    Args:
+        name (str | None): имя файла.
+
+    Returns:
+        str: безопасное имя или пустая строка, если от имени ничего не осталось.
+    """
+    return os.path.basename((name or '').replace('\\', '/')).lstrip('.').strip()
+
+
+def zip_response(entries, archive_name):
+    """
+    Формирует потоковый ответ с ZIP-архивом из нескольких файлов.
+
+    Args:
+        entries (list): кортежи (имя в архиве, имя файла в хранилище, кодировка сжатия, размер,
+            время изменения в секундах).
+        archive_name (str): имя архива для заголовка Content-Disposition.
+
+    Returns:
+        StreamingHttpResponse: ответ с архивом.
+    """
+    response = StreamingHttpResponse(
+        (data for data in iter_zip_archive(entries) if data), content_type='application/zip'
+    )
+    response['Content-Disposition'] = 'attachment; filename=' + iri_to_uri(archive_name)
+    return response
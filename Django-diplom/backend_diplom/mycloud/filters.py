@@ -0,0 +1,40 @@
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import BaseFilterBackend
+
+
+class FileFilterBackend(BaseFilterBackend):
+    """
+    Фильтрация списка файлов по параметрам запроса.
+
+    - name: префикс имени файла.
+    - size_min, size_max: диапазон размера, байт.
+    - created_after, created_before: диапазон даты создания, секунды с начала эпохи.
+    - digest: хэш содержимого, чтобы клиент мог не загружать файл, который у него уже есть.
+
+    Все условия покрываются составными индексами модели File, начинающимися с creator.
+    """
+    range_params = (
+        ('size_min', 'size__gte'),
+        ('size_max', 'size__lte'),
+        ('created_after', 'data_created__gte'),
+        ('created_before', 'data_created__lte'),
+    )
+
+    def filter_queryset(self, request, queryset, view):
+        params = request.query_params
+        name = params.get('name')
+        if name:
+            queryset = queryset.filter(name__startswith=name)
+        digest = params.get('digest')
+        if digest:
+            queryset = queryset.filter(digest=digest.lower())
+        for param, lookup in self.range_params:
+            value = params.get(param)
+            if value is None:
+                continue
+            try:
+                value = int(value)
+            except ValueError:
+                raise ValidationError({param: 'Ожидается целое число.'})
+            queryset = queryset.filter(**{lookup: value})
+        return queryset
@@ -0,0 +1,151 @@
+import logging
+import traceback
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Q
+
+from .models import Job
+from .utils import seconds_since_epoch
+
+logger = logging.getLogger('mycloud')
+
+_handlers = {}
+
+
+class JobError(Exception):
+    """
+    Ошибка задачи, которую бесполезно повторять: задача сразу помечается как failed.
+    """
+
+
+def job_handler(kind):
+    """
+    Декоратор, регистрирующий функцию-обработчик задач типа kind.
+
+    Обработчик получает параметры задачи именованными аргументами и может вернуть
+    JSON-совместимый результат. Задача может выполниться повторно после сбоя,
+    поэтому обработчик должен быть идемпотентным.
+    """
+    def decorator(func):
+        _handlers[kind] = func
+        return func
+    return decorator
+
+
+def enqueue(kind, payload=None, creator=None):
+    """
+    Ставит задачу в очередь. При JOB_QUEUE_EAGER задача выполняется сразу после фиксации транзакции.
+
+    Args:
+        kind (str): тип задачи.
+        payload (dict | None): параметры обработчика.
+        creator (User | None): пользователь, поставивший задачу.
+
+    Returns:
+        Job: созданная задача.
+    """
+    if kind not in _handlers:
+        raise ValueError(f'Unknown job kind: {kind}')
+    job = Job.objects.create(
+        kind=kind, payload=payload or {}, creator=creator, max_attempts=settings.JOB_MAX_ATTEMPTS
+    )
+    logger.info(f'Job {job.id} ({kind}) enqueued')
+    if settings.JOB_QUEUE_EAGER:
+        transaction.on_commit(lambda: run_job(job))
+    return job
+
+
+def claim_job():
+    """
+    Захватывает следующую готовую задачу. Задачи, зависшие в статусе running дольше
+    JOB_LOCK_TIMEOUT (воркер упал), захватываются повторно.
+
+    Returns:
+        Job | None: захваченная задача.
+    """
+    now = seconds_since_epoch()
+    ready = Q(status=Job.PENDING, run_after__lte=now) | \
+        Q(status=Job.RUNNING, locked_at__lt=now - settings.JOB_LOCK_TIMEOUT)
+    with transaction.atomic():
+        queryset = Job.objects.filter(ready).order_by('run_after')
+        if connection.features.has_select_for_update_skip_locked:
+            # Несколько воркеров не ждут друг друга и не берут одну задачу
+            queryset = queryset.select_for_update(skip_locked=True)
+        job = queryset.first()
+        if job is None:
+            return None
+        job.status = Job.RUNNING
+        job.locked_at = now
+        job.attempts += 1
+        job.data_updated = now
+        job.save(update_fields=['status', 'locked_at', 'attempts', 'data_updated'])
+    return job
+
+
+def run_job(job):
+    """
+    Выполняет задачу. При ошибке задача возвращается в очередь с задержкой
+    JOB_RETRY_DELAY * 2^(попытка - 1), после max_attempts попыток или при JobError
+    помечается как failed.
+
+    Args:
+        job (Job): задача.
+
+    Returns:
+        bool: True, если задача выполнена.
+    """
+    if job.status != Job.RUNNING:
+        job.attempts += 1
+    try:
+        job.result = _handlers[job.kind](**job.payload)
+    except Exception as e:
+        job.last_error = traceback.format_exc()
+        if isinstance(e, JobError) or job.attempts >= job.max_attempts:
+            job.status = Job.FAILED
+            logger.exception(f'Job {job.id} ({job.kind}) failed after {job.attempts} attempts')
+        else:
+            job.status = Job.PENDING
+            job.run_after = seconds_since_epoch() + settings.JOB_RETRY_DELAY * 2 ** (job.attempts - 1)
+            logger.warning(f'Job {job.id} ({job.kind}) attempt {job.attempts} failed, will retry')
+    else:
+        job.status = Job.DONE
+        logger.info(f'Job {job.id} ({job.kind}) done')
+    job.locked_at = None
+    job.data_updated = seconds_since_epoch()
+    job.save(update_fields=['status', 'attempts', 'run_after', 'locked_at', 'result', 'last_error', 'data_updated'])
+    return job.status == Job.DONE
+
+
+def run_pending(limit=None):
+    """
+    Выполняет готовые задачи по одной, пока очередь не опустеет или не будет выполнено limit задач.
+
+    Args:
+        limit (int | None): максимальное количество задач.
+
+    Returns:
+        int: количество обработанных задач.
+    """
+    processed = 0
+    while limit is None or processed < limit:
+        job = claim_job()
+        if job is None:
+            break
+        run_job(job)
+        processed += 1
+    return processed
+
+
+def collect_finished(ttl):
+    """
+    Удаляет выполненные задачи старше ttl секунд. Задачи с ошибкой остаются для разбора.
+
+    Args:
+        ttl (int): время хранения выполненных задач, секунды.
+
+    Returns:
+        int: количество удалённых задач.
+    """
+    deleted, _ = Job.objects.filter(status=Job.DONE, data_updated__lt=seconds_since_epoch() - ttl).delete()
+    return deleted
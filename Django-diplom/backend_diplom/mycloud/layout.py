@@ -0,0 +1,179 @@
+import os
+import time
+import logging
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import transaction
+
+from .cache import invalidate_file_info
+from .models import Blob, File
+from .previews import move_preview
+from .storage import blob_directory_path
+from .utils import user_directory_path
+
+logger = logging.getLogger('mycloud')
+
+
+def expected_file_path(file_obj):
+    """
+    Возвращает путь, по которому файл должен лежать в текущей раскладке MEDIA_SHARD_*.
+
+    Args:
+        file_obj (File): объект файла без Blob.
+
+    Returns:
+        str: путь относительно MEDIA_ROOT.
+    """
+    return user_directory_path(file_obj, os.path.basename(str(file_obj.file)))
+
+
+def _link(source, destination):
+    """
+    Создаёт второе имя файла по новому пути. Старое имя остаётся, пока запись не переключена,
+    поэтому запросы, уже получившие старый путь, продолжают работать.
+    """
+    os.makedirs(os.path.dirname(destination), exist_ok=True)
+    if os.path.exists(destination) and os.path.samefile(source, destination):
+        # Ссылка осталась от прерванного запуска
+        return
+    try:
+        os.link(source, destination)
+    except OSError:
+        # Другая файловая система или жёсткие ссылки не поддерживаются
+        temporary = f'{destination}.reshard'
+        with open(source, 'rb') as src, open(temporary, 'wb') as dst:
+            for block in iter(lambda: src.read(1024 * 1024), b''):
+                dst.write(block)
+        os.replace(temporary, destination)
+
+
+def _unlink(paths):
+    for path in paths:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def _relocate_files(files):
+    """
+    Переносит пачку файлов без Blob в новые пути и переключает записи File одной транзакцией.
+
+    Returns:
+        tuple: (количество перенесённых файлов, старые пути к удалению).
+    """
+    planned = {}
+    for file_obj in files:
+        old = str(file_obj.file)
+        source = os.path.join(settings.MEDIA_ROOT, old)
+        if not os.path.isfile(source):
+            logger.warning(f'Reshard: file {file_obj.id} is missing at {old}')
+            continue
+        new = expected_file_path(file_obj)
+        destination = os.path.join(settings.MEDIA_ROOT, new)
+        if os.path.exists(destination) and not os.path.samefile(source, destination):
+            new = default_storage.get_available_name(new)
+        _link(source, os.path.join(settings.MEDIA_ROOT, new))
+        planned[file_obj.id] = (old, new)
+
+    moved = {}
+    with transaction.atomic():
+        # Запись могла быть удалена или изменена, пока файлы копировались
+        current = dict(File.objects.select_for_update().filter(pk__in=planned).values_list('id', 'file'))
+        for file_id, (old, new) in planned.items():
+            if current.get(file_id) == old:
+                File.objects.filter(pk=file_id).update(file=new)
+                moved[file_id] = (old, new)
+    invalidate_file_info(*File.objects.filter(pk__in=moved).values_list('hash', flat=True))
+    for old, new in moved.values():
+        move_preview(old, new)
+
+    stale = [os.path.join(settings.MEDIA_ROOT, new) for file_id, (_, new) in planned.items() if file_id not in moved]
+    _unlink(stale)
+    return len(moved), [os.path.join(settings.MEDIA_ROOT, old) for old, _ in moved.values()]
+
+
+def _relocate_blobs(blobs):
+    """
+    Переносит пачку Blob в новые пути и переключает Blob и ссылающиеся на него File одной транзакцией.
+
+    Returns:
+        tuple: (количество перенесённых Blob, старые пути к удалению).
+    """
+    planned = {}
+    for blob in blobs:
+        old = str(blob.file)
+        source = os.path.join(settings.MEDIA_ROOT, old)
+        if not os.path.isfile(source):
+            logger.warning(f'Reshard: blob {blob.digest} is missing at {old}')
+            continue
+        new = blob_directory_path(blob.digest)
+        _link(source, os.path.join(settings.MEDIA_ROOT, new))
+        planned[blob.id] = (old, new)
+
+    moved = {}
+    with transaction.atomic():
+        current = dict(Blob.objects.select_for_update().filter(pk__in=planned).values_list('id', 'file'))
+        for blob_id, (old, new) in planned.items():
+            if current.get(blob_id) == old:
+                Blob.objects.filter(pk=blob_id).update(file=new)
+                File.objects.filter(blob_id=blob_id).update(file=new)
+                moved[blob_id] = (old, new)
+    invalidate_file_info(*File.objects.filter(blob_id__in=moved).values_list('hash', flat=True))
+    for old, new in moved.values():
+        move_preview(old, new)
+
+    stale = [os.path.join(settings.MEDIA_ROOT, new) for blob_id, (_, new) in planned.items() if blob_id not in moved]
+    _unlink(stale)
+    return len(moved), [os.path.join(settings.MEDIA_ROOT, old) for old, _ in moved.values()]
+
+
+def reshard(batch_size=500, grace=1.0, pause=0.0, dry_run=False, report=None):
+    """
+    Переносит существующие файлы в раскладку MEDIA_SHARD_* пачками, не останавливая сервис.
+
+    Для каждого файла сначала создаётся второе имя по новому пути, затем запись переключается
+    в транзакции с блокировкой строки, и только после паузы grace удаляется старое имя. Поэтому
+    запрос, уже получивший старый путь, дочитает файл. Команду можно прервать и запустить снова:
+    обрабатываются только записи, путь которых ещё не совпадает с раскладкой.
+
+    Args:
+        batch_size (int): количество записей в пачке.
+        grace (float): пауза перед удалением старых путей пачки, секунды.
+        pause (float): пауза между пачками для снижения нагрузки, секунды.
+        dry_run (bool): только посчитать файлы, которые нужно перенести.
+        report (callable | None): вызывается с количеством перенесённых записей после каждой пачки.
+
+    Returns:
+        dict: количество перенесённых (или требующих переноса при dry_run) файлов и Blob.
+    """
+    summary = {'files': 0, 'blobs': 0}
+    for kind, queryset, relocate, expected in (
+        ('files', File.objects.filter(blob__isnull=True).only('id', 'file', 'creator_id'),
+         _relocate_files, expected_file_path),
+        ('blobs', Blob.objects.only('id', 'file', 'digest'),
+         _relocate_blobs, lambda blob: blob_directory_path(blob.digest)),
+    ):
+        last_id = 0
+        while True:
+            batch = list(queryset.filter(pk__gt=last_id).order_by('pk')[:batch_size])
+            if not batch:
+                break
+            last_id = batch[-1].pk
+            misplaced = [obj for obj in batch if os.path.dirname(str(obj.file)) != os.path.dirname(expected(obj))]
+            if not misplaced:
+                continue
+            if dry_run:
+                summary[kind] += len(misplaced)
+                continue
+            moved, old_paths = relocate(misplaced)
+            if grace:
+                time.sleep(grace)
+            _unlink(old_paths)
+            summary[kind] += moved
+            if report:
+                report(kind, moved)
+            if pause:
+                time.sleep(pause)
+    return summary
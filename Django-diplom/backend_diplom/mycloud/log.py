@@ -0,0 +1,220 @@
+"""
+Логирование без ожидания диска в потоке запроса (LOG_*).
+
+Записи кладутся в ограниченную очередь и пишутся в файл с ротацией по размеру фоновым потоком.
+Если очередь переполнена, запись отбрасывается, а не блокирует запрос; количество отброшенных
+записей попадает в лог, когда очередь освободится. Формат записей - JSON по строке на запись
+с request_id запроса, который задаёт RequestIdMiddleware. Частые события (скачивания) пишутся
+с долей LOG_SAMPLING по имени логгера.
+"""
+
+import os
+import copy
+import json
+import uuid
+import queue
+import logging
+import zlib
+import random
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+REQUEST_ID_HEADER = 'X-Request-ID'
+MAX_REQUEST_ID_LENGTH = 64
+
+_request_id = ContextVar('mycloud_request_id', default=None)
+
+# Атрибуты, которые есть у любой записи; остальные пришли через extra и выводятся отдельными полями
+_RECORD_ATTRIBUTES = set(logging.LogRecord('', 0, '', 0, '', (), None).__dict__) | {'message', 'request_id'}
+
+
+def get_request_id():
+    """
+    Возвращает id текущего запроса или None вне запроса.
+    """
+    return _request_id.get()
+
+
+class RequestIdFilter(logging.Filter):
+    """
+    Добавляет к записи request_id текущего запроса. Выполняется в потоке, создавшем запись.
+    """
+
+    def filter(self, record):
+        record.request_id = _request_id.get()
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Пропускает только долю записей уровня ниже WARNING для логгеров из rates.
+
+    Решение принимается по request_id, поэтому записи одного запроса сохраняются или отбрасываются вместе.
+    """
+
+    def __init__(self, rates=None):
+        super().__init__()
+        self.rates = rates or {}
+
+    def _rate(self, name):
+        while name:
+            if name in self.rates:
+                return self.rates[name]
+            name = name.rpartition('.')[0]
+        return 1.0
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = self._rate(record.name)
+        if rate >= 1:
+            return True
+        request_id = getattr(record, 'request_id', None) or _request_id.get()
+        point = zlib.crc32(request_id.encode()) / 0x100000000 if request_id else random.random()
+        return point < rate
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Форматирует запись в JSON одной строкой.
+    """
+
+    def format(self, record):
+        data = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'module': record.module,
+            'message': record.getMessage(),
+            'request_id': getattr(record, 'request_id', None),
+            'process': record.process,
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRIBUTES and key not in data:
+                data[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            data['exc'] = record.exc_text
+        if record.stack_info:
+            data['stack'] = record.stack_info
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class BackgroundRotatingFileHandler(QueueHandler):
+    """
+    Обработчик, передающий записи фоновому потоку, который пишет их в файл с ротацией по размеру.
+
+    В потоке запроса выполняются только фильтры и подстановка аргументов в сообщение,
+    форматирование и запись на диск - в фоновом потоке.
+
+    Args:
+        filename (str): путь к файлу лога.
+        max_bytes (int): размер файла, после которого он ротируется (0 - без ротации).
+        backup_count (int): количество хранимых старых файлов.
+        queue_size (int): предельное количество записей в очереди.
+    """
+
+    def __init__(self, filename, max_bytes=0, backup_count=0, queue_size=10000):
+        self.target = RotatingFileHandler(filename, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8')
+        self.queue_size = queue_size
+        self.dropped = 0
+        super().__init__(queue.Queue(queue_size))
+        self._exception_formatter = logging.Formatter()
+        self.listener = None
+        self._start()
+        # После fork (gunicorn --preload) поток записи в дочернем процессе не существует
+        os.register_at_fork(after_in_child=self._restart)
+
+    def _start(self):
+        self.listener = QueueListener(self.queue, self.target, respect_handler_level=True)
+        self.listener.start()
+
+    def _restart(self):
+        self.queue = queue.Queue(self.queue_size)
+        self._start()
+
+    def setFormatter(self, fmt):
+        # Форматирование выполняется в фоновом потоке обработчиком файла
+        self.target.setFormatter(fmt)
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.msg = record.message = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = self._exception_formatter.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            if self.dropped:
+                self.queue.put_nowait(self._dropped_record())
+                self.dropped = 0
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def _dropped_record(self):
+        return logging.LogRecord(
+            __name__, logging.WARNING, __file__, 0, f'{self.dropped} log records dropped: queue is full', None, None
+        )
+
+    def flush(self):
+        """
+        Дожидается записи всех поставленных в очередь записей.
+        """
+        if self.listener is not None:
+            self.queue.join()
+        self.target.flush()
+
+    def close(self):
+        # Остановка потока дописывает оставшиеся в очереди записи
+        if self.listener is not None:
+            self.listener.stop()
+            self.listener = None
+        self.target.close()
+        super().close()
+
+
+class RequestIdMiddleware:
+    """
+    Middleware, задающий id запроса для записей лога и возвращающий его в заголовке X-Request-ID.
+
+    id из входящего заголовка X-Request-ID (от балансировщика) используется, если он разумной длины,
+    иначе создаётся новый.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    @staticmethod
+    def _start(request):
+        request_id = request.headers.get(REQUEST_ID_HEADER, '')
+        if not request_id or len(request_id) > MAX_REQUEST_ID_LENGTH or not request_id.isprintable():
+            request_id = uuid.uuid4().hex
+        _request_id.set(request_id)
+        request.request_id = request_id
+        return request_id
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        request_id = self._start(request)
+        response = self.get_response(request)
+        response[REQUEST_ID_HEADER] = request_id
+        return response
+
+    async def __acall__(self, request):
+        request_id = self._start(request)
+        response = await self.get_response(request)
+        response[REQUEST_ID_HEADER] = request_id
+        return response
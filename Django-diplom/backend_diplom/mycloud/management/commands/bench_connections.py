@@ -0,0 +1,100 @@
+import json
+import time
+import asyncio
+import statistics
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+
+from mycloud.bench import percentile
+
+
+async def _slow_download(host, port, path, read_size, read_delay, timeout):
+    """
+    Скачивает path, читая ответ маленькими порциями с паузами, как медленный клиент.
+
+    Returns:
+        dict: время до первого байта, общее время, количество байт и ошибка, если была.
+    """
+    started = time.perf_counter()
+    result = {'ttfb': None, 'total': None, 'bytes': 0, 'error': None}
+    writer = None
+    try:
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+        writer.write(f'GET {path} HTTP/1.1\r\nHost: {host}\r\nConnection: close\r\n\r\n'.encode())
+        await writer.drain()
+        status_line = await asyncio.wait_for(reader.readline(), timeout)
+        result['ttfb'] = time.perf_counter() - started
+        if b' 200 ' not in status_line and b' 206 ' not in status_line:
+            result['error'] = status_line.decode(errors='replace').strip() or 'empty response'
+            return result
+        while True:
+            data = await asyncio.wait_for(reader.read(read_size), timeout)
+            if not data:
+                break
+            result['bytes'] += len(data)
+            if read_delay:
+                await asyncio.sleep(read_delay)
+    except (OSError, asyncio.TimeoutError) as e:
+        result['error'] = type(e).__name__
+    finally:
+        result['total'] = time.perf_counter() - started
+        if writer is not None:
+            writer.close()
+    return result
+
+
+async def _run(url, connections, read_size, read_delay, timeout):
+    parts = urlsplit(url)
+    if parts.scheme != 'http':
+        raise CommandError('Поддерживается только http://')
+    path = parts.path + (f'?{parts.query}' if parts.query else '')
+    return await asyncio.gather(*(
+        _slow_download(parts.hostname, parts.port or 80, path, read_size, read_delay, timeout)
+        for _ in range(connections)
+    ))
+
+
+class Command(BaseCommand):
+    help = (
+        'Открывает много одновременных медленных скачиваний и измеряет время до первого байта. '
+        'Используется для сравнения запуска под WSGI (gunicorn) и ASGI (uvicorn)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('url', help='Ссылка на скачивание, например http://127.0.0.1:8000/api/v1/download/<hash>/')
+        parser.add_argument('--connections', type=int, default=200, help='Количество одновременных соединений')
+        parser.add_argument('--read-size', type=int, default=16 * 1024, help='Размер порции чтения, байт')
+        parser.add_argument('--read-delay', type=float, default=0.05, help='Пауза между порциями, секунды')
+        parser.add_argument('--timeout', type=float, default=60, help='Таймаут операции сокета, секунды')
+        parser.add_argument('--json', action='store_true', help='Вывести результат в JSON')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        results = asyncio.run(_run(
+            options['url'], options['connections'], options['read_size'], options['read_delay'], options['timeout']
+        ))
+        elapsed = time.perf_counter() - started
+
+        succeeded = [result for result in results if result['error'] is None]
+        ttfb = [result['ttfb'] for result in results if result['ttfb'] is not None]
+        report = {
+            'connections': options['connections'],
+            'succeeded': len(succeeded),
+            'failed': len(results) - len(succeeded),
+            'elapsed': elapsed,
+            'bytes': sum(result['bytes'] for result in results),
+            'ttfb_p50': percentile(ttfb, 50),
+            'ttfb_p95': percentile(ttfb, 95),
+            'ttfb_p99': percentile(ttfb, 99),
+            'ttfb_mean': statistics.fmean(ttfb) if ttfb else None,
+            'errors': sorted({result['error'] for result in results if result['error']}),
+        }
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+        for key, value in report.items():
+            if isinstance(value, float):
+                value = f'{value:.4f}'
+            self.stdout.write(f'{key:>12}: {value}')
@@ -0,0 +1,282 @@
+import os
+import json
+import time
+import uuid
+import threading
+import http.client
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import CommandError
+from rest_framework.authtoken.models import Token
+
+from mycloud.bench import BenchCommand, RssSampler, own_peak_rss, parse_size, summarize
+from mycloud.tasks import schedule_user_deletion
+
+CONTENT_BLOCK_SIZE = 4 * 1024 * 1024
+READ_SIZE = 1024 * 1024
+OK_STATUSES = (200, 201, 206, 302, 304)
+
+
+class Client:
+    """
+    HTTP клиент с постоянным соединением на поток. Тело ответа читается блоками и не хранится.
+    """
+
+    def __init__(self, base_url, token, timeout):
+        parts = urlsplit(base_url)
+        if parts.scheme not in ('http', 'https'):
+            raise CommandError('Адрес сервера должен начинаться с http:// или https://')
+        self.connection_class = http.client.HTTPSConnection if parts.scheme == 'https' else http.client.HTTPConnection
+        self.host = parts.hostname
+        self.port = parts.port
+        self.prefix = parts.path.rstrip('/')
+        self.token = token
+        self.timeout = timeout
+        self.local = threading.local()
+
+    def _connection(self):
+        connection = getattr(self.local, 'connection', None)
+        if connection is None:
+            connection = self.local.connection = self.connection_class(self.host, self.port, timeout=self.timeout)
+        return connection
+
+    def request(self, method, path, body=None, headers=None):
+        """
+        Выполняет запрос и читает ответ целиком.
+
+        Returns:
+            tuple: (статус, заголовки, тело для ответов JSON или количество байт тела, длительность).
+        """
+        headers = {'Authorization': f'Token {self.token}', **(headers or {})}
+        started = time.perf_counter()
+        connection = self._connection()
+        try:
+            connection.request(method, self.prefix + path, body=body() if callable(body) else body, headers=headers)
+            response = connection.getresponse()
+            if response.getheader('Content-Type', '').startswith('application/json'):
+                content = json.loads(response.read() or b'null')
+            else:
+                content = 0
+                while data := response.read(READ_SIZE):
+                    content += len(data)
+        except (OSError, http.client.HTTPException):
+            connection.close()
+            self.local.connection = None
+            raise
+        if response.will_close:
+            connection.close()
+            self.local.connection = None
+        return response.status, response.headers, content, time.perf_counter() - started
+
+
+def _content(size, block):
+    # Уникальное начало: файлы не дедуплицируются; случайный блок не сжимается
+    data = uuid.uuid4().bytes[:size]
+    yield data
+    size -= len(data)
+    while size > 0:
+        chunk = block[:size]
+        yield chunk
+        size -= len(chunk)
+
+
+def _multipart(size, name, block):
+    boundary = uuid.uuid4().hex
+    head = (
+        f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="{name}"\r\n'
+        'Content-Type: application/octet-stream\r\n\r\n'
+    ).encode()
+    tail = f'\r\n--{boundary}--\r\n'.encode()
+
+    def body():
+        yield head
+        yield from _content(size, block)
+        yield tail
+
+    headers = {
+        'Content-Type': f'multipart/form-data; boundary={boundary}',
+        'Content-Length': str(len(head) + size + len(tail)),
+    }
+    return body, headers
+
+
+class Scenario:
+    """
+    Результаты одного сценария: длительности успешных операций, байты и ошибки.
+    """
+
+    def __init__(self):
+        self.durations = []
+        self.size = 0
+        self.errors = {}
+        self.not_modified = 0
+        self.lock = threading.Lock()
+
+    def add(self, status, duration, size=0):
+        with self.lock:
+            if status in OK_STATUSES:
+                self.durations.append(duration)
+                self.size += size
+                self.not_modified += status == 304
+            else:
+                self.errors[str(status)] = self.errors.get(str(status), 0) + 1
+
+    def summary(self, elapsed):
+        result = summarize(self.durations, elapsed=elapsed, size=self.size)
+        result['errors'] = self.errors
+        if self.not_modified:
+            result['not_modified'] = self.not_modified
+        return result
+
+
+class Command(BenchCommand):
+    help = (
+        'Нагрузочный сценарий по HTTP против запущенного сервера: одновременные загрузки и скачивания файлов '
+        'заданных размеров и опрос списка файлов. Отчёт: p50/p95/p99, пропускная способность и пиковый RSS сервера'
+    )
+
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        parser.add_argument('url', help='Адрес сервера, например http://127.0.0.1:8000')
+        parser.add_argument('--token', help='Токен пользователя; без него создаётся временный пользователь в базе')
+        parser.add_argument('--username', help='Пользователь, от имени которого идёт нагрузка (токен из базы)')
+        parser.add_argument('--sizes', default='1K,1M,100M', help='Размеры файлов через запятую: 1K,1M,4G')
+        parser.add_argument('--files-per-size', type=int, default=8, help='Количество загрузок каждого размера')
+        parser.add_argument('--downloads', type=int, default=4, help='Количество скачиваний каждого файла')
+        parser.add_argument('--concurrency', type=int, default=8, help='Одновременных загрузок и скачиваний')
+        parser.add_argument('--poll-clients', type=int, default=32, help='Одновременных клиентов опроса списка')
+        parser.add_argument('--poll-duration', type=float, default=10, help='Длительность опроса списка, секунды')
+        parser.add_argument('--poll-interval', type=float, default=0, help='Пауза клиента между опросами, секунды')
+        parser.add_argument('--server-pid', type=int, help='PID сервера (мастер gunicorn) для замера RSS')
+        parser.add_argument('--timeout', type=float, default=600, help='Таймаут операции сокета, секунды')
+        parser.add_argument('--keep', action='store_true', help='Не удалять загруженные файлы')
+
+    def handle(self, *args, **options):
+        try:
+            sizes = [parse_size(size) for size in options['sizes'].split(',')]
+        except ValueError:
+            raise CommandError(f'Неверный список размеров: {options["sizes"]}')
+        user, token = self.get_token(options)
+        client = Client(options['url'], token, options['timeout'])
+        block = os.urandom(CONTENT_BLOCK_SIZE)
+        results = {}
+        rss = {}
+        uploaded = []
+        try:
+            for size in sizes:
+                scenario, files = self.phase(
+                    options, rss, f'upload_{size}', lambda pool, scenario: [
+                        pool.submit(self.upload, client, scenario, size, number, block)
+                        for number in range(options['files_per_size'])
+                    ],
+                )
+                results[f'upload_{size}'] = scenario
+                uploaded.extend(file for file in files if file is not None)
+                hashes = [file['hash'] for file in files if file is not None]
+                results[f'download_{size}'], _ = self.phase(
+                    options, rss, f'download_{size}', lambda pool, scenario: [
+                        pool.submit(self.download, client, scenario, hash)
+                        for hash in hashes for _ in range(options['downloads'])
+                    ],
+                )
+            results['list_poll'], _ = self.phase(
+                options, rss, 'list_poll', lambda pool, scenario: [
+                    pool.submit(self.poll, client, scenario, options['poll_duration'], options['poll_interval'])
+                    for _ in range(options['poll_clients'])
+                ], workers=options['poll_clients'],
+            )
+        finally:
+            if not options['keep']:
+                self.cleanup(client, user, uploaded)
+
+        parameters = {
+            key: options[key] for key in (
+                'url', 'sizes', 'files_per_size', 'downloads', 'concurrency', 'poll_clients', 'poll_duration',
+                'poll_interval',
+            )
+        }
+        self.finish('load', options, parameters, results, server_peak_rss=rss, client_peak_rss=own_peak_rss())
+
+    def get_token(self, options):
+        """
+        Возвращает (временный пользователь или None, токен).
+        """
+        if options['token']:
+            return None, options['token']
+        if options['username']:
+            try:
+                user = User.objects.get(username=options['username'])
+            except User.DoesNotExist:
+                raise CommandError(f'Пользователь {options["username"]} не найден')
+            return None, Token.objects.get_or_create(user=user)[0].key
+        user = User.objects.create(username=f'bench-{uuid.uuid4().hex[:12]}')
+        return user, Token.objects.create(user=user).key
+
+    def phase(self, options, rss, name, submit, workers=None):
+        """
+        Выполняет операции сценария в пуле потоков с замером RSS сервера.
+
+        Returns:
+            tuple: (сводка сценария, результаты операций).
+        """
+        scenario = Scenario()
+        self.stdout.write(f'Running {name}...')
+        started = time.perf_counter()
+        with RssSampler(options['server_pid']) if options['server_pid'] else nullcontext() as sampler:
+            with ThreadPoolExecutor(max_workers=workers or options['concurrency']) as pool:
+                values = [future.result() for future in submit(pool, scenario)]
+        if sampler is not None:
+            rss[name] = sampler.peak
+        return scenario.summary(time.perf_counter() - started), values
+
+    def upload(self, client, scenario, size, number, block):
+        body, headers = _multipart(size, f'bench-{size}-{number}.bin', block)
+        try:
+            status, _, content, duration = client.request('POST', '/api/v1/filelist/', body, headers)
+        except (OSError, http.client.HTTPException) as e:
+            scenario.add(type(e).__name__, 0)
+            return None
+        scenario.add(status, duration, size)
+        return content if status == 201 else None
+
+    def download(self, client, scenario, hash):
+        try:
+            status, _, size, duration = client.request('GET', f'/api/v1/download/{hash}/')
+        except (OSError, http.client.HTTPException) as e:
+            scenario.add(type(e).__name__, 0)
+            return
+        scenario.add(status, duration, size if isinstance(size, int) else 0)
+
+    def poll(self, client, scenario, duration, interval):
+        # Как браузер: повторный запрос с ETag предыдущего ответа
+        etag = None
+        deadline = time.perf_counter() + duration
+        while time.perf_counter() < deadline:
+            headers = {'If-None-Match': etag} if etag else {}
+            try:
+                status, response_headers, _, elapsed = client.request('GET', '/api/v1/filelist/', headers=headers)
+            except (OSError, http.client.HTTPException) as e:
+                scenario.add(type(e).__name__, 0)
+                continue
+            etag = response_headers.get('ETag') or etag
+            scenario.add(status, elapsed)
+            if interval:
+                time.sleep(interval)
+
+    def cleanup(self, client, user, uploaded):
+        """
+        Удаляет данные прогона: временного пользователя - фоновой задачей delete_user,
+        файлы существующего пользователя - пакетным удалением через API.
+        """
+        if user is not None:
+            schedule_user_deletion(user)
+            self.stdout.write(f'Temporary user {user.username} scheduled for deletion, run run_jobs to remove files')
+            return
+        ids = [file['id'] for file in uploaded]
+        for start in range(0, len(ids), settings.BULK_MAX_FILES):
+            body = json.dumps({'ids': ids[start:start + settings.BULK_MAX_FILES]}).encode()
+            client.request('POST', '/api/v1/filelist/bulk-delete/', body, {'Content-Type': 'application/json'})
@@ -0,0 +1,107 @@
+import os
+import uuid
+
+from django.contrib.auth.models import User
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import transaction
+from django.test import RequestFactory
+
+from mycloud.bench import BenchCommand, measure, own_peak_rss, summarize
+from mycloud.models import File, UserUsage
+from mycloud.renderers import ORJSONRenderer
+from mycloud.serializers import FileReadSerializer, FileWriteSerializer, UserSerializer
+from mycloud.utils import generating_uuid
+
+
+class Command(BenchCommand):
+    help = (
+        'Микробенчмарки сериализаторов на синтетических данных в настроенной базе: FileWriteSerializer.create, '
+        'FileReadSerializer для длинного списка, UserSerializer для списка пользователей администратора. '
+        'Все данные создаются в транзакции, которая откатывается, содержимое файлов удаляется из хранилища'
+    )
+
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        parser.add_argument('--users', type=int, default=1000, help='Количество пользователей в списке администратора')
+        parser.add_argument('--files', type=int, default=10000, help='Количество файлов в сериализуемом списке')
+        parser.add_argument('--creates', type=int, default=200, help='Количество вызовов FileWriteSerializer.create')
+        parser.add_argument('--create-size', type=int, default=1024, help='Размер создаваемого файла, байт')
+        parser.add_argument('--repeat', type=int, default=10, help='Количество замеров сериализации списков')
+
+    def handle(self, *args, **options):
+        stored = []
+        try:
+            with transaction.atomic():
+                results = self.run(options, stored)
+                transaction.set_rollback(True)
+        finally:
+            # Откат транзакции не удаляет содержимое, записанное в хранилище
+            for name in stored:
+                default_storage.delete(name)
+        parameters = {key: options[key] for key in ('users', 'files', 'creates', 'create_size', 'repeat')}
+        self.finish('serializers', options, parameters, results, peak_rss=own_peak_rss())
+
+    def run(self, options, stored):
+        prefix = uuid.uuid4().hex[:8]
+        users = User.objects.bulk_create(
+            User(username=f'bench-{prefix}-{number}') for number in range(max(options['users'], 1))
+        )
+        owner = users[0]
+        UserUsage.objects.bulk_create(UserUsage(user=user, file_count=1, total_size=1024) for user in users)
+        File.objects.bulk_create(
+            (
+                File(
+                    creator=owner,
+                    name=f'{number:06d}_report.txt',
+                    file=f'user_{owner.id}/{number:06d}_report.txt',
+                    size=number * 1024,
+                    data_created=1700000000 + number,
+                    hash=generating_uuid(),
+                    comment='Синтетический файл',
+                )
+                for number in range(options['files'])
+            ),
+            batch_size=2000,
+        )
+        results = {}
+
+        request = RequestFactory().post('/api/v1/filelist/')
+        request.user = owner
+        payload = os.urandom(options['create_size'])
+
+        def create():
+            # Уникальный префикс: при дедупликации каждый вызов сохраняет новое содержимое
+            content = uuid.uuid4().bytes + payload
+            serializer = FileWriteSerializer(
+                data={'file': SimpleUploadedFile('bench.bin', content), 'comment': ''}, context={'request': request}
+            )
+            serializer.is_valid(raise_exception=True)
+            instance = serializer.save()
+            stored.append(str(instance.file))
+
+        results['file_write_create'] = summarize(
+            measure(create, options['creates']), size=options['creates'] * options['create_size']
+        )
+
+        files = list(File.objects.filter(creator=owner).order_by('-data_created', '-id'))
+        data = FileReadSerializer(files, many=True).data
+        durations = measure(lambda: FileReadSerializer(files, many=True).data, options['repeat'])
+        results['file_read_list'] = summarize(durations, items=len(files) * len(durations))
+
+        renderer = ORJSONRenderer()
+        durations = measure(lambda: renderer.render({'isAdmin': False, 'files': data}), options['repeat'])
+        results['file_list_render'] = summarize(
+            durations, items=len(files) * len(durations), size=len(renderer.render({'files': data})) * len(durations)
+        )
+
+        queryset = User.objects.filter(is_active=True, username__startswith=f'bench-{prefix}-') \
+            .select_related('usage').order_by('id')
+
+        def user_list():
+            # Выборка и сериализация, как в UserListView без пагинации
+            return renderer.render(UserSerializer(queryset, many=True).data)
+
+        durations = measure(user_list, options['repeat'])
+        results['user_admin_list'] = summarize(durations, items=len(users) * len(durations))
+        return results
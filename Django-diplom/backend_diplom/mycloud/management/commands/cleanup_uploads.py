@@ -0,0 +1,18 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from mycloud.uploads import collect_expired
+
+
+class Command(BaseCommand):
+    help = 'Удаляет брошенные сессии возобновляемой загрузки и их промежуточные файлы'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--ttl', type=int, default=settings.UPLOAD_SESSION_TTL,
+            help='Время жизни сессии без активности, секунды (по умолчанию UPLOAD_SESSION_TTL)',
+        )
+
+    def handle(self, *args, **options):
+        expired = collect_expired(options['ttl'])
+        self.stdout.write(self.style.SUCCESS(f'Removed {expired} expired upload sessions'))
@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+
+from mycloud.cache import invalidate_file_info
+from mycloud.models import File
+from mycloud.usage import mark_files_changed
+from mycloud.storage import file_digest
+
+
+class Command(BaseCommand):
+    help = 'Считает хэш содержимого для файлов, загруженных до появления поля digest'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Количество файлов в одном обновлении')
+
+    def handle(self, *args, **options):
+        last_id = 0
+        updated = missing = 0
+        while True:
+            files = list(
+                File.objects.filter(pk__gt=last_id, digest__isnull=True).order_by('pk')
+                .only('id', 'file', 'encoding', 'hash')[:options['batch_size']]
+            )
+            if not files:
+                break
+            last_id = files[-1].id
+            changed = []
+            for file_obj in files:
+                try:
+                    file_obj.digest = file_digest(str(file_obj.file), file_obj.encoding)
+                except FileNotFoundError:
+                    missing += 1
+                    continue
+                changed.append(file_obj)
+            File.objects.bulk_update(changed, ['digest'])
+            mark_files_changed(File.objects.filter(pk__in=[file_obj.id for file_obj in changed]))
+            invalidate_file_info(*(file_obj.hash for file_obj in changed))
+            updated += len(changed)
+        self.stdout.write(self.style.SUCCESS(f'Computed {updated} digests, {missing} files not found in storage'))
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from mycloud.usage import rebuild_usage
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает счётчики использования хранилища (UserUsage) по таблице File'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check', action='store_true',
+            help='Только сверить счётчики, ничего не изменяя; при расхождениях команда завершается с ошибкой',
+        )
+
+    def handle(self, *args, **options):
+        mismatches = rebuild_usage(repair=not options['check'])
+        for user_id, current, expected in mismatches:
+            self.stdout.write(f'User {user_id}: stored {current}, actual {expected}')
+        if options['check'] and mismatches:
+            raise CommandError(f'{len(mismatches)} usage records do not match File rows')
+        action = 'Checked' if options['check'] else 'Rebuilt'
+        self.stdout.write(self.style.SUCCESS(f'{action} usage, {len(mismatches)} mismatches'))
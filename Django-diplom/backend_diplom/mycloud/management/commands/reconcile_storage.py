@@ -0,0 +1,56 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from mycloud.reconcile import Reconciler, UnsafeRepairError
+
+
+class Command(BaseCommand):
+    help = (
+        'Сверяет хранилище файлов с базой: файлы без записей, записи без файлов и счётчики ссылок Blob. '
+        'Прерванная сверка продолжается с сохранённой позиции'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repair', action='store_true', help='Исправить расхождения, иначе только отчёт')
+        parser.add_argument(
+            '--batch-size', type=int, default=settings.RECONCILE_BATCH_SIZE,
+            help='Размер пачки файлов и записей (по умолчанию RECONCILE_BATCH_SIZE)',
+        )
+        parser.add_argument(
+            '--grace-period', type=int, default=settings.RECONCILE_GRACE_PERIOD,
+            help='Файлы моложе стольких секунд не считаются брошенными (по умолчанию RECONCILE_GRACE_PERIOD)',
+        )
+        parser.add_argument(
+            '--checkpoint', default=settings.RECONCILE_CHECKPOINT,
+            help='Файл с позицией для продолжения (по умолчанию RECONCILE_CHECKPOINT)',
+        )
+        parser.add_argument(
+            '--force', action='store_true',
+            help='Исправлять, даже если в пачке больше RECONCILE_MAX_MISSING записей без файлов',
+        )
+        parser.add_argument('--restart', action='store_true', help='Начать сверку заново, забыв сохранённую позицию')
+        parser.add_argument(
+            '--check', action='store_true', help='Завершиться с ошибкой, если найдены расхождения',
+        )
+
+    def handle(self, *args, **options):
+        reconciler = Reconciler(
+            repair=options['repair'],
+            batch_size=options['batch_size'],
+            grace_period=options['grace_period'],
+            checkpoint=options['checkpoint'],
+            report=lambda kind, detail: self.stdout.write(f'{kind}: {detail}'),
+            force=options['force'],
+        )
+        if options['restart']:
+            reconciler.clear_checkpoint()
+        try:
+            summary = reconciler.run()
+        except UnsafeRepairError as e:
+            raise CommandError(f'{e}. Check that the storage is available or run with --force')
+        total = sum(summary.values())
+        details = ', '.join(f'{kind} {count}' for kind, count in summary.items())
+        if options['check'] and total and not options['repair']:
+            raise CommandError(f'{total} discrepancies found: {details}')
+        action = 'Repaired' if options['repair'] else 'Found'
+        self.stdout.write(self.style.SUCCESS(f'{action} {total} discrepancies: {details}'))
@@ -0,0 +1,38 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from mycloud.backends import local_path
+from mycloud.layout import reshard
+
+
+class Command(BaseCommand):
+    help = (
+        'Переносит существующие файлы в раскладку MEDIA_SHARD_DEPTH/MEDIA_SHARD_WIDTH пачками, '
+        'не останавливая сервис. Прерванный перенос можно запустить снова'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Количество записей в пачке')
+        parser.add_argument(
+            '--grace', type=float, default=1.0,
+            help='Пауза перед удалением старых путей пачки, секунды (даёт дочитать уже начатым скачиваниям)',
+        )
+        parser.add_argument('--pause', type=float, default=0.0, help='Пауза между пачками, секунды')
+        parser.add_argument('--dry-run', action='store_true', help='Только посчитать файлы, которые нужно перенести')
+
+    def handle(self, *args, **options):
+        if local_path('') is None:
+            # В S3 нет каталогов, количество ключей с общим префиксом не влияет на скорость
+            raise CommandError('Reshard applies only to the local storage (STORAGE_BACKEND = local)')
+        self.stdout.write(
+            f'Layout: depth {settings.MEDIA_SHARD_DEPTH}, width {settings.MEDIA_SHARD_WIDTH}'
+        )
+        summary = reshard(
+            batch_size=options['batch_size'],
+            grace=options['grace'],
+            pause=options['pause'],
+            dry_run=options['dry_run'],
+            report=lambda kind, moved: self.stdout.write(f'Moved {moved} {kind}'),
+        )
+        action = 'To move' if options['dry_run'] else 'Moved'
+        self.stdout.write(self.style.SUCCESS(f"{action}: {summary['files']} files, {summary['blobs']} blobs"))
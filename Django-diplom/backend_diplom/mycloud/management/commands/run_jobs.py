@@ -0,0 +1,62 @@
+import time
+import signal
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from mycloud.jobs import enqueue, run_pending
+from mycloud.models import Job
+
+
+class Command(BaseCommand):
+    help = 'Воркер очереди фоновых задач: удаление пользователей, пакетное удаление файлов, очистка'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Выполнить готовые задачи и завершиться')
+        parser.add_argument('--max-jobs', type=int, default=None, help='Завершиться после стольких задач')
+        parser.add_argument(
+            '--sweep-interval', type=int, default=0,
+            help='Ставить задачу sweep_orphans раз в столько секунд (0 - не ставить)',
+        )
+        parser.add_argument(
+            '--reconcile-interval', type=int, default=0,
+            help='Ставить задачу reconcile_storage раз в столько секунд (0 - не ставить)',
+        )
+
+    def handle(self, *args, **options):
+        self.stopping = False
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+
+        processed = 0
+        periodic = {
+            kind: [interval, time.monotonic()]
+            for kind, interval in (
+                ('sweep_orphans', options['sweep_interval']), ('reconcile_storage', options['reconcile_interval'])
+            )
+            if interval
+        }
+        while not self.stopping:
+            close_old_connections()
+            for kind, schedule in periodic.items():
+                interval, next_run = schedule
+                if time.monotonic() >= next_run:
+                    if not Job.objects.filter(kind=kind, status__in=(Job.PENDING, Job.RUNNING)).exists():
+                        enqueue(kind)
+                    schedule[1] = time.monotonic() + interval
+
+            # По одной задаче, чтобы между задачами проверять сигнал остановки
+            done = run_pending(limit=1)
+            processed += done
+            if options['max_jobs'] is not None and processed >= options['max_jobs']:
+                break
+            if not done:
+                if options['once']:
+                    break
+                time.sleep(settings.JOB_POLL_INTERVAL)
+        self.stdout.write(self.style.SUCCESS(f'Processed {processed} jobs'))
+
+    def stop(self, signum, frame):
+        # Текущая задача доделывается, новые не берутся
+        self.stopping = True
@@ -0,0 +1,355 @@
+"""
+Метрики запросов в формате Prometheus (METRICS_*).
+
+MetricsMiddleware для каждого запроса считает общее время, количество и время запросов к базе,
+байты, прочитанные из хранилища и записанные в него, и время сериализации, и сохраняет их
+в гистограммы по маршруту. Счётчики запроса лежат в contextvar, поэтому их видят и потоки
+asyncio.to_thread/sync_to_async. Вне запроса (воркер задач, команды) учёт не ведётся.
+Для потоковых ответов время и байты учитываются, когда закрывается их содержимое, то есть вместе с передачей.
+
+Под gunicorn с несколькими процессами метрики собираются через каталог
+PROMETHEUS_MULTIPROC_DIR (режим multiprocess пакета prometheus_client).
+"""
+
+import os
+import time
+from contextvars import ContextVar
+from functools import cache
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured, MiddlewareNotUsed
+from django.http import HttpResponse
+from django.utils.crypto import constant_time_compare
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 200)
+UNMATCHED_VIEW = 'unmatched'
+# Заголовки, которые FileResponse выставляет по файлу при замене содержимого
+FILE_RESPONSE_HEADERS = ('Content-Length', 'Content-Type', 'Content-Disposition')
+
+_current = ContextVar('mycloud_request_metrics', default=None)
+
+
+def _prometheus():
+    try:
+        import prometheus_client
+    except ImportError:
+        raise ImproperlyConfigured('METRICS_ENABLED requires prometheus_client: pip install prometheus-client')
+    return prometheus_client
+
+
+@cache
+def _collectors():
+    prometheus = _prometheus()
+    labels = ('view', 'method')
+    return {
+        'requests': prometheus.Counter(
+            'mycloud_requests_total', 'Количество запросов', labels + ('status', )
+        ),
+        'latency': prometheus.Histogram(
+            'mycloud_request_duration_seconds', 'Время обработки запроса', labels, buckets=LATENCY_BUCKETS
+        ),
+        'db_queries': prometheus.Histogram(
+            'mycloud_request_db_queries', 'Запросов к базе на запрос', labels, buckets=QUERY_COUNT_BUCKETS
+        ),
+        'db_time': prometheus.Histogram(
+            'mycloud_request_db_duration_seconds', 'Время запросов к базе на запрос', labels, buckets=LATENCY_BUCKETS
+        ),
+        'serializer_time': prometheus.Histogram(
+            'mycloud_request_serializer_duration_seconds', 'Время сериализации на запрос', labels,
+            buckets=LATENCY_BUCKETS,
+        ),
+        'storage': prometheus.Counter(
+            'mycloud_storage_bytes_total', 'Байты, прочитанные из хранилища и записанные в него',
+            labels + ('direction', ),
+        ),
+    }
+
+
+class RequestMetrics:
+    """
+    Счётчики одного запроса.
+    """
+    __slots__ = ('start', 'db_queries', 'db_time', 'storage_read', 'storage_written', 'serializer_time',
+                 'serializer_depth')
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.db_queries = 0
+        self.db_time = 0.0
+        self.storage_read = 0
+        self.storage_written = 0
+        self.serializer_time = 0.0
+        self.serializer_depth = 0
+
+
+def count_storage(read=0, written=0):
+    """
+    Учитывает байты, прочитанные из хранилища и записанные в него, в метриках текущего запроса.
+    """
+    state = _current.get()
+    if state is not None:
+        state.storage_read += read
+        state.storage_written += written
+
+
+class MeteredFile:
+    """
+    Прокси файла, учитывающий прочитанные через него байты в метриках запроса:
+    как прочитанные из хранилища или, при written, как записанные в него.
+    """
+
+    def __init__(self, file, state, written=False):
+        self._file = file
+        self._state = state
+        self._field = 'storage_written' if written else 'storage_read'
+
+    def _count(self, size):
+        setattr(self._state, self._field, getattr(self._state, self._field) + size)
+
+    def read(self, *args):
+        data = self._file.read(*args)
+        self._count(len(data))
+        return data
+
+    def readinto(self, buffer):
+        size = self._file.readinto(buffer)
+        self._count(size or 0)
+        return size
+
+    def __getattr__(self, name):
+        return getattr(self._file, name)
+
+    def __iter__(self):
+        return iter(self.read, b'')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self._file.close()
+
+
+def metered(file, written=False):
+    """
+    Оборачивает файл для учёта байтов хранилища: читаемый из хранилища или, при written,
+    источник сохраняемого в хранилище содержимого. Вне запроса возвращает файл как есть.
+    """
+    state = _current.get()
+    return file if state is None else MeteredFile(file, state, written)
+
+
+class serializer_timer:
+    """
+    Контекстный менеджер, учитывающий время сериализации. Вложенные сериализаторы не считаются повторно.
+    """
+    __slots__ = ('state', 'start')
+
+    def __enter__(self):
+        self.state = _current.get()
+        if self.state is not None:
+            self.state.serializer_depth += 1
+            if self.state.serializer_depth == 1:
+                self.start = time.perf_counter()
+
+    def __exit__(self, *exc_info):
+        if self.state is not None:
+            self.state.serializer_depth -= 1
+            if not self.state.serializer_depth:
+                self.state.serializer_time += time.perf_counter() - self.start
+
+
+def _instrument_query(execute, sql, params, many, context):
+    state = _current.get()
+    if state is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        state.db_queries += 1
+        state.db_time += time.perf_counter() - start
+
+
+def instrument_connection(sender, connection, **kwargs):
+    """
+    Обработчик сигнала connection_created: подключает учёт запросов к базе.
+
+    Обёртка остаётся на соединении и вне запросов стоит одной проверки contextvar.
+    """
+    if _instrument_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_instrument_query)
+
+
+def _view_label(request):
+    match = getattr(request, 'resolver_match', None)
+    # Шаблон маршрута, а не путь: количество рядов метрик не зависит от hash и id в адресах
+    return match.route if match is not None else UNMATCHED_VIEW
+
+
+class _Once:
+    """
+    Вызывает функцию только при первом обращении.
+    """
+
+    def __init__(self, func):
+        self.func = func
+
+    def __call__(self):
+        func, self.func = self.func, None
+        if func is not None:
+            func()
+
+
+def _observed(content, observed):
+    # Генератор закрывается вместе с ответом (его close попадает в закрывающие обработчики
+    # StreamingHttpResponse), поэтому метрики записываются и при обрыве передачи
+    try:
+        yield from content
+    finally:
+        observed()
+
+
+async def _aobserved(content, observed):
+    try:
+        async for part in content:
+            yield part
+    finally:
+        observed()
+
+
+class _ObservedFile:
+    """
+    Файл потокового ответа, при закрытии которого записываются метрики запроса.
+    """
+
+    def __init__(self, file, observed):
+        self.file = file
+        self.observed = observed
+
+    def __getattr__(self, name):
+        return getattr(self.file, name)
+
+    def close(self):
+        try:
+            self.file.close()
+        finally:
+            self.observed()
+
+
+def _replace_file(response, file):
+    # FileResponse заново выставляет заголовки по файлу, а view мог задать их сам (имя в Content-Disposition)
+    headers = {name: response.get(name) for name in FILE_RESPONSE_HEADERS}
+    response.streaming_content = file
+    for name, value in headers.items():
+        if value is None:
+            del response[name]
+        else:
+            response[name] = value
+
+
+class MetricsMiddleware:
+    """
+    Middleware учёта метрик запросов. Работает под WSGI и ASGI.
+
+    При METRICS_SERVER_TIMING в ответ добавляется заголовок Server-Timing со временем обработки,
+    запросов к базе и сериализации до начала передачи тела.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.METRICS_ENABLED:
+            raise MiddlewareNotUsed
+        self.collectors = _collectors()
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        state = RequestMetrics()
+        _current.set(state)
+        response = self.get_response(request)
+        return self.finish(request, response, state)
+
+    async def __acall__(self, request):
+        state = RequestMetrics()
+        _current.set(state)
+        response = await self.get_response(request)
+        return self.finish(request, response, state)
+
+    def finish(self, request, response, state):
+        """
+        Добавляет Server-Timing и записывает метрики сразу или, для потоковых ответов, при закрытии ответа.
+        """
+        if settings.METRICS_SERVER_TIMING:
+            response['Server-Timing'] = server_timing(state)
+        labels = (_view_label(request), request.method)
+        if response.streaming:
+            observed = _Once(lambda: self.observe(labels, response.status_code, state))
+            if getattr(response, 'file_to_stream', None) is not None:
+                # FileResponse с файлом: обёртка сохраняет read/fileno, и WSGI-сервер может отдать его через sendfile
+                _replace_file(response, _ObservedFile(response.file_to_stream, observed))
+            elif response.is_async:
+                response.streaming_content = _aobserved(response.streaming_content, observed)
+            else:
+                response.streaming_content = _observed(response.streaming_content, observed)
+        else:
+            self.observe(labels, response.status_code, state)
+        return response
+
+    def observe(self, labels, status_code, state):
+        collectors = self.collectors
+        collectors['requests'].labels(*labels, str(status_code)).inc()
+        collectors['latency'].labels(*labels).observe(time.perf_counter() - state.start)
+        collectors['db_queries'].labels(*labels).observe(state.db_queries)
+        collectors['db_time'].labels(*labels).observe(state.db_time)
+        collectors['serializer_time'].labels(*labels).observe(state.serializer_time)
+        if state.storage_read:
+            collectors['storage'].labels(*labels, 'read').inc(state.storage_read)
+        if state.storage_written:
+            collectors['storage'].labels(*labels, 'write').inc(state.storage_written)
+
+
+def server_timing(state):
+    """
+    Формирует значение заголовка Server-Timing по счётчикам запроса, длительности в миллисекундах.
+    """
+    return ', '.join((
+        f'app;dur={(time.perf_counter() - state.start) * 1000:.1f}',
+        f'db;dur={state.db_time * 1000:.1f};desc="{state.db_queries} queries"',
+        f'serializer;dur={state.serializer_time * 1000:.1f}',
+    ))
+
+
+def metrics_view(request):
+    """
+    Отдаёт метрики в текстовом формате Prometheus. При METRICS_TOKEN нужен заголовок
+    Authorization: Bearer <METRICS_TOKEN>; без токена метрики открыты только при METRICS_PUBLIC.
+
+    Args:
+        request (HttpRequest): HTTP запрос.
+
+    Returns:
+        HttpResponse: метрики или HTTP 403/404.
+    """
+    if not settings.METRICS_ENABLED:
+        return HttpResponse("Metrics are disabled", status=404)
+    if not settings.METRICS_TOKEN and not settings.METRICS_PUBLIC:
+        # Статистика маршрутов, базы и хранилища не должна быть открыта по умолчанию
+        return HttpResponse("Metrics token is not configured", status=404)
+    if settings.METRICS_TOKEN and not constant_time_compare(
+        request.headers.get('Authorization', ''), f'Bearer {settings.METRICS_TOKEN}'
+    ):
+        return HttpResponse("Forbidden", status=403)
+    prometheus = _prometheus()
+    registry = prometheus.REGISTRY
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        # Метрики всех процессов gunicorn собираются из файлов в общем каталоге
+        from prometheus_client import multiprocess
+        registry = prometheus.CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    return HttpResponse(prometheus.generate_latest(registry), content_type=prometheus.CONTENT_TYPE_LATEST)
@@ -0,0 +1,45 @@
+# Generated by Django 5.0.3 on 2026-10-18 12:06
+
+import django.db.models.deletion
+import mycloud.utils
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mycloud', '0005_alter_file_name'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UploadSession',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('name', models.CharField(max_length=255, verbose_name='Исходное название файла')),
+                ('comment', models.CharField(blank=True, max_length=500, null=True, verbose_name='Комментарий')),
+                ('size', models.PositiveBigIntegerField(verbose_name='Размер файла, байт')),
+                ('chunk_size', models.PositiveIntegerField(verbose_name='Размер части, байт')),
+                ('data_created', models.PositiveBigIntegerField(default=mycloud.utils.seconds_since_epoch, verbose_name='Дата создания')),
+                ('data_updated', models.PositiveBigIntegerField(default=mycloud.utils.seconds_since_epoch, verbose_name='Дата последней активности')),
+                ('creator', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL, verbose_name='ID пользователя')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='UploadChunk',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('index', models.PositiveIntegerField(verbose_name='Номер части')),
+                ('offset', models.PositiveBigIntegerField(verbose_name='Смещение, байт')),
+                ('size', models.PositiveIntegerField(verbose_name='Размер части, байт')),
+                ('session', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='chunks', to='mycloud.uploadsession')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='uploadchunk',
+            constraint=models.UniqueConstraint(fields=('session', 'index'), name='unique_upload_chunk'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.0.3 on 2026-10-18 12:08
+
+import django.db.models.deletion
+import mycloud.utils
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def fill_usage(apps, schema_editor):
+    File = apps.get_model('mycloud', 'File')
+    UserUsage = apps.get_model('mycloud', 'UserUsage')
+    rows = File.objects.values('creator').annotate(file_count=Count('id'), total_size=Sum('size'))
+    UserUsage.objects.bulk_create(
+        UserUsage(user_id=row['creator'], file_count=row['file_count'], total_size=int(row['total_size'] or 0))
+        for row in rows
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('mycloud', '0007_file_blobs'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserUsage',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='usage', serialize=False, to=settings.AUTH_USER_MODEL, verbose_name='ID пользователя')),
+                ('file_count', models.PositiveBigIntegerField(default=0, verbose_name='Количество файлов')),
+                ('total_size', models.PositiveBigIntegerField(default=0, verbose_name='Общий размер файлов, байт')),
+                ('last_activity', models.PositiveBigIntegerField(default=mycloud.utils.seconds_since_epoch, verbose_name='Дата последнего изменения')),
+            ],
+        ),
+        migrations.RunPython(fill_usage, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.0.3 on 2026-10-18 12:10
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mycloud', '0008_user_usage'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='file',
+            index=models.Index(fields=['creator', '-data_created', '-id'], name='file_creator_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='file',
+            index=models.Index(fields=['creator', 'name'], name='file_creator_name_idx', opclasses=['int4_ops', 'varchar_pattern_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='file',
+            index=models.Index(fields=['creator', 'size'], name='file_creator_size_idx'),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.0.3 on 2026-10-18 12:10
+
+import uuid
+
+import mycloud.utils
+from django.db import migrations, models
+
+
+def normalize_hashes(apps, schema_editor):
+    """
+    Заменяет значения hash, которые не являются UUID (например, 'HASH' из 0002), перед сменой типа колонки.
+    """
+    File = apps.get_model('mycloud', 'File')
+    for pk, value in File.objects.values_list('pk', 'hash').iterator():
+        try:
+            uuid.UUID(str(value))
+        except ValueError:
+            File.objects.filter(pk=pk).update(hash=str(mycloud.utils.generating_uuid()))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mycloud', '0009_file_list_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(normalize_hashes, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='file',
+            name='hash',
+            field=models.UUIDField(default=mycloud.utils.generating_uuid, unique=True, verbose_name='Название файла в хэш виде'),
+        ),
+        migrations.AlterField(
+            model_name='file',
+            name='size',
+            field=models.PositiveBigIntegerField(default=0, verbose_name='Размер файла, байт'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.3 on 2026-10-18 12:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mycloud', '0010_compact_file_columns'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='file',
+            name='download_count',
+            field=models.PositiveBigIntegerField(default=0, verbose_name='Количество скачиваний'),
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.0.3 on 2026-10-18 12:22
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def copy_blob_digests(apps, schema_editor):
+    """
+    Переносит хэш содержимого из Blob в файлы, загруженные с дедупликацией (в 0007 это был SHA-256).
+    """
+    Blob = apps.get_model('mycloud', 'Blob')
+    File = apps.get_model('mycloud', 'File')
+    File.objects.filter(blob__isnull=False).update(
+        digest=Subquery(Blob.objects.filter(pk=OuterRef('blob_id')).values('digest')[:1])
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mycloud', '0012_jobs'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='file',
+            name='digest',
+            field=models.CharField(blank=True, max_length=128, null=True, verbose_name='Хэш содержимого'),
+        ),
+        migrations.AddField(
+            model_name='uploadsession',
+            name='digest',
+            field=models.CharField(blank=True, max_length=128, null=True, verbose_name='Ожидаемый хэш содержимого'),
+        ),
+        migrations.AlterField(
+            model_name='blob',
+            name='digest',
+            field=models.CharField(max_length=128, unique=True, verbose_name='Хэш содержимого'),
+        ),
+        migrations.AddIndex(
+            model_name='file',
+            index=models.Index(fields=['creator', 'digest'], name='file_creator_digest_idx'),
+        ),
+        migrations.RunPython(copy_blob_digests, migrations.RunPython.noop),
+    ]
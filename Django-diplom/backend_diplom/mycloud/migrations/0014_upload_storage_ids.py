@@ -0,0 +1,23 @@
+# Generated by Django 5.0.3 on 2026-10-18 12:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mycloud', '0013_file_digest'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='uploadchunk',
+            name='etag',
+            field=models.CharField(blank=True, default='', max_length=255, verbose_name='ETag части в хранилище'),
+        ),
+        migrations.AddField(
+            model_name='uploadsession',
+            name='upload_id',
+            field=models.CharField(blank=True, default='', max_length=1024, verbose_name='ID загрузки в хранилище'),
+        ),
+    ]
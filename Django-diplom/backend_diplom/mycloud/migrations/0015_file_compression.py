@@ -0,0 +1,33 @@
+# Generated by Django 5.0.3 on 2026-10-18 12:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mycloud', '0014_upload_storage_ids'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='blob',
+            name='encoding',
+            field=models.CharField(blank=True, default='', max_length=16, verbose_name='Сжатие в хранилище'),
+        ),
+        migrations.AddField(
+            model_name='blob',
+            name='stored_size',
+            field=models.PositiveBigIntegerField(blank=True, null=True, verbose_name='Размер в хранилище, байт (пусто - совпадает с размером)'),
+        ),
+        migrations.AddField(
+            model_name='file',
+            name='encoding',
+            field=models.CharField(blank=True, default='', max_length=16, verbose_name='Сжатие в хранилище'),
+        ),
+        migrations.AddField(
+            model_name='file',
+            name='stored_size',
+            field=models.PositiveBigIntegerField(blank=True, null=True, verbose_name='Размер в хранилище, байт (пусто - совпадает с размером)'),
+        ),
+    ]
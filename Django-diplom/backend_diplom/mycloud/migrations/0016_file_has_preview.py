@@ -0,0 +1,18 @@
+# Generated by Django 5.0.3 on 2026-10-18 12:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mycloud', '0015_file_compression'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='file',
+            name='has_preview',
+            field=models.BooleanField(default=False, verbose_name='Есть превью'),
+        ),
+    ]
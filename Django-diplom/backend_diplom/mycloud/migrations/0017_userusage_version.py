@@ -0,0 +1,18 @@
+# Generated by Django 5.0.3 on 2026-10-18 12:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mycloud', '0016_file_has_preview'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userusage',
+            name='version',
+            field=models.PositiveBigIntegerField(default=0, verbose_name='Маркер изменений файлов и данных пользователя'),
+        ),
+    ]
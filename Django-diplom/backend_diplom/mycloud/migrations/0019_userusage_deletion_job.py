@@ -0,0 +1,19 @@
+# Generated by Django 5.0.3 on 2026-10-18 13:33
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mycloud', '0018_uploadsession_job'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userusage',
+            name='deletion_job',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='mycloud.job', verbose_name='Задача удаления пользователя'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+from django.db import migrations
+
+
+def create_index(apps, schema_editor):
+    """
+    Индекс для обхода записей File в порядке имён файлов (mycloud.reconcile.Reconciler.scan_rows).
+
+    Сортировка должна совпадать с побайтовой сортировкой запроса сверки, поэтому в PostgreSQL
+    индекс строится с COLLATE "C", а в остальных базах - с сортировкой колонки по умолчанию.
+    """
+    quote = schema_editor.quote_name
+    collation = ' COLLATE "C"' if schema_editor.connection.vendor == 'postgresql' else ''
+    schema_editor.execute(
+        f'CREATE INDEX {quote("file_stored_name_idx")} ON {quote("mycloud_file")} ({quote("file")}{collation}, {quote("id")})'
+    )
+
+
+def drop_index(apps, schema_editor):
+    quote = schema_editor.quote_name
+    if schema_editor.connection.vendor == 'mysql':
+        schema_editor.execute(f'DROP INDEX {quote("file_stored_name_idx")} ON {quote("mycloud_file")}')
+    else:
+        schema_editor.execute(f'DROP INDEX {quote("file_stored_name_idx")}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mycloud', '0019_userusage_deletion_job'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
@@ -1,9 +1,31 @@
+import uuid
+
 from django.conf import settings
 from django.db import models
 
 from mycloud.utils import user_directory_path, seconds_since_epoch, generating_uuid
 
 
+class Blob(models.Model):
+    """
+    Содержимое файла, хранящееся в одном экземпляре на каждый уникальный хэш.
+
+    Несколько записей File с одинаковым содержимым ссылаются на один Blob,
+    ref_count - количество таких ссылок.
+    """
+    digest = models.CharField(unique=True, max_length=128, verbose_name='Хэш содержимого')
+    file = models.FileField(max_length=255, verbose_name='Файл содержимого')
+    size = models.PositiveBigIntegerField(verbose_name='Размер, байт')
+    encoding = models.CharField(blank=True, default='', max_length=16, verbose_name='Сжатие в хранилище')
+    stored_size = models.PositiveBigIntegerField(
+        blank=True, null=True, verbose_name='Размер в хранилище, байт (пусто - совпадает с размером)'
+    )
+    ref_count = models.PositiveIntegerField(default=0, verbose_name='Количество ссылок')
+
+    def __str__(self):
+        return self.digest
+
+
 class File(models.Model):
     creator = models.ForeignKey(
         settings.AUTH_USER_MODEL,
@@ -12,11 +34,174 @@ class File(models.Model):
     )
     name = models.CharField(blank=True, null=True, max_length=255, verbose_name='Название файла')
     file = models.FileField(upload_to=user_directory_path, verbose_name='Сам файл')
-    size = models.DecimalField(default=0, max_digits=12, decimal_places=2, verbose_name='Размер файла, байт')
+    size = models.PositiveBigIntegerField(default=0, verbose_name='Размер файла, байт')
     data_created = models.PositiveBigIntegerField(default=seconds_since_epoch, verbose_name='Дата создания')
     date_download = models.PositiveBigIntegerField(blank=True, null=True, verbose_name='Дата крайнего скачивания')
+    download_count = models.PositiveBigIntegerField(default=0, verbose_name='Количество скачиваний')
     comment = models.CharField(blank=True, null=True, max_length=500, verbose_name='Комментарий')
-    hash = models.CharField(unique=True, default=generating_uuid, max_length=255, verbose_name='Название файла в хэш виде')
+    hash = models.UUIDField(unique=True, default=generating_uuid, verbose_name='Название файла в хэш виде')
+    digest = models.CharField(blank=True, null=True, max_length=128, verbose_name='Хэш содержимого')
+    encoding = models.CharField(blank=True, default='', max_length=16, verbose_name='Сжатие в хранилище')
+    stored_size = models.PositiveBigIntegerField(
+        blank=True, null=True, verbose_name='Размер в хранилище, байт (пусто - совпадает с размером)'
+    )
+    has_preview = models.BooleanField(default=False, verbose_name='Есть превью')
+    blob = models.ForeignKey(
+        Blob,
+        blank=True,
+        null=True,
+        on_delete=models.PROTECT,
+        related_name='files',
+        verbose_name='Содержимое файла'
+    )
+
+    class Meta:
+        indexes = [
+            # Списки файлов пользователя от новых к старым и курсорная пагинация по (data_created, id)
+            models.Index(fields=['creator', '-data_created', '-id'], name='file_creator_created_idx'),
+            # Фильтр по префиксу имени (LIKE 'abc%' в PostgreSQL требует pattern_ops);
+            # creator_id - integer, как первичный ключ auth.User (AutoField)
+            models.Index(
+                fields=['creator', 'name'], name='file_creator_name_idx', opclasses=['int4_ops', 'varchar_pattern_ops']
+            ),
+            # Фильтр по диапазону размера
+            models.Index(fields=['creator', 'size'], name='file_creator_size_idx'),
+            # Поиск уже загруженного пользователем содержимого по хэшу
+            models.Index(fields=['creator', 'digest'], name='file_creator_digest_idx'),
+        ]
 
     def __str__(self):
         return self.name
+
+
+class UploadSession(models.Model):
+    """
+    Сессия возобновляемой загрузки файла частями.
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    creator = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        verbose_name='ID пользователя'
+    )
+    name = models.CharField(max_length=255, verbose_name='Исходное название файла')
+    comment = models.CharField(blank=True, null=True, max_length=500, verbose_name='Комментарий')
+    size = models.PositiveBigIntegerField(verbose_name='Размер файла, байт')
+    digest = models.CharField(blank=True, null=True, max_length=128, verbose_name='Ожидаемый хэш содержимого')
+    chunk_size = models.PositiveIntegerField(verbose_name='Размер части, байт')
+    upload_id = models.CharField(blank=True, default='', max_length=1024, verbose_name='ID загрузки в хранилище')
+    job = models.ForeignKey(
+        'Job',
+        blank=True,
+        null=True,
+        on_delete=models.SET_NULL,
+        related_name='+',
+        verbose_name='Задача сборки файла'
+    )
+    data_created = models.PositiveBigIntegerField(default=seconds_since_epoch, verbose_name='Дата создания')
+    data_updated = models.PositiveBigIntegerField(default=seconds_since_epoch, verbose_name='Дата последней активности')
+
+    @property
+    def total_chunks(self):
+        return max(1, -(-self.size // self.chunk_size))
+
+    def __str__(self):
+        return f'{self.name} ({self.id})'
+
+
+class UploadChunk(models.Model):
+    """
+    Принятая часть файла в сессии загрузки.
+    """
+    session = models.ForeignKey(UploadSession, on_delete=models.CASCADE, related_name='chunks')
+    index = models.PositiveIntegerField(verbose_name='Номер части')
+    offset = models.PositiveBigIntegerField(verbose_name='Смещение, байт')
+    size = models.PositiveIntegerField(verbose_name='Размер части, байт')
+    etag = models.CharField(blank=True, default='', max_length=255, verbose_name='ETag части в хранилище')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=('session', 'index'), name='unique_upload_chunk'),
+        ]
+
+
+class UserUsage(models.Model):
+    """
+    Денормализованная статистика использования хранилища пользователем.
+
+    Обновляется в той же транзакции, что и создание или удаление файла (см. mycloud.usage),
+    сверяется с таблицей File командой rebuild_usage. version увеличивается при любом изменении
+    списка файлов пользователя или его данных и служит для ETag списков (см. mycloud.conditional).
+    deletion_job - поставленная задача удаления пользователя, пока она не выполнена,
+    пользователь скрыт из списка администратора.
+    """
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        primary_key=True,
+        on_delete=models.CASCADE,
+        related_name='usage',
+        verbose_name='ID пользователя'
+    )
+    file_count = models.PositiveBigIntegerField(default=0, verbose_name='Количество файлов')
+    total_size = models.PositiveBigIntegerField(default=0, verbose_name='Общий размер файлов, байт')
+    last_activity = models.PositiveBigIntegerField(default=seconds_since_epoch, verbose_name='Дата последнего изменения')
+    version = models.PositiveBigIntegerField(default=0, verbose_name='Маркер изменений файлов и данных пользователя')
+    deletion_job = models.ForeignKey(
+        'Job',
+        blank=True,
+        null=True,
+        on_delete=models.SET_NULL,
+        related_name='+',
+        verbose_name='Задача удаления пользователя'
+    )
+
+    def __str__(self):
+        return f'{self.user_id}: {self.file_count} files, {self.total_size} bytes'
+
+
+class Job(models.Model):
+    """
+    Фоновая задача в очереди на базе данных (см. mycloud.jobs).
+
+    Задачи выполняет команда run_jobs, при ошибке задача повторяется с нарастающей задержкой.
+    """
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = (
+        (PENDING, 'В очереди'),
+        (RUNNING, 'Выполняется'),
+        (DONE, 'Выполнена'),
+        (FAILED, 'Ошибка'),
+    )
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    kind = models.CharField(max_length=64, verbose_name='Тип задачи')
+    payload = models.JSONField(default=dict, verbose_name='Параметры')
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=PENDING, verbose_name='Статус')
+    creator = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        blank=True,
+        null=True,
+        on_delete=models.SET_NULL,
+        related_name='+',
+        verbose_name='ID пользователя'
+    )
+    attempts = models.PositiveIntegerField(default=0, verbose_name='Количество попыток')
+    max_attempts = models.PositiveIntegerField(default=5, verbose_name='Максимум попыток')
+    run_after = models.PositiveBigIntegerField(default=seconds_since_epoch, verbose_name='Не раньше')
+    locked_at = models.PositiveBigIntegerField(blank=True, null=True, verbose_name='Дата захвата воркером')
+    result = models.JSONField(blank=True, null=True, verbose_name='Результат')
+    last_error = models.TextField(blank=True, default='', verbose_name='Последняя ошибка')
+    data_created = models.PositiveBigIntegerField(default=seconds_since_epoch, verbose_name='Дата создания')
+    data_updated = models.PositiveBigIntegerField(default=seconds_since_epoch, verbose_name='Дата изменения')
+
+    class Meta:
+        indexes = [
+            # Выбор следующей задачи воркером: статус и время, с которого задачу можно выполнять
+            models.Index(fields=['status', 'run_after'], name='job_status_run_after_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.kind} ({self.id}): {self.status}'
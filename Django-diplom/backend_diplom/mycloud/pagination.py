@@ -0,0 +1,32 @@
+from django.conf import settings
+from rest_framework.pagination import CursorPagination
+
+
+class CappedCursorPagination(CursorPagination):
+    """
+    Курсорная (keyset) пагинация, включённая по умолчанию.
+
+    Без параметров отдаётся первая страница из API_PAGE_SIZE записей и ссылка next на следующую,
+    ?page_size= меняет размер страницы, но не больше API_MAX_PAGE_SIZE. Поэтому один запрос
+    не выбирает весь список, сколько бы записей в нём ни было.
+    """
+    page_size_query_param = 'page_size'
+
+    def get_page_size(self, request):
+        self.page_size = settings.API_PAGE_SIZE
+        self.max_page_size = settings.API_MAX_PAGE_SIZE
+        return min(super().get_page_size(request), self.max_page_size)
+
+
+class UserCursorPagination(CappedCursorPagination):
+    """
+    Пагинация списка пользователей по id.
+    """
+    ordering = 'id'
+
+
+class FileCursorPagination(CappedCursorPagination):
+    """
+    Пагинация списков файлов от новых к старым, по (data_created, id).
+    """
+    ordering = ('-data_created', '-id')
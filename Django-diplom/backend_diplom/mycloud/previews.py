@@ -0,0 +1,183 @@
+"""
+Превью файлов для списка в интерфейсе (PREVIEW_*).
+
+Превью строится фоновой задачей generate_preview после загрузки и сохраняется в хранилище
+рядом с содержимым: previews/<имя файла в хранилище>.jpg. Файлы с общим содержимым (Blob)
+получают одно превью, при удалении содержимого превью удаляется вместе с ним.
+"""
+
+import io
+import logging
+import mimetypes
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+
+from .compression import open_stored
+from .jobs import enqueue
+from .models import File
+from .usage import mark_files_changed
+
+logger = logging.getLogger('mycloud')
+
+PREVIEWS_DIRECTORY = 'previews'
+PREVIEW_CONTENT_TYPE = 'image/jpeg'
+PDF_CONTENT_TYPE = 'application/pdf'
+
+
+def _pillow():
+    try:
+        from PIL import Image, ImageOps
+    except ImportError:
+        return None
+    return Image, ImageOps
+
+
+def _pdfium():
+    try:
+        import pypdfium2
+    except ImportError:
+        return None
+    return pypdfium2
+
+
+def preview_name(name):
+    """
+    Возвращает имя превью в хранилище для файла содержимого name.
+    """
+    return f'{PREVIEWS_DIRECTORY}/{name}.jpg'
+
+
+def previewable(file_name):
+    """
+    Проверяет по имени файла, можно ли построить для него превью установленными библиотеками.
+
+    Args:
+        file_name (str): имя файла пользователя.
+
+    Returns:
+        bool: True для изображений и PDF (если установлен pypdfium2).
+    """
+    if not settings.PREVIEW_ENABLED or _pillow() is None:
+        return False
+    content_type, _ = mimetypes.guess_type(file_name or '')
+    if content_type == PDF_CONTENT_TYPE:
+        return _pdfium() is not None
+    return bool(content_type) and content_type.startswith('image/')
+
+
+def schedule_preview(file_obj):
+    """
+    Ставит в очередь построение превью нового файла, если для него превью возможно.
+
+    Args:
+        file_obj (File): созданный файл.
+    """
+    if previewable(file_obj.name):
+        enqueue('generate_preview', {'file_id': file_obj.id})
+
+
+def _flatten(image, Image):
+    # JPEG без прозрачности: прозрачные области заливаются белым
+    if image.mode in ('RGBA', 'LA', 'P'):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, 'white')
+        background.paste(image, mask=image.getchannel('A'))
+        return background
+    return image.convert('RGB')
+
+
+def render_preview(file, file_name):
+    """
+    Строит превью: изображение или первая страница PDF, уменьшенные до PREVIEW_SIZE по большей стороне.
+
+    Args:
+        file: файлоподобный объект с поддержкой seek с содержимым файла.
+        file_name (str): имя файла пользователя, по нему определяется тип.
+
+    Returns:
+        bytes: превью в формате JPEG.
+    """
+    Image, ImageOps = _pillow()
+    size = settings.PREVIEW_SIZE
+    content_type, _ = mimetypes.guess_type(file_name or '')
+    if content_type == PDF_CONTENT_TYPE:
+        document = _pdfium().PdfDocument(file)
+        try:
+            page = document[0]
+            width, height = page.get_size()
+            image = page.render(scale=size / max(width, height)).to_pil()
+        finally:
+            document.close()
+    else:
+        image = Image.open(file)
+        # Декодер JPEG сразу уменьшает изображение кратно 2, не раскрывая его в память целиком
+        image.draft('RGB', (size, size))
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((size, size))
+    output = io.BytesIO()
+    _flatten(image, Image).save(output, 'JPEG', quality=settings.PREVIEW_QUALITY, optimize=True)
+    return output.getvalue()
+
+
+def generate_preview(file_id):
+    """
+    Строит и сохраняет превью файла, если его ещё нет, и отмечает has_preview у всех файлов
+    с тем же содержимым.
+
+    Args:
+        file_id (int): ID файла.
+
+    Returns:
+        bool: True, если превью есть.
+    """
+    file_obj = File.objects.filter(pk=file_id).only('id', 'name', 'file', 'size', 'encoding').first()
+    if file_obj is None or not previewable(file_obj.name):
+        return False
+    name = str(file_obj.file)
+    target = preview_name(name)
+    if not default_storage.exists(target):
+        if file_obj.size > settings.PREVIEW_MAX_SOURCE_SIZE:
+            logger.info(f'Preview skipped for file {file_id}: {file_obj.size} bytes')
+            return False
+        try:
+            file = open_stored(name, file_obj.encoding)
+        except FileNotFoundError:
+            logger.warning(f'Preview skipped for file {file_id}: content is missing at {name}')
+            return False
+        with file:
+            # Декодерам нужен seek, распаковываемый поток читается в память (не больше PREVIEW_MAX_SOURCE_SIZE)
+            source = file if file.seekable() else io.BytesIO(file.read())
+            try:
+                data = render_preview(source, file_obj.name)
+            except Exception as e:
+                # Повреждённый или неподдерживаемый файл: повтор задачи не поможет
+                logger.warning(f'Preview failed for file {file_id}: {e!r}')
+                return False
+        # Превью того же содержимого могла успеть сохранить параллельная задача
+        if not default_storage.exists(target):
+            default_storage.save(target, ContentFile(data))
+            logger.info(f'Preview stored for file {file_id} ({len(data)} bytes)')
+    files = File.objects.filter(file=name, has_preview=False)
+    with transaction.atomic():
+        # Маркер меняется до update, пока фильтр has_preview=False ещё находит файлы
+        mark_files_changed(files)
+        files.update(has_preview=True)
+    return True
+
+
+def delete_preview(name):
+    """
+    Удаляет превью содержимого name, если оно есть.
+    """
+    default_storage.delete(preview_name(name))
+
+
+def move_preview(old_name, new_name):
+    """
+    Переносит превью вслед за содержимым при смене имени файла в хранилище.
+    """
+    if default_storage.exists(preview_name(old_name)):
+        default_storage.move(preview_name(old_name), preview_name(new_name))
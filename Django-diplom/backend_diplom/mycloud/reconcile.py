@@ -0,0 +1,225 @@
+import os
+import json
+import logging
+from itertools import islice
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from django.db.models import Count, F, Q
+from django.db.models.functions import Collate
+
+from .backends import local_path
+from .models import Blob, File
+from .previews import PREVIEWS_DIRECTORY
+from .storage import delete_files, remove_contents
+from .uploads import UPLOADS_DIRECTORY
+from .utils import seconds_since_epoch
+
+logger = logging.getLogger('mycloud')
+
+ORPHAN_FILE = 'orphan_file'
+DANGLING_ROW = 'dangling_row'
+BLOB_REFS = 'blob_refs'
+
+PHASES = ('files', 'rows', 'blobs')
+
+# Каталоги верхнего уровня хранилища, которыми управляют другие механизмы
+EXCLUDED_DIRECTORIES = {UPLOADS_DIRECTORY, PREVIEWS_DIRECTORY}
+
+# Побайтовая сортировка имён в базе, совпадающая с порядком обхода хранилища (ключи S3 сортируются
+# по UTF-8); в SQLite она по умолчанию, индекс file_stored_name_idx создаётся с той же сортировкой
+BINARY_COLLATIONS = {'postgresql': 'C'}
+
+
+class UnsafeRepairError(Exception):
+    """
+    Исправление отменено: в пачке слишком много записей без файлов (хранилище недоступно или не смонтировано).
+    """
+
+
+def _batched(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+class Reconciler:
+    """
+    Сверка хранилища (default_storage) с таблицами File и Blob.
+
+    Проверки выполняются по очереди и пачками фиксированного размера, поэтому память
+    не зависит от количества файлов:
+
+    - files: файлы в хранилище без записи File или Blob (обход iter_files, по одному запросу на пачку);
+    - rows: записи File без файла в хранилище (в порядке имён, сверяются со списком файлов хранилища);
+    - blobs: записи Blob, у которых счётчик ссылок не совпадает с количеством File.
+
+    После каждой пачки позиция сохраняется в файл checkpoint, прерванная сверка продолжается с неё.
+    """
+
+    def __init__(self, repair=False, batch_size=None, grace_period=None, checkpoint=None, report=None,
+                 max_missing=None, force=False):
+        self.repair = repair
+        self.max_missing = settings.RECONCILE_MAX_MISSING if max_missing is None else max_missing
+        self.force = force
+        self.batch_size = batch_size or settings.RECONCILE_BATCH_SIZE
+        self.grace_period = settings.RECONCILE_GRACE_PERIOD if grace_period is None else grace_period
+        self.checkpoint = checkpoint
+        self.report = report or (lambda kind, detail: None)
+        self.summary = {ORPHAN_FILE: 0, DANGLING_ROW: 0, BLOB_REFS: 0}
+
+    def run(self):
+        """
+        Выполняет сверку с сохранённой позиции до конца.
+
+        Returns:
+            dict: количество найденных расхождений каждого вида.
+        """
+        state = self.load_checkpoint()
+        start = PHASES.index(state['phase']) if state else 0
+        for index, phase in enumerate(PHASES[start:], start):
+            position = state['position'] if state and index == start else None
+            getattr(self, f'scan_{phase}')(position)
+        self.clear_checkpoint()
+        return self.summary
+
+    def scan_files(self, after=None):
+        """
+        Ищет файлы в хранилище, на которые не ссылается ни одна запись File или Blob.
+        Недавно изменённые файлы пропускаются: они могут принадлежать загрузке, которая ещё не завершилась.
+        """
+        deadline = seconds_since_epoch() - self.grace_period
+        files = default_storage.iter_files(after, EXCLUDED_DIRECTORIES)
+        for batch in _batched(files, self.batch_size):
+            names = [name for name, _ in batch]
+            known = set(File.objects.filter(file__in=names).values_list('file', flat=True))
+            known.update(Blob.objects.filter(file__in=names).values_list('file', flat=True))
+            for name, modified in batch:
+                if name in known or modified > deadline:
+                    continue
+                self._found(ORPHAN_FILE, name)
+                if self.repair:
+                    default_storage.delete(name)
+            self.save_checkpoint('files', names[-1])
+
+    def scan_rows(self, after=None):
+        """
+        Ищет записи File, файла которых нет в хранилище. При исправлении записи удаляются
+        вместе с изменением счётчиков использования и ссылок на Blob.
+
+        Записи выбираются в порядке имён файлов, поэтому пачка записей сверяется с одним
+        обходом iter_files по её диапазону имён (в S3 - постраничный список ключей), а не
+        запросом к хранилищу на каждую запись. Если без файла осталось больше доли max_missing
+        записей пачки, исправление отменяется до удаления: так выглядит недоступное хранилище,
+        а не потерянные файлы.
+
+        Raises:
+            UnsafeRepairError: если при исправлении без force в пачке слишком много записей без файлов.
+        """
+        collation = BINARY_COLLATIONS.get(connection.vendor)
+        files = File.objects.annotate(stored_name=Collate('file', collation) if collation else F('file'))
+        # Позиция прошлых версий (число, по первичному ключу) не подходит к порядку имён
+        last_name, last_id = after if isinstance(after, list) else (None, 0)
+        while True:
+            queryset = files
+            if last_name is not None:
+                queryset = files.filter(Q(stored_name__gt=last_name) | Q(stored_name=last_name, pk__gt=last_id))
+            rows = list(queryset.order_by('stored_name', 'pk').values_list('id', 'file')[:self.batch_size])
+            if not rows:
+                break
+            absent = self._missing_names([name for _, name in rows if name])
+            missing = [file_id for file_id, name in rows if not name or name in absent]
+            if self.repair and not self.force and len(missing) > max(1, self.max_missing * len(rows)):
+                raise UnsafeRepairError(
+                    f'{len(missing)} of {len(rows)} rows have no file in storage, refusing to repair without force'
+                )
+            for file_id in missing:
+                self._found(DANGLING_ROW, file_id)
+            if self.repair and missing:
+                _, contents = delete_files(File.objects.filter(pk__in=missing))
+                remove_contents(contents)
+            last_id, last_name = rows[-1]
+            self.save_checkpoint('rows', [last_name, last_id])
+
+    def _missing_names(self, names):
+        """
+        Возвращает имена из пачки, которых нет в хранилище.
+
+        Хранилище обходится один раз от первого до последнего имени пачки. Обход локального диска
+        идёт по компонентам пути и в редких случаях расходится с побайтовым порядком, поэтому
+        не встреченные в обходе имена на диске перепроверяются по одному (stat без обращения к сети).
+        """
+        if not names:
+            return set()
+        remaining = set(names)
+        last = max(remaining)
+        first = min(remaining)
+        for name, _ in default_storage.iter_files(first[:-1] or None, EXCLUDED_DIRECTORIES):
+            if name > last:
+                break
+            remaining.discard(name)
+            if not remaining:
+                break
+        if local_path(first) is None:
+            # Список ключей S3 отсортирован побайтово, как и имена пачки
+            return remaining
+        return {name for name in remaining if not default_storage.exists(name)}
+
+    def scan_blobs(self, after=None):
+        """
+        Ищет записи Blob со счётчиком ссылок, не совпадающим с количеством File.
+        При исправлении счётчик пересчитывается под блокировкой, Blob без ссылок удаляется.
+        """
+        last_id = after or 0
+        while True:
+            rows = list(
+                Blob.objects.filter(pk__gt=last_id).order_by('pk').annotate(refs=Count('files'))
+                .values_list('id', 'ref_count', 'refs')[:self.batch_size]
+            )
+            if not rows:
+                break
+            for blob_id, ref_count, refs in rows:
+                if ref_count == refs:
+                    continue
+                self._found(BLOB_REFS, f'{blob_id}: {ref_count} != {refs}')
+                if self.repair:
+                    self._repair_blob(blob_id)
+            last_id = rows[-1][0]
+            self.save_checkpoint('blobs', last_id)
+
+    def _repair_blob(self, blob_id):
+        with transaction.atomic():
+            blob = Blob.objects.select_for_update().filter(pk=blob_id).first()
+            if blob is None:
+                return
+            refs = blob.files.count()
+            if refs:
+                Blob.objects.filter(pk=blob_id).update(ref_count=refs)
+                return
+            blob.delete()
+            default_storage.delete(blob.file.name)
+
+    def _found(self, kind, detail):
+        self.summary[kind] += 1
+        self.report(kind, detail)
+
+    def load_checkpoint(self):
+        if not self.checkpoint or not os.path.isfile(self.checkpoint):
+            return None
+        with open(self.checkpoint) as file:
+            state = json.load(file)
+        logger.info(f'Resuming reconciliation from {state}')
+        return state
+
+    def save_checkpoint(self, phase, position):
+        if not self.checkpoint:
+            return
+        temporary = f'{self.checkpoint}.tmp'
+        with open(temporary, 'w') as file:
+            json.dump({'phase': phase, 'position': position}, file)
+        os.replace(temporary, self.checkpoint)
+
+    def clear_checkpoint(self):
+        if self.checkpoint and os.path.isfile(self.checkpoint):
+            os.remove(self.checkpoint)
@@ -0,0 +1,31 @@
+"""
+Быстрый JSON-рендерер ответов API на orjson.
+
+orjson сериализует списки словарей из FileReadSerializer и UserSerializer в несколько раз
+быстрее json из стандартной библиотеки и сразу возвращает bytes. Типы, которых orjson не знает
+(Decimal, ленивые строки перевода, даты), передаются кодировщику DRF, поэтому ответ совпадает
+с JSONRenderer. Без установленного orjson используется JSONRenderer.
+"""
+
+from rest_framework.renderers import JSONRenderer
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class ORJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer, кодирующий ответ через orjson. Параметр indent в Accept даёт отступ в 2 пробела.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None:
+            return super().render(data, accepted_media_type, renderer_context)
+        if data is None:
+            return b''
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+        if self.get_indent(accepted_media_type, renderer_context or {}):
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(data, default=self.encoder_class().default, option=option)
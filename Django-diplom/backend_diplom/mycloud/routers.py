@@ -0,0 +1,172 @@
+"""
+Чтение из реплики базы данных для представлений только на чтение (DB_REPLICA_*).
+
+По умолчанию все запросы идут в основную базу. Представление, которому подходят данные
+с задержкой репликации (списки файлов и пользователей, поиск файла для скачивания), вызывает
+read_from_replica, и чтения до конца запроса уходят в реплику. Запись всегда идёт в основную
+базу, и после первой записи чтения того же запроса тоже возвращаются в неё.
+
+Чтобы пользователь сразу видел свою загрузку или удаление (read-your-writes), после запроса
+с записью ReplicaMiddleware на DB_REPLICA_STICKY_SECONDS закрепляет клиента за основной базой:
+cookie для браузера (работает с любым количеством процессов) и запись в кэше приложения
+для пользователя (клиенты API без cookie; с локальным кэшем - в пределах процесса).
+"""
+
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import DEFAULT_DB_ALIAS
+
+from .cache import get_cache
+
+PRIMARY_COOKIE = 'mycloud_primary'
+PRIMARY_KEY = 'db-primary:{0}'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+_state = ContextVar('mycloud_db_routing', default=None)
+
+
+class RoutingState:
+    """
+    Маршрутизация запросов к базе в пределах одного HTTP запроса.
+    """
+    __slots__ = ('replica', 'written')
+
+    def __init__(self):
+        self.replica = False
+        self.written = False
+
+
+def _pinned_by_cookie(request):
+    try:
+        return int(request.COOKIES.get(PRIMARY_COOKIE, 0)) > time.time()
+    except ValueError:
+        return False
+
+
+def read_from_replica(request, user=None):
+    """
+    Направляет чтения текущего запроса в реплику, если она настроена и клиент
+    или пользователь недавно не писал в базу.
+
+    Args:
+        request (HttpRequest): HTTP запрос.
+        user (User): аутентифицированный пользователь, если известен.
+
+    Returns:
+        bool: True, если чтения пойдут в реплику.
+    """
+    state = _state.get()
+    if state is None or not settings.DB_REPLICA_ALIAS or _pinned_by_cookie(request):
+        return False
+    if user is not None and user.is_authenticated and get_cache().get(PRIMARY_KEY.format(user.pk)):
+        return False
+    state.replica = True
+    return True
+
+
+def read_from_primary():
+    """
+    Возвращает чтения текущего запроса в основную базу, например для повторного поиска
+    только что созданной записи, которой ещё нет в реплике.
+
+    Returns:
+        bool: True, если до этого чтения шли в реплику.
+    """
+    state = _state.get()
+    if state is None or not state.replica:
+        return False
+    state.replica = False
+    return True
+
+
+class ReplicaRouter:
+    """
+    Роутер базы данных: запись и чтение по умолчанию - в основную базу, чтение в представлениях,
+    вызвавших read_from_replica, - в реплику DB_REPLICA_ALIAS.
+    """
+
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        if state is not None and state.replica and not state.written and settings.DB_REPLICA_ALIAS:
+            return settings.DB_REPLICA_ALIAS
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            state.written = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Реплика содержит те же данные, что и основная база
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Схема реплики приходит репликацией из основной базы
+        if db == settings.DB_REPLICA_ALIAS:
+            return False
+        return None
+
+
+class ReplicaMiddleware:
+    """
+    Middleware маршрутизации чтений. Отключается, если реплика не настроена.
+
+    После запроса с записью (не GET/HEAD/OPTIONS) закрепляет клиента и пользователя
+    за основной базой на DB_REPLICA_STICKY_SECONDS.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.DB_REPLICA_ALIAS:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        state = RoutingState()
+        token = _state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            # Состояние не должно остаться у потока для кода вне запросов
+            _state.reset(token)
+        if self._wrote(request, state):
+            self.pin(request, response)
+        return response
+
+    async def __acall__(self, request):
+        state = RoutingState()
+        token = _state.set(state)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _state.reset(token)
+        if self._wrote(request, state):
+            # request.user может быть ленивым объектом сессии, который загружается из базы
+            await sync_to_async(self.pin)(request, response)
+        return response
+
+    @staticmethod
+    def _wrote(request, state):
+        return state.written and request.method not in SAFE_METHODS
+
+    def pin(self, request, response):
+        """
+        Закрепляет клиента и пользователя за основной базой на время задержки репликации.
+        """
+        sticky = settings.DB_REPLICA_STICKY_SECONDS
+        response.set_cookie(
+            PRIMARY_COOKIE, str(int(time.time()) + sticky), max_age=sticky, httponly=True, samesite='Lax',
+        )
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_authenticated:
+            get_cache().set(PRIMARY_KEY.format(user.pk), True, sticky)
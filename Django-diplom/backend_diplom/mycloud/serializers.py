@@ -1,17 +1,57 @@
+from django.conf import settings
 from django.contrib.auth.models import User
-from django.db.models import Sum
+from django.core.files.storage import default_storage
+from django.db import transaction
 from djoser.serializers import UserCreateSerializer, TokenSerializer
 from rest_framework import serializers
 
-from .models import File
-from .utils import seconds_since_epoch
+from .models import File, Job, UploadSession
+from .compression import choose_encoding
+from .metrics import serializer_timer
+from .previews import schedule_preview
+from .storage import acquire_blob, place_content, uploaded_file_digest
+from .usage import quota_exceeded, record_usage
+from .utils import build_unique_name, is_valid_digest, user_directory_path
 
-class UserSerializer(serializers.ModelSerializer):
+def validate_digest_value(value):
+    """
+    Проверяет формат хэша содержимого, переданного клиентом.
+
+    Args:
+        value (str): хэш в шестнадцатеричном виде.
+
+    Returns:
+        str: хэш в нижнем регистре.
+
+    Raises:
+        serializers.ValidationError: если строка не похожа на хэш FILE_DIGEST_ALGORITHM.
+    """
+    if not value:
+        return None
+    value = value.lower()
+    if not is_valid_digest(value):
+        raise serializers.ValidationError(f"Ожидается хэш {settings.FILE_DIGEST_ALGORITHM} в шестнадцатеричном виде.")
+    return value
+
+class TimedSerializerMixin:
+    """
+    Учитывает время сериализации ответа в метриках запроса (mycloud.metrics).
+    """
+
+    def to_representation(self, instance):
+        with serializer_timer():
+            return super().to_representation(instance)
+
+class UserSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """
     Сериализатор для получения всех пользователей.
 
     - total_files: количество файлов пользователя.
     - total_size: общий размер всех файлов пользователя.
+
+    Значения берутся из аннотаций queryset, если они есть, иначе из счётчиков UserUsage
+    (для списка их нужно подгрузить через select_related('usage')). Пользователь без записи
+    UserUsage ещё не загружал файлов.
     """
     total_files = serializers.SerializerMethodField()
     total_size = serializers.SerializerMethodField()
@@ -30,7 +70,11 @@ class UserSerializer(serializers.ModelSerializer):
         Returns:
             int: количество файлов пользователя.
         """
-        return File.objects.filter(creator=obj).count()
+        total_files = getattr(obj, 'total_files', None)
+        if total_files is None:
+            usage = getattr(obj, 'usage', None)
+            total_files = usage.file_count if usage else 0
+        return total_files
 
     def get_total_size(self, obj):
         """
@@ -42,36 +86,81 @@ class UserSerializer(serializers.ModelSerializer):
         Returns:
             int: общий размер файлов пользователя.
         """
-        return File.objects.filter(creator=obj).aggregate(total_size=Sum('size'))['total_size'] or 0
+        if hasattr(obj, 'total_size'):
+            return obj.total_size or 0
+        usage = getattr(obj, 'usage', None)
+        return usage.total_size if usage else 0
+
+class SparseFieldsMixin:
+    """
+    Оставляет в ответе только поля, перечисленные в параметре запроса fields (?fields=id,name).
+    """
 
-class FileReadSerializer(serializers.ModelSerializer):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+        requested = request.query_params.get('fields') if request is not None else None
+        if requested:
+            allowed = set(requested.split(','))
+            for field_name in set(self.fields) - allowed:
+                self.fields.pop(field_name)
+
+class FileReadSerializer(TimedSerializerMixin, SparseFieldsMixin, serializers.ModelSerializer):
     """
     Сериализатор для чтения данных из таблицы File.
 
-    - fields: перечисление полей модели File для чтения.
+    - fields: перечисление полей модели File для чтения, может быть сужено параметром запроса fields.
     """
     # creator = serializers.HiddenField(default=serializers.CurrentUserDefault())
 
     class Meta:
         model = File
-        fields = ('id', 'name', 'size', 'data_created', 'date_download', 'comment', 'hash')
+        fields = ('id', 'name', 'size', 'data_created', 'date_download', 'download_count', 'comment', 'hash', 'digest',
+                  'stored_size', 'has_preview')
 
-class FileWriteSerializer(serializers.ModelSerializer):
+class FileWriteSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """
     Сериализатор для создания и обновления файлов в таблице File.
 
     - creator: скрытое поле, устанавливающее текущего пользователя.
+    - digest: хэш содержимого, посчитанный при приёме загрузки. Если клиент передал свой хэш,
+      загрузка принимается, только если они совпадают.
     """
     creator = serializers.HiddenField(default=serializers.CurrentUserDefault())
+    digest = serializers.CharField(required=False, max_length=128)
 
     class Meta:
         model = File
-        fields = ('id', 'creator', 'name', 'file', 'size', 'data_created', 'date_download', 'comment', 'hash')
+        fields = ('id', 'creator', 'name', 'file', 'size', 'data_created', 'date_download', 'comment', 'hash', 'digest')
+
+    def validate_digest(self, value):
+        return validate_digest_value(value)
+
+    def validate_file(self, value):
+        """
+        Проверяет, что загрузка не превысит квоту пользователя.
+
+        Args:
+            value (UploadedFile): загруженный файл.
+
+        Returns:
+            UploadedFile: проверенный файл.
+
+        Raises:
+            serializers.ValidationError: если квота USER_STORAGE_QUOTA будет превышена.
+        """
+        if quota_exceeded(self.context['request'].user.id, value.size):
+            raise serializers.ValidationError("Превышена квота хранилища.")
+        return value
 
     def create(self, validated_data):
         """
         Создаёт объект File с автоматическим установлением поля size и добавлением расширения файла, если его нет.
 
+        При включённой FILE_DEDUPLICATION содержимое сохраняется как Blob по хэшу,
+        посчитанному при приёме загрузки, и одинаковые файлы хранятся в хранилище один раз.
+        При FILE_COMPRESSION сжимаемое содержимое сохраняется сжатым, size остаётся исходным размером.
+
         Args:
             validated_data (dict): валидированные данные для создания объекта File.
 
@@ -80,24 +169,49 @@ class FileWriteSerializer(serializers.ModelSerializer):
         """
         file = validated_data['file']
         validated_data['size'] = file.size
-
-        original_name = file.name
-
-        name_parts = original_name.rsplit('.', 1)
-        if len(name_parts) == 2:
-            name, extension = name_parts
-        else:
-            name = name_parts[0]
-            extension = ''
-
-        if not extension:
-            extension = 'bin'
-
-        unique_name = f"{seconds_since_epoch()}_{name}.{extension}"
+        # Хэш посчитан обработчиком загрузки в том же проходе, в котором файл принимался
+        digest = uploaded_file_digest(file)
+        expected = validated_data.pop('digest', None)
+        if expected and expected != digest:
+            raise serializers.ValidationError({'digest': "Хэш содержимого не совпадает с переданным."})
+        validated_data['digest'] = digest
+
+        unique_name = build_unique_name(file.name)
         validated_data['name'] = unique_name
         validated_data['file'].name = unique_name
 
-        return super(FileWriteSerializer, self).create(validated_data)
+        with transaction.atomic():
+            if settings.FILE_DEDUPLICATION:
+                blob = acquire_blob(digest, file.size, file)
+                validated_data['blob'] = blob
+                validated_data['file'] = blob.file.name
+                validated_data['encoding'] = blob.encoding
+                validated_data['stored_size'] = blob.stored_size
+            elif encoding := choose_encoding(file, file.size):
+                name = default_storage.get_available_name(
+                    user_directory_path(File(creator=validated_data['creator']), unique_name)
+                )
+                validated_data['file'], validated_data['stored_size'] = place_content(file, name, encoding)
+                validated_data['encoding'] = encoding
+
+            instance = super(FileWriteSerializer, self).create(validated_data)
+            record_usage(instance.creator_id, files=1, size=instance.size)
+            schedule_preview(instance)
+        return instance
+
+    def update(self, instance, validated_data):
+        """
+        Обновляет объект File. Хэш содержимого не меняется.
+
+        Args:
+            instance (File): объект File.
+            validated_data (dict): валидированные данные.
+
+        Returns:
+            File: обновлённый объект File.
+        """
+        validated_data.pop('digest', None)
+        return super().update(instance, validated_data)
 
     def to_representation(self, instance):
         """
@@ -114,6 +228,109 @@ class FileWriteSerializer(serializers.ModelSerializer):
             representation.pop('file', None)
         return representation
 
+class FileUpdateSerializer(FileWriteSerializer):
+    """
+    Сериализатор для изменения файла: клиент меняет только имя и комментарий.
+
+    Содержимое, размер, хэш содержимого и ссылка на скачивание задаются при загрузке,
+    от них зависят счётчики использования хранилища и кэш скачиваний, поэтому они только для чтения.
+    """
+    digest = serializers.CharField(read_only=True)
+
+    class Meta(FileWriteSerializer.Meta):
+        read_only_fields = ('file', 'size', 'hash')
+
+class UploadSessionSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    """
+    Сериализатор сессии возобновляемой загрузки.
+
+    - creator: скрытое поле, устанавливающее текущего пользователя.
+    - total_chunks: количество частей, на которые разбит файл.
+    - received_chunks: номера уже принятых частей.
+    - digest: необязательный хэш содержимого; по нему собранный файл проверяется при завершении загрузки.
+    - job: ID задачи сборки файла после запроса завершения загрузки.
+    """
+    creator = serializers.HiddenField(default=serializers.CurrentUserDefault())
+    chunk_size = serializers.IntegerField(required=False)
+    total_chunks = serializers.IntegerField(read_only=True)
+    received_chunks = serializers.SerializerMethodField()
+
+    class Meta:
+        model = UploadSession
+        fields = ('id', 'creator', 'name', 'comment', 'size', 'digest', 'chunk_size', 'total_chunks', 'received_chunks',
+                  'job', 'data_created', 'data_updated')
+        read_only_fields = ('job', 'data_created', 'data_updated')
+
+    def validate_size(self, value):
+        """
+        Проверяет размер файла до выделения места под промежуточный файл в хранилище:
+        размер не больше UPLOAD_MAX_SIZE, и загрузка не превысит квоту пользователя.
+
+        Args:
+            value (int): размер файла в байтах.
+
+        Returns:
+            int: проверенный размер.
+
+        Raises:
+            serializers.ValidationError: если размер больше UPLOAD_MAX_SIZE
+                или квота USER_STORAGE_QUOTA будет превышена.
+        """
+        if settings.UPLOAD_MAX_SIZE and value > settings.UPLOAD_MAX_SIZE:
+            raise serializers.ValidationError(f"Размер файла должен быть не больше {settings.UPLOAD_MAX_SIZE} байт.")
+        if quota_exceeded(self.context['request'].user.id, value):
+            raise serializers.ValidationError("Превышена квота хранилища.")
+        return value
+
+    def validate_digest(self, value):
+        return validate_digest_value(value)
+
+    def validate_chunk_size(self, value):
+        """
+        Проверяет, что размер части лежит в допустимых пределах
+        и не меньше минимальной части загрузки в хранилище (5 МБ для S3).
+
+        Args:
+            value (int): размер части в байтах.
+
+        Returns:
+            int: проверенный размер части.
+
+        Raises:
+            serializers.ValidationError: если размер части вне пределов.
+        """
+        minimum = max(settings.UPLOAD_MIN_CHUNK_SIZE, default_storage.min_upload_part_size)
+        if not minimum <= value <= settings.UPLOAD_MAX_CHUNK_SIZE:
+            raise serializers.ValidationError(
+                f"Размер части должен быть от {minimum} до {settings.UPLOAD_MAX_CHUNK_SIZE} байт."
+            )
+        return value
+
+    def create(self, validated_data):
+        """
+        Создаёт сессию загрузки с размером части по умолчанию, если клиент его не указал.
+
+        Args:
+            validated_data (dict): валидированные данные для создания объекта UploadSession.
+
+        Returns:
+            UploadSession: созданная сессия.
+        """
+        validated_data.setdefault('chunk_size', settings.UPLOAD_CHUNK_SIZE)
+        return super().create(validated_data)
+
+    def get_received_chunks(self, obj):
+        """
+        Возвращает номера принятых частей.
+
+        Args:
+            obj (UploadSession): объект сессии.
+
+        Returns:
+            list: отсортированные номера частей.
+        """
+        return list(obj.chunks.order_by('index').values_list('index', flat=True))
+
 class CustomUserCreateSerializer(UserCreateSerializer):
     """
     Кастомный сериализатор для создания пользователя с добавлением поля first_name.
@@ -153,3 +370,78 @@ class CustomTokenSerializer(TokenSerializer):
 
     class Meta(TokenSerializer.Meta):
         fields = ('auth_token', 'is_staff')
+
+class BulkFileIdsSerializer(serializers.Serializer):
+    """
+    Сериализатор списка ID файлов для пакетных операций.
+
+    - ids: ID файлов, не больше BULK_MAX_FILES.
+    """
+    ids = serializers.ListField(child=serializers.IntegerField(min_value=1), allow_empty=False)
+
+    def validate_ids(self, value):
+        """
+        Проверяет количество файлов и убирает повторы.
+
+        Args:
+            value (list): ID файлов.
+
+        Returns:
+            list: ID файлов без повторов в исходном порядке.
+
+        Raises:
+            serializers.ValidationError: если файлов больше BULK_MAX_FILES.
+        """
+        if len(value) > settings.BULK_MAX_FILES:
+            raise serializers.ValidationError(f"Не больше {settings.BULK_MAX_FILES} файлов за один запрос.")
+        return list(dict.fromkeys(value))
+
+class BulkFileUpdateItemSerializer(serializers.ModelSerializer):
+    """
+    Сериализатор изменения одного файла в пакетном запросе.
+
+    - id: ID изменяемого файла.
+    - name, comment: новые значения, необязательные.
+    """
+    id = serializers.IntegerField(min_value=1)
+
+    class Meta:
+        model = File
+        fields = ('id', 'name', 'comment')
+        extra_kwargs = {'name': {'required': False}, 'comment': {'required': False}}
+
+class BulkFileUpdateSerializer(serializers.Serializer):
+    """
+    Сериализатор пакетного изменения имени и комментария файлов.
+
+    - files: список изменений, не больше BULK_MAX_FILES, каждый файл не больше одного раза.
+    """
+    files = BulkFileUpdateItemSerializer(many=True, allow_empty=False)
+
+    def validate_files(self, value):
+        """
+        Проверяет количество файлов и отсутствие повторов.
+
+        Args:
+            value (list): изменения файлов.
+
+        Returns:
+            list: проверенные изменения.
+
+        Raises:
+            serializers.ValidationError: если файлов больше BULK_MAX_FILES или файл указан дважды.
+        """
+        if len(value) > settings.BULK_MAX_FILES:
+            raise serializers.ValidationError(f"Не больше {settings.BULK_MAX_FILES} файлов за один запрос.")
+        if len({item['id'] for item in value}) != len(value):
+            raise serializers.ValidationError("Каждый файл можно указать только один раз.")
+        return value
+
+class JobSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    """
+    Сериализатор состояния фоновой задачи.
+    """
+
+    class Meta:
+        model = Job
+        fields = ('id', 'kind', 'status', 'attempts', 'result', 'last_error', 'data_created', 'data_updated')
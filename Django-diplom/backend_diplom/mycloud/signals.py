@@ -0,0 +1,44 @@
+from django.contrib.auth.models import User
+from django.contrib.auth.signals import user_logged_out
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from .authentication import invalidate_token, invalidate_user_auth
+from .usage import mark_changed
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def user_changed(sender, instance, **kwargs):
+    """
+    Сбрасывает кэш аутентификации при изменении пользователя: статус администратора, активность, пароль.
+    """
+    invalidate_user_auth(instance)
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created=False, update_fields=None, **kwargs):
+    """
+    Отмечает изменение данных пользователя для ETag списков. Новый пользователь меняет
+    количество в списке пользователей, вход (last_login) списков не меняет.
+    """
+    if not created and (update_fields is None or set(update_fields) - {'last_login'}):
+        mark_changed(instance.pk)
+
+
+@receiver(post_delete, sender=Token)
+def token_deleted(sender, instance, **kwargs):
+    """
+    Сбрасывает кэш удалённого токена (выход через /auth/token/logout/).
+    """
+    invalidate_token(instance.key)
+
+
+@receiver(user_logged_out)
+def user_logged_out_handler(sender, request, user, **kwargs):
+    """
+    Сбрасывает кэш аутентификации вышедшего пользователя.
+    """
+    if user is not None:
+        invalidate_user_auth(user)
@@ -0,0 +1,268 @@
+import uuid
+import logging
+from collections import Counter, defaultdict
+
+from django.core.files.storage import default_storage
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F
+
+from .cache import invalidate_file_info, invalidate_user_files
+from .compression import choose_encoding, compressed_file, open_stored
+from .models import Blob, File
+from .previews import PREVIEWS_DIRECTORY, delete_preview
+from .usage import record_usage
+from .utils import new_hasher, shard_directories
+
+logger = logging.getLogger('mycloud')
+
+BLOBS_DIRECTORY = 'blobs'
+READ_BLOCK_SIZE = 64 * 1024
+
+
+def blob_directory_path(digest):
+    """
+    Функция для получения пути к содержимому по его хэшу: blobs/ab/cd/abcd... (шарды по MEDIA_SHARD_*)
+    """
+    return '/'.join(part for part in (BLOBS_DIRECTORY, shard_directories(digest), digest) if part)
+
+
+def file_digest(name, encoding=''):
+    """
+    Считает хэш исходного содержимого файла в хранилище (FILE_DIGEST_ALGORITHM), читая его блоками.
+
+    Args:
+        name (str): имя файла в хранилище.
+        encoding (str): кодировка сжатия файла или пустая строка.
+
+    Returns:
+        str: хэш в шестнадцатеричном виде.
+    """
+    hasher = new_hasher()
+    with open_stored(name, encoding) as file:
+        for block in iter(lambda: file.read(READ_BLOCK_SIZE), b''):
+            hasher.update(block)
+    return hasher.hexdigest()
+
+
+def uploaded_file_digest(uploaded_file):
+    """
+    Возвращает хэш загруженного файла, посчитанный обработчиком загрузки,
+    или считает его по блокам, если файл пришёл в обход HashingUploadHandlerMixin.
+
+    Args:
+        uploaded_file (UploadedFile): загруженный файл.
+
+    Returns:
+        str: хэш в шестнадцатеричном виде.
+    """
+    digest = getattr(uploaded_file, 'digest', None)
+    if digest is None:
+        hasher = new_hasher()
+        for block in uploaded_file.chunks():
+            hasher.update(block)
+        digest = hasher.hexdigest()
+    return digest
+
+
+def place_content(source, name, encoding=''):
+    """
+    Кладёт содержимое в хранилище: переносит файл, уже лежащий в хранилище, или сохраняет загруженный файл.
+
+    Новое содержимое пишется под временным именем и переносится на место одной операцией,
+    поэтому по имени name всегда лежит целый файл: параллельная загрузка того же содержимого
+    заменяет его таким же, а не удаляет. При encoding содержимое пишется сжатым потоково,
+    и файл-источник в хранилище удаляется.
+
+    Args:
+        source (str | UploadedFile): имя файла в хранилище или загруженный файл.
+        name (str): имя, под которым сохранить содержимое.
+        encoding (str): кодировка сжатия (см. choose_encoding) или пустая строка.
+
+    Returns:
+        tuple: (имя, под которым содержимое сохранено; размер в хранилище или None, если содержимое не сжато).
+    """
+    if isinstance(source, str) and not encoding:
+        default_storage.move(source, name)
+        return name, None
+    temporary = f'{name}.{uuid.uuid4().hex}.tmp'
+    stored_size = None
+    if not encoding:
+        temporary = default_storage.save(temporary, source)
+    elif isinstance(source, str):
+        with default_storage.open(source, 'rb') as file:
+            content, reader = compressed_file(file, encoding)
+            temporary = default_storage.save(temporary, content)
+        stored_size = reader.written
+    else:
+        source.seek(0)
+        content, reader = compressed_file(source, encoding)
+        temporary = default_storage.save(temporary, content)
+        stored_size = reader.written
+    default_storage.move(temporary, name)
+    if isinstance(source, str):
+        default_storage.delete(source)
+    return name, stored_size
+
+
+def _discard_source(source):
+    if isinstance(source, str):
+        default_storage.delete(source)
+
+
+def acquire_blob(digest, size, source):
+    """
+    Возвращает Blob для содержимого с указанным хэшем, увеличивая счётчик ссылок.
+
+    Если такое содержимое уже хранится, источник не копируется, а отбрасывается.
+    Новое содержимое сжимается, если это выгодно (FILE_COMPRESSION).
+
+    Args:
+        digest (str): хэш содержимого.
+        size (int): размер содержимого, байт.
+        source (str | UploadedFile): имя файла в хранилище, который можно перенести, или загруженный файл.
+
+    Returns:
+        Blob: объект содержимого.
+    """
+    for attempt in range(2):
+        try:
+            with transaction.atomic():
+                blob = Blob.objects.select_for_update().filter(digest=digest).first()
+                if blob is None:
+                    encoding = choose_encoding(source, size)
+                    name, stored_size = place_content(source, blob_directory_path(digest), encoding)
+                    blob = Blob.objects.create(
+                        digest=digest, file=name, size=size, encoding=encoding, stored_size=stored_size, ref_count=1
+                    )
+                    logger.info(f'Stored new blob {digest} ({size} bytes, {stored_size or size} stored)')
+                    return blob
+                Blob.objects.filter(pk=blob.pk).update(ref_count=F('ref_count') + 1)
+        except IntegrityError:
+            # Такое же содержимое параллельно сохранил другой запрос, повторяем как для существующего
+            if attempt:
+                raise
+            continue
+        _discard_source(source)
+        logger.info(f'Deduplicated upload against blob {digest}')
+        return blob
+
+
+def _unreference_blob(blob_id, count):
+    """
+    Уменьшает счётчик ссылок Blob внутри транзакции вызывающего кода.
+
+    Returns:
+        Blob | None: удалённый объект, если ссылок не осталось; его содержимое нужно удалить из хранилища.
+    """
+    blob = Blob.objects.select_for_update().filter(pk=blob_id).first()
+    if blob is None:
+        return None
+    if blob.ref_count > count:
+        Blob.objects.filter(pk=blob_id).update(ref_count=F('ref_count') - count)
+        return None
+    blob.delete()
+    return blob
+
+
+def _delete_blob_content(blob):
+    default_storage.delete(blob.file.name)
+    delete_preview(blob.file.name)
+    logger.info(f'Removed blob {blob.digest}, no references left')
+
+
+def release_blob(blob_id, count=1):
+    """
+    Уменьшает счётчик ссылок Blob и удаляет содержимое, когда ссылок не осталось.
+
+    Args:
+        blob_id (int): ID объекта Blob.
+        count (int): на сколько уменьшить счётчик.
+    """
+    with transaction.atomic():
+        blob = _unreference_blob(blob_id, count)
+        if blob is not None:
+            _delete_blob_content(blob)
+
+
+def remove_contents(contents):
+    """
+    Освобождает содержимое пачки уже удалённых записей File.
+
+    Ссылки на один Blob снимаются одним обновлением счётчика, отдельные файлы удаляются из хранилища.
+
+    Args:
+        contents (list): пары (blob_id, имя файла в хранилище).
+    """
+    blob_refs = Counter(blob_id for blob_id, _ in contents if blob_id)
+    for blob_id, refs in blob_refs.items():
+        release_blob(blob_id, refs)
+    for blob_id, name in contents:
+        if blob_id or not name:
+            continue
+        default_storage.delete(name)
+        delete_preview(name)
+
+
+def remove_file_content(file_obj):
+    """
+    Освобождает содержимое уже удалённой записи File: отпускает Blob или удаляет отдельный файл.
+
+    Args:
+        file_obj (File): удалённый объект файла.
+    """
+    remove_contents([(file_obj.blob_id, str(file_obj.file))])
+
+
+def delete_files(queryset):
+    """
+    Удаляет записи File одной транзакцией вместе с изменением счётчиков использования
+    и сбрасывает кэш сведений о файлах. Содержимое файлов не трогается.
+
+    Args:
+        queryset (QuerySet): удаляемые файлы.
+
+    Returns:
+        tuple: (ID удалённых файлов, пары (blob_id, путь) для remove_contents).
+    """
+    with transaction.atomic():
+        rows = list(queryset.select_for_update().values_list('id', 'creator_id', 'size', 'hash', 'blob_id', 'file'))
+        if not rows:
+            return [], []
+        File.objects.filter(pk__in=[row[0] for row in rows]).delete()
+        usage = defaultdict(lambda: [0, 0])
+        for _, creator_id, size, _, _, _ in rows:
+            usage[creator_id][0] += 1
+            usage[creator_id][1] += size
+        for creator_id, (files, size) in usage.items():
+            record_usage(creator_id, files=-files, size=-size)
+    invalidate_file_info(*(row[3] for row in rows))
+    return [row[0] for row in rows], [(row[4], row[5]) for row in rows]
+
+
+def remove_user_content(user):
+    """
+    Удаляет пользователя с его файлами и освобождает их содержимое.
+
+    Записи File, ссылки на Blob и сам пользователь удаляются одной транзакцией, поэтому
+    повторная попытка после сбоя не теряет ссылки. Содержимое без ссылок и каталоги пользователя
+    удаляются из хранилища после неё; если это не удалось, каталоги удаляет повтор задачи
+    delete_user, а оставшееся содержимое - сверка хранилища (reconcile_storage).
+
+    Args:
+        user (User): объект пользователя.
+    """
+    user_id = user.id
+    invalidate_user_files(user)
+    with transaction.atomic():
+        blob_refs = list(
+            File.objects.filter(creator_id=user_id, blob__isnull=False).values('blob').annotate(refs=Count('id'))
+            .order_by('blob').values_list('blob', 'refs')
+        )
+        File.objects.filter(creator_id=user_id).delete()
+        released = [_unreference_blob(blob_id, refs) for blob_id, refs in blob_refs]
+        user.delete()
+    for blob in released:
+        if blob is not None:
+            _delete_blob_content(blob)
+    default_storage.delete_prefix(f'user_{user_id}')
+    default_storage.delete_prefix(f'{PREVIEWS_DIRECTORY}/user_{user_id}')
@@ -0,0 +1,108 @@
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.files.storage import default_storage
+from django.db import transaction
+
+from .authentication import invalidate_user_auth
+from .jobs import JobError, collect_finished, enqueue, job_handler
+from .models import UploadSession, UserUsage
+from .previews import PREVIEWS_DIRECTORY, generate_preview
+from .reconcile import Reconciler, UnsafeRepairError
+from .serializers import FileReadSerializer
+from .storage import remove_contents, remove_user_content
+from .uploads import ChunkError, collect_expired, finalize
+
+
+def schedule_user_deletion(user, creator=None):
+    """
+    Ставит в очередь удаление пользователя. Пользователь сразу теряет доступ и пропадает
+    из списка администратора (UserUsage.deletion_job), файлы и сам пользователь удаляются
+    задачей delete_user. Если задача завершится ошибкой, пользователь снова появится в списке.
+
+    Args:
+        user (User): удаляемый пользователь.
+        creator (User): пользователь, поставивший задачу.
+
+    Returns:
+        Job: задача удаления.
+    """
+    with transaction.atomic():
+        User.objects.filter(pk=user.pk).update(is_active=False)
+        # update() не вызывает сигналов, поэтому закэшированный вход сбрасывается явно,
+        # пока токены пользователя ещё есть в базе (при JOB_QUEUE_EAGER задача удалит их при фиксации)
+        invalidate_user_auth(user)
+        job = enqueue('delete_user', {'user_id': user.id}, creator=creator)
+        UserUsage.objects.update_or_create(user_id=user.pk, defaults={'deletion_job': job})
+        return job
+
+
+@job_handler('delete_user')
+def delete_user(user_id):
+    """
+    Удаляет пользователя, его файлы и каталог в хранилище. Если пользователь уже удалён
+    прошлой попыткой, удаляется только оставшийся каталог.
+    """
+    user = User.objects.filter(pk=user_id).first()
+    if user is not None:
+        remove_user_content(user)
+    default_storage.delete_prefix(f'user_{user_id}')
+    default_storage.delete_prefix(f'{PREVIEWS_DIRECTORY}/user_{user_id}')
+    return {'user_id': user_id}
+
+
+@job_handler('remove_contents')
+def remove_contents_job(contents):
+    """
+    Освобождает содержимое файлов, записи которых удалены пакетным удалением.
+    """
+    remove_contents([(blob_id, name) for blob_id, name in contents])
+    return {'files': len(contents)}
+
+
+@job_handler('sweep_orphans')
+def sweep_orphans(ttl=None):
+    """
+    Удаляет брошенные сессии загрузки и старые выполненные задачи.
+    """
+    return {
+        'upload_sessions': collect_expired(settings.UPLOAD_SESSION_TTL if ttl is None else ttl),
+        'jobs': collect_finished(settings.JOB_RETENTION),
+    }
+
+
+@job_handler('reconcile_storage')
+def reconcile_storage(repair=None, force=False):
+    """
+    Сверяет хранилище с базой. После сбоя повторная попытка продолжает сверку с сохранённой позиции.
+    Если хранилище похоже на недоступное (RECONCILE_MAX_MISSING), задача завершается с ошибкой без повторов.
+    """
+    repair = settings.RECONCILE_REPAIR if repair is None else repair
+    try:
+        return Reconciler(repair=repair, checkpoint=settings.RECONCILE_CHECKPOINT, force=force).run()
+    except UnsafeRepairError as e:
+        raise JobError(str(e))
+
+
+@job_handler('finalize_upload')
+def finalize_upload(session_id):
+    """
+    Собирает файл из частей сессии загрузки. Если хэш не совпал с ожидаемым, сессия остаётся:
+    клиент может переслать части и завершить загрузку снова.
+    """
+    session = UploadSession.objects.filter(pk=session_id).first()
+    if session is None:
+        return {'file': None}
+    try:
+        file_obj = finalize(session)
+    except ChunkError as e:
+        UploadSession.objects.filter(pk=session_id).update(job=None)
+        raise JobError(str(e))
+    return {'file': FileReadSerializer(file_obj).data if file_obj is not None else None}
+
+
+@job_handler('generate_preview')
+def generate_preview_job(file_id):
+    """
+    Строит превью загруженного файла.
+    """
+    return {'preview': generate_preview(file_id)}
@@ -1,3 +1,1865 @@
-from django.test import TestCase
+import io
+import base64
+import gzip
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+import unittest
+import zipfile
+from unittest import mock
+from decimal import Decimal
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.exceptions import ImproperlyConfigured, MiddlewareNotUsed
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.core.files.storage import default_storage
+from django.db import connection
+from asgiref.sync import async_to_sync
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.http import FileResponse, HttpResponse
+from django.test import AsyncRequestFactory, RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from prometheus_client import REGISTRY
+from rest_framework.authtoken.models import Token
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from .async_views import download_file, upload_chunk
+from .management.commands.bench_load import Command as BenchLoadCommand
+from .backends import iter_media_files
+from .bench import compare_reports, parse_size, percentile, summarize
+from .cache import get_cache, get_file_info
+from .download_stats import download_recorder
+from .downloads import offload_file, parse_range_header
+from .jobs import job_handler, run_pending
+from .layout import reshard
+from .log import BackgroundRotatingFileHandler, JsonFormatter, RequestIdFilter, RequestIdMiddleware, SamplingFilter
+from .metrics import UNMATCHED_VIEW, MetricsMiddleware
+from .models import Blob, File, Job, UploadSession, UserUsage
+from .previews import preview_name
+from .reconcile import BLOB_REFS, DANGLING_ROW, ORPHAN_FILE, Reconciler, UnsafeRepairError
+from .renderers import ORJSONRenderer
+from .routers import PRIMARY_COOKIE, ReplicaMiddleware, ReplicaRouter, read_from_primary, read_from_replica
+from .storage import blob_directory_path, place_content
+from .tasks import finalize_upload, schedule_user_deletion
+from .usage import record_usage
+from .utils import generating_uuid, seconds_since_epoch
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+try:
+    from moto import mock_aws
+except ImportError:
+    mock_aws = None
+
+MEDIA_ROOT = tempfile.mkdtemp(prefix='mycloud-tests-')
+
+
+class QueryPlanTestMixin:
+    """
+    Проверки плана выполнения и количества запросов для SQLite и PostgreSQL.
+    """
+
+    def explain(self, queryset):
+        return queryset.explain()
+
+    def assertUsesIndex(self, queryset, table='mycloud_file'):
+        """
+        Проверяет, что запрос к таблице выполняется поиском по индексу, а не полным сканированием.
+        """
+        plan = self.explain(queryset)
+        if connection.vendor == 'postgresql':
+            self.assertNotIn(f'Seq Scan on {table}', plan, plan)
+            self.assertRegex(plan, r'Index (Only )?Scan|Bitmap Index Scan', plan)
+        elif connection.vendor == 'sqlite':
+            self.assertNotRegex(plan, rf'SCAN {table}(?! USING)', plan)
+            self.assertRegex(plan, rf'(SEARCH|SCAN) {table} USING', plan)
+        return plan
+
+    def assertMaxQueries(self, limit, func, *args, **kwargs):
+        """
+        Вызывает func и проверяет, что было выполнено не больше limit запросов.
+        """
+        with CaptureQueriesContext(connection) as queries:
+            result = func(*args, **kwargs)
+        self.assertLessEqual(
+            len(queries), limit, '\n'.join(query['sql'] for query in queries.captured_queries)
+        )
+        return result
+
+
+class DownloadFileTestMixin:
+    """
+    Загружает файл через API и скачивает его по хэшу.
+    """
+    content = b'0123456789'
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create(username='owner')
+        self.client.force_authenticate(self.user)
+        get_cache().clear()
+        self.addCleanup(download_recorder.flush)
+        response = self.client.post(
+            '/api/v1/filelist/', {'file': SimpleUploadedFile('digits.txt', self.content)}, format='multipart'
+        )
+        self.assertEqual(response.status_code, 201)
+        self.file = File.objects.get(pk=response.data['id'])
+        self.url = f'/api/v1/download/{self.file.hash}/'
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, DOWNLOAD_STATS_FLUSH_INTERVAL=3600, DOWNLOAD_BACKEND='python')
+class RangeDownloadTests(DownloadFileTestMixin, TestCase):
+    """
+    Потоковое скачивание с поддержкой Range, If-Range и условных запросов.
+    """
+
+    def test_parse_range_header(self):
+        self.assertEqual(parse_range_header('bytes=2-4', 10), [(2, 4)])
+        self.assertEqual(parse_range_header('bytes=5-', 10), [(5, 9)])
+        self.assertEqual(parse_range_header('bytes=-3', 10), [(7, 9)])
+        self.assertEqual(parse_range_header('bytes=-30', 10), [(0, 9)])
+        self.assertEqual(parse_range_header('bytes=0-1, 8-20', 10), [(0, 1), (8, 9)])
+        # Неудовлетворимые диапазоны отбрасываются, некорректный заголовок игнорируется целиком
+        self.assertEqual(parse_range_header('bytes=10-20', 10), [])
+        self.assertEqual(parse_range_header('bytes=-0', 10), [])
+        self.assertEqual(parse_range_header('bytes=0-1,10-', 10), [(0, 1)])
+        self.assertIsNone(parse_range_header('items=0-1', 10))
+        self.assertIsNone(parse_range_header('bytes=4-2', 10))
+        self.assertIsNone(parse_range_header('bytes=a-b', 10))
+        with override_settings(DOWNLOAD_MAX_RANGES=2):
+            self.assertIsNone(parse_range_header('bytes=0-0,2-2,4-4', 10))
+
+    def test_full_and_single_range(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertEqual(b''.join(response.streaming_content), self.content)
+
+        response = self.client.get(self.url, HTTP_RANGE='bytes=2-4')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], 'bytes 2-4/10')
+        self.assertEqual(response['Content-Length'], '3')
+        self.assertEqual(b''.join(response.streaming_content), b'234')
+
+        response = self.client.get(self.url, HTTP_RANGE='bytes=-3')
+        self.assertEqual(response['Content-Range'], 'bytes 7-9/10')
+        self.assertEqual(b''.join(response.streaming_content), b'789')
+
+    def test_multiple_ranges(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=0-1,-2')
+        self.assertEqual(response.status_code, 206)
+        content_type, _, boundary = response['Content-Type'].partition('; boundary=')
+        self.assertEqual(content_type, 'multipart/byteranges')
+        body = b''.join(response.streaming_content)
+        self.assertEqual(int(response['Content-Length']), len(body))
+        parts = body.split(f'--{boundary}'.encode())
+        self.assertEqual(parts[-1], b'--\r\n')
+        self.assertIn(b'Content-Range: bytes 0-1/10\r\n\r\n01\r\n', parts[1])
+        self.assertIn(b'Content-Range: bytes 8-9/10\r\n\r\n89\r\n', parts[2])
+
+    def test_unsatisfiable_range(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=10-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], 'bytes */10')
+        # Некорректный заголовок игнорируется, файл отдаётся целиком
+        self.assertEqual(self.client.get(self.url, HTTP_RANGE='bytes=4-2').status_code, 200)
+
+    def test_conditional_requests(self):
+        etag = self.client.get(self.url)['ETag']
+        last_modified = self.client.get(self.url)['Last-Modified']
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertEqual(self.client.get(self.url, HTTP_IF_MATCH='"other"').status_code, 412)
+
+        # If-Range: диапазон только для той же версии файла, иначе файл целиком
+        self.assertEqual(self.client.get(self.url, HTTP_RANGE='bytes=0-0', HTTP_IF_RANGE=etag).status_code, 206)
+        self.assertEqual(
+            self.client.get(self.url, HTTP_RANGE='bytes=0-0', HTTP_IF_RANGE=last_modified).status_code, 206
+        )
+        self.assertEqual(self.client.get(self.url, HTTP_RANGE='bytes=0-0', HTTP_IF_RANGE='"other"').status_code, 200)
+        self.assertEqual(self.client.get(self.url, HTTP_RANGE='bytes=0-0', HTTP_IF_RANGE=f'W/{etag}').status_code, 200)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, DOWNLOAD_STATS_FLUSH_INTERVAL=3600)
+class OffloadDownloadTests(DownloadFileTestMixin, TestCase):
+    """
+    Отдача файлов фронт-прокси через X-Accel-Redirect и X-Sendfile.
+    """
+
+    @override_settings(DOWNLOAD_BACKEND='nginx', DOWNLOAD_ACCEL_LOCATION='/protected-files/')
+    def test_x_accel_redirect(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-Accel-Redirect'], f'/protected-files/{self.file.file}')
+        self.assertEqual(response.content, b'')
+        self.assertIn('digits.txt', response['Content-Disposition'])
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+    @override_settings(DOWNLOAD_BACKEND='sendfile')
+    def test_x_sendfile(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response['X-Sendfile'], os.path.join(MEDIA_ROOT, str(self.file.file)))
+        self.assertEqual(response.content, b'')
+        self.assertNotIn('X-Accel-Redirect', response)
+
+    @override_settings(DOWNLOAD_ACCEL_LOCATION='/protected-files')
+    def test_accel_location_is_quoted(self):
+        response = offload_file('/srv/files/a b.txt', 'user_1/a b.txt', 'a b.txt', 'etag', 'nginx')
+        self.assertEqual(response['X-Accel-Redirect'], '/protected-files/user_1/a%20b.txt')
+        with self.assertRaises(ImproperlyConfigured):
+            offload_file('/srv/files/a.txt', 'a.txt', 'a.txt', 'etag', 'unknown')
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, UPLOAD_MIN_CHUNK_SIZE=1024, DOWNLOAD_STATS_FLUSH_INTERVAL=3600)
+class ChunkedUploadTests(TestCase):
+    """
+    Возобновляемая загрузка частями: приём частей, докачка и сборка файла.
+    """
+    chunk_size = 1024
+    content = os.urandom(2 * 1024 + 100)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create(username='owner')
+        self.client.force_authenticate(self.user)
+
+    def start(self, **data):
+        response = self.client.post(
+            '/api/v1/uploads/',
+            {'name': 'video.bin', 'size': len(self.content), 'chunk_size': self.chunk_size, **data}, format='json',
+        )
+        self.assertEqual(response.status_code, 201, response.data)
+        return response.data
+
+    def put_chunk(self, session_id, index, body=None, **headers):
+        if body is None:
+            body = self.content[index * self.chunk_size:(index + 1) * self.chunk_size]
+        return self.client.put(
+            f'/api/v1/uploads/{session_id}/chunks/{index}/', body, content_type='application/octet-stream', **headers
+        )
+
+    def complete(self, session_id):
+        response = self.client.post(f'/api/v1/uploads/{session_id}/complete/')
+        self.assertEqual(response.status_code, 202, response.data)
+        run_pending()
+        return Job.objects.get(pk=response.data['job']['id'])
+
+    def test_chunks_in_any_order_resume_and_complete(self):
+        session = self.start()
+        self.assertEqual(session['total_chunks'], 3)
+        size = len(self.content)
+        response = self.put_chunk(session['id'], 2, HTTP_CONTENT_RANGE=f'bytes 2048-{size - 1}/{size}')
+        self.assertEqual(response.data, {'index': 2, 'offset': 2048, 'size': 100})
+        self.assertEqual(self.put_chunk(session['id'], 0).status_code, 200)
+
+        # После обрыва клиент узнаёт, какие части уже приняты, и досылает недостающие
+        response = self.client.get(f'/api/v1/uploads/{session["id"]}/')
+        self.assertEqual(response.data['received_chunks'], [0, 2])
+        self.assertEqual(self.client.post(f'/api/v1/uploads/{session["id"]}/complete/').status_code, 409)
+        self.assertEqual(self.put_chunk(session['id'], 1).status_code, 200)
+        # Повторная отправка части перезаписывает её
+        self.assertEqual(self.put_chunk(session['id'], 1).status_code, 200)
+
+        job = self.complete(session['id'])
+        self.assertEqual(job.status, Job.DONE)
+        file_obj = File.objects.get(pk=job.result['file']['id'])
+        self.assertTrue(file_obj.name.endswith('_video.bin'))
+        self.assertEqual(file_obj.size, len(self.content))
+        self.assertEqual(file_obj.digest, hashlib.sha256(self.content).hexdigest())
+        with default_storage.open(str(file_obj.file)) as file:
+            self.assertEqual(file.read(), self.content)
+        self.assertEqual(self.client.get(f'/api/v1/uploads/{session["id"]}/').status_code, 404)
+
+    def test_invalid_chunks_are_rejected(self):
+        session = self.start()
+        self.assertEqual(self.put_chunk(session['id'], 0, b'').status_code, 400)
+        self.assertEqual(self.put_chunk(session['id'], 0, self.content[:100]).status_code, 400)
+        self.assertEqual(self.put_chunk(session['id'], 0, self.content[:self.chunk_size + 1]).status_code, 400)
+        self.assertEqual(self.put_chunk(session['id'], 3, b'x').status_code, 400)
+        self.assertEqual(self.put_chunk(session['id'], 1, HTTP_CONTENT_RANGE='bytes 0-1023/2148').status_code, 400)
+        self.assertEqual(self.client.get(f'/api/v1/uploads/{session["id"]}/').data['received_chunks'], [])
+
+    def test_async_chunk_view_errors(self):
+        session = self.start()
+        factory = AsyncRequestFactory()
+
+        def put(body, authorization=None):
+            request = factory.put(
+                f'/api/v1/uploads/{session["id"]}/chunks/0/', body, content_type='application/octet-stream',
+                headers={'Authorization': authorization} if authorization else None,
+            )
+            request.user = self.user
+            return async_to_sync(upload_chunk)(request, session_id=session['id'], index=0)
+
+        # Сессия браузера без токена CSRF
+        response = put(self.content[:self.chunk_size])
+        self.assertEqual(response.status_code, 403)
+        token = Token.objects.create(user=self.user)
+        self.assertEqual(put(self.content[:self.chunk_size], 'Token wrong').status_code, 401)
+        self.assertEqual(put(b'', f'Token {token.key}').status_code, 400)
+        self.assertEqual(put(self.content[:self.chunk_size], f'Token {token.key}').status_code, 200)
+
+    def test_declared_size_is_limited(self):
+        with override_settings(UPLOAD_MAX_SIZE=2048):
+            response = self.client.post(
+                '/api/v1/uploads/', {'name': 'big.bin', 'size': 2049, 'chunk_size': self.chunk_size}, format='json'
+            )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('size', response.data)
+        with override_settings(USER_STORAGE_QUOTA=1024):
+            response = self.client.post(
+                '/api/v1/uploads/', {'name': 'big.bin', 'size': 2048, 'chunk_size': self.chunk_size}, format='json'
+            )
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(UploadSession.objects.exists())
+
+    def test_repeated_complete_returns_the_same_job(self):
+        session = self.start()
+        for index in range(3):
+            self.put_chunk(session['id'], index)
+        first = self.client.post(f'/api/v1/uploads/{session["id"]}/complete/')
+        self.assertEqual(first.status_code, 202)
+        second = self.client.post(f'/api/v1/uploads/{session["id"]}/complete/')
+        self.assertEqual(second.data['job']['id'], first.data['job']['id'])
+        # Части после запроса завершения не принимаются
+        self.assertEqual(self.put_chunk(session['id'], 0).status_code, 400)
+
+        run_pending()
+        self.assertEqual(File.objects.filter(creator=self.user).count(), 1)
+        self.assertEqual(UserUsage.objects.get(user=self.user).file_count, 1)
+        # Повтор задачи после завершения сессии не создаёт второй файл
+        job = Job.objects.get(pk=first.data['job']['id'])
+        self.assertEqual(finalize_upload(**job.payload), {'file': None})
+        self.assertEqual(File.objects.filter(creator=self.user).count(), 1)
+
+    @override_settings(FILE_DEDUPLICATION=True)
+    def test_blob_placement_never_removes_existing_content(self):
+        digest = hashlib.sha256(self.content).hexdigest()
+        blob_name = blob_directory_path(digest)
+        default_storage.save(blob_name, io.BytesIO(self.content))
+        self.addCleanup(default_storage.delete, blob_name)
+        # Содержимое такого же размера уже лежит по пути blob (параллельная первая загрузка):
+        # новое пишется под временным именем и заменяет его одной операцией
+        with mock.patch.object(default_storage, 'delete', wraps=default_storage.delete) as delete:
+            place_content(SimpleUploadedFile('video.bin', self.content), blob_name)
+        self.assertNotIn(mock.call(blob_name), delete.call_args_list)
+        with default_storage.open(blob_name) as file:
+            self.assertEqual(file.read(), self.content)
+        directory, name = blob_name.rsplit('/', 1)
+        self.assertEqual([entry for entry in default_storage.listdir(directory)[1] if entry.startswith(name)], [name])
+
+    def test_discard_removes_staging_file(self):
+        session = self.start()
+        self.put_chunk(session['id'], 0)
+        self.assertTrue(default_storage.exists(f'uploads/{session["id"]}.part'))
+        self.assertEqual(self.client.delete(f'/api/v1/uploads/{session["id"]}/').status_code, 204)
+        self.assertFalse(default_storage.exists(f'uploads/{session["id"]}.part'))
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, FILE_DEDUPLICATION=True, JOB_QUEUE_EAGER=False)
+class BlobDeduplicationTests(TestCase):
+    """
+    Одинаковое содержимое хранится одним Blob со счётчиком ссылок.
+    """
+    content = b'deduplicated content'
+
+    def setUp(self):
+        self.client = APIClient()
+        self.owner = User.objects.create(username='owner')
+        self.other = User.objects.create(username='other')
+
+    def upload(self, user, name='notes.txt', content=None):
+        self.client.force_authenticate(user)
+        response = self.client.post(
+            '/api/v1/filelist/', {'file': SimpleUploadedFile(name, content or self.content)}, format='multipart'
+        )
+        self.assertEqual(response.status_code, 201)
+        return File.objects.get(pk=response.data['id'])
+
+    def delete(self, file_obj):
+        self.client.force_authenticate(file_obj.creator)
+        self.assertEqual(self.client.delete(f'/api/v1/filedelete/{file_obj.id}/').status_code, 204)
+
+    def test_identical_content_is_stored_once(self):
+        first = self.upload(self.owner)
+        second = self.upload(self.other, 'copy.txt')
+        third = self.upload(self.owner, 'again.txt')
+        blob = Blob.objects.get()
+        self.assertEqual(blob.digest, hashlib.sha256(self.content).hexdigest())
+        self.assertEqual((blob.ref_count, blob.size), (3, len(self.content)))
+        self.assertEqual({str(first.file), str(second.file), str(third.file)}, {blob.file.name})
+        self.upload(self.owner, 'different.txt', b'other content')
+        self.assertEqual(Blob.objects.count(), 2)
+
+    def test_content_is_removed_with_last_reference(self):
+        first = self.upload(self.owner)
+        second = self.upload(self.other)
+        blob = first.blob
+        path = os.path.join(MEDIA_ROOT, blob.file.name)
+
+        self.delete(first)
+        blob.refresh_from_db()
+        self.assertEqual(blob.ref_count, 1)
+        self.assertTrue(os.path.exists(path))
+        response = self.client.get(f'/api/v1/download/{second.hash}/')
+        self.assertEqual(b''.join(response.streaming_content), self.content)
+
+        self.delete(second)
+        self.assertFalse(Blob.objects.filter(pk=blob.pk).exists())
+        self.assertFalse(os.path.exists(path))
+
+    @override_settings(FILE_DEDUPLICATION=False)
+    def test_without_deduplication(self):
+        first = self.upload(self.owner)
+        second = self.upload(self.owner, 'copy.txt')
+        self.assertFalse(Blob.objects.exists())
+        self.assertNotEqual(str(first.file), str(second.file))
+        self.assertTrue(str(first.file).startswith(f'user_{self.owner.id}/'))
+
+
+@override_settings(API_MAX_PAGE_SIZE=3)
+class UserListPaginationTests(TestCase):
+    """
+    Список пользователей администратора: счётчики из UserUsage и курсорная пагинация по id.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create(username='admin', is_staff=True)
+        cls.users = [User.objects.create(username=f'user{number}') for number in range(6)]
+        UserUsage.objects.create(user=cls.users[0], file_count=3, total_size=300)
+        # Деактивированный пользователь остаётся в списке, ожидающий удаления - скрыт
+        User.objects.filter(pk=cls.users[4].pk).update(is_active=False)
+        schedule_user_deletion(cls.users[5])
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def test_first_page_by_default_with_usage(self):
+        response = self.client.get('/api/v1/admin/users/')
+        self.assertEqual(response.status_code, 200)
+        # Без параметров отдаётся первая страница, размер по умолчанию ограничен API_MAX_PAGE_SIZE
+        results = response.data['results']
+        self.assertEqual([item['id'] for item in results], [self.admin.id, self.users[0].id, self.users[1].id])
+        self.assertIsNotNone(response.data['next'])
+        self.assertEqual((results[1]['total_files'], results[1]['total_size']), (3, 300))
+        self.assertEqual((results[2]['total_files'], results[2]['total_size']), (0, 0))
+        with override_settings(API_PAGE_SIZE=2):
+            self.assertEqual(len(self.client.get('/api/v1/admin/users/').data['results']), 2)
+
+    def test_cursor_pages(self):
+        ids = []
+        url = '/api/v1/admin/users/?page_size=2'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertLessEqual(len(response.data['results']), 2)
+            ids.extend(item['id'] for item in response.data['results'])
+            url = response.data['next']
+        self.assertEqual(ids, [self.admin.id] + [user.id for user in self.users[:5]])
+
+        previous = self.client.get(self.client.get('/api/v1/admin/users/?page_size=2').data['next']).data['previous']
+        self.assertEqual([item['id'] for item in self.client.get(previous).data['results']], ids[:2])
+        # Размер страницы ограничен API_MAX_PAGE_SIZE
+        self.assertEqual(len(self.client.get('/api/v1/admin/users/?page_size=100').data['results']), 3)
+        self.assertEqual(self.client.get('/api/v1/admin/users/?cursor=broken').status_code, 404)
+
+    def test_admin_only(self):
+        self.client.force_authenticate(self.users[0])
+        self.assertEqual(self.client.get('/api/v1/admin/users/').status_code, 403)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, JOB_QUEUE_EAGER=False)
+class UsageTests(TestCase):
+    """
+    Счётчики использования хранилища и их сверка с таблицей File.
+    """
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create(username='owner')
+        self.client.force_authenticate(self.user)
+
+    def upload(self, content, name='notes.txt'):
+        response = self.client.post('/api/v1/filelist/', {'file': SimpleUploadedFile(name, content)}, format='multipart')
+        self.assertEqual(response.status_code, 201)
+        return response.data['id']
+
+    def usage(self):
+        return UserUsage.objects.values_list('file_count', 'total_size').get(user=self.user)
+
+    def test_counters_follow_uploads_and_deletes(self):
+        first = self.upload(b'a' * 100)
+        self.upload(b'b' * 50, 'other.txt')
+        self.assertEqual(self.usage(), (2, 150))
+        self.assertEqual(self.client.delete(f'/api/v1/filedelete/{first}/').status_code, 204)
+        self.assertEqual(self.usage(), (1, 50))
+        with override_settings(USER_STORAGE_QUOTA=100):
+            response = self.client.post(
+                '/api/v1/filelist/', {'file': SimpleUploadedFile('big.txt', b'c' * 51)}, format='multipart'
+            )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.usage(), (1, 50))
+
+    def test_update_cannot_change_content_fields(self):
+        file_id = self.upload(b'a' * 100)
+        before = File.objects.values('file', 'size', 'hash', 'digest').get(pk=file_id)
+        response = self.client.patch(f'/api/v1/filelist/{file_id}/', {
+            'name': 'renamed.txt', 'size': 1, 'file': 'user_1/other.txt',
+            'hash': str(generating_uuid()), 'digest': '0' * 64,
+        }, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(File.objects.values('file', 'size', 'hash', 'digest').get(pk=file_id), before)
+        self.assertEqual(File.objects.get(pk=file_id).name, 'renamed.txt')
+        # Удаление уменьшает счётчики на настоящий размер
+        self.client.delete(f'/api/v1/filedelete/{file_id}/')
+        self.assertEqual(self.usage(), (0, 0))
+
+    def test_decrement_does_not_go_below_zero(self):
+        record_usage(self.user.id, files=1, size=10)
+        record_usage(self.user.id, files=-3, size=-100)
+        self.assertEqual(self.usage(), (0, 0))
+
+    def test_rebuild_usage_repairs_drift(self):
+        self.upload(b'a' * 100)
+        UserUsage.objects.filter(user=self.user).update(file_count=5, total_size=1)
+        other = User.objects.create(username='empty')
+        out = io.StringIO()
+        with self.assertRaises(CommandError):
+            call_command('rebuild_usage', '--check', stdout=out)
+        self.assertEqual(self.usage(), (5, 1))
+        call_command('rebuild_usage', stdout=out)
+        self.assertEqual(self.usage(), (1, 100))
+        self.assertFalse(UserUsage.objects.filter(user=other).exists())
+        call_command('rebuild_usage', '--check', stdout=out)
+
+
+class FileListTests(TestCase):
+    """
+    Список файлов: курсорная пагинация, фильтры и выбор полей (?fields=).
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='owner')
+        cls.other = User.objects.create(username='other')
+        # Две пары файлов с одинаковой датой: порядок внутри пары задаёт id
+        cls.files = [
+            File.objects.create(
+                creator=cls.user, name=name, file=f'user_{cls.user.id}/{name}', size=size, data_created=created,
+                hash=generating_uuid(), digest=f'{number:064x}',
+            )
+            for number, (name, size, created) in enumerate((
+                ('report_2023.pdf', 100, 1000), ('report_2024.pdf', 200, 2000), ('photo.jpg', 300, 2000),
+                ('notes.txt', 400, 3000), ('archive.zip', 500, 3000),
+            ))
+        ]
+        File.objects.create(creator=cls.other, name='report_other.pdf', file='user_x/report_other.pdf', size=1)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def names(self, query=''):
+        response = self.client.get(f'/api/v1/filelist/{query}')
+        self.assertEqual(response.status_code, 200, response.data)
+        return [item['name'] for item in response.data['files']]
+
+    def test_newest_first_page_by_default(self):
+        response = self.client.get('/api/v1/filelist/')
+        self.assertIsNone(response.data['next'])
+        self.assertEqual(
+            [item['id'] for item in response.data['files']], [file_obj.id for file_obj in reversed(self.files)]
+        )
+        # Без параметров список тоже отдаётся страницами, размер ограничен API_MAX_PAGE_SIZE
+        with override_settings(API_PAGE_SIZE=100, API_MAX_PAGE_SIZE=3):
+            response = self.client.get('/api/v1/filelist/')
+            self.assertEqual(len(response.data['files']), 3)
+            self.assertEqual(len(self.client.get(response.data['next']).data['files']), 2)
+
+    def test_cursor_pages_are_stable(self):
+        ids = []
+        url = '/api/v1/filelist/?page_size=2'
+        while url:
+            response = self.client.get(url)
+            self.assertLessEqual(len(response.data['files']), 2)
+            ids.extend(item['id'] for item in response.data['files'])
+            url = response.data['next']
+        self.assertEqual(ids, [file_obj.id for file_obj in reversed(self.files)])
+
+        # Новый файл не сдвигает уже выданные страницы
+        response = self.client.get('/api/v1/filelist/?page_size=2')
+        File.objects.create(creator=self.user, name='new.txt', file='new.txt', size=1, data_created=4000)
+        response = self.client.get(response.data['next'])
+        self.assertEqual([item['id'] for item in response.data['files']], ids[2:4])
+
+    def test_filters(self):
+        self.assertEqual(self.names('?name=report_'), ['report_2024.pdf', 'report_2023.pdf'])
+        self.assertEqual(self.names('?size_min=200&size_max=400'), ['notes.txt', 'photo.jpg', 'report_2024.pdf'])
+        self.assertEqual(self.names('?created_after=2000&created_before=2000'), ['photo.jpg', 'report_2024.pdf'])
+        self.assertEqual(self.names(f'?digest={"3".zfill(64).upper()}'), ['notes.txt'])
+        self.assertEqual(self.names('?name=report_&page_size=1'), ['report_2024.pdf'])
+        response = self.client.get('/api/v1/filelist/?size_min=big')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('size_min', response.data)
+
+    def test_sparse_fields(self):
+        response = self.client.get('/api/v1/filelist/?fields=id,name,unknown')
+        self.assertEqual(set(response.data['files'][0]), {'id', 'name'})
+        response = self.client.get('/api/v1/filelist/')
+        self.assertIn('hash', response.data['files'][0])
+
+    def test_admin_user_files(self):
+        admin = User.objects.create(username='admin', is_staff=True)
+        self.client.force_authenticate(admin)
+        response = self.client.get(f'/api/v1/admin/users/{self.user.id}/files/?name=report_&fields=name')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['results'], [{'name': 'report_2024.pdf'}, {'name': 'report_2023.pdf'}])
+        response = self.client.get(f'/api/v1/admin/users/{self.user.id}/files/?page_size=2&fields=id')
+        self.assertEqual(response.data['results'], [{'id': self.files[4].id}, {'id': self.files[3].id}])
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class FileQueryPlanTests(QueryPlanTestMixin, TestCase):
+    """
+    Регрессионные проверки горячих запросов к File на синтетическом наборе данных.
+    """
+    users_count = 200
+    files_per_user = 100
+
+    @classmethod
+    def setUpTestData(cls):
+        users = User.objects.bulk_create(
+            User(username=f'user{number}') for number in range(cls.users_count)
+        )
+        cls.user = users[0]
+        cls.admin = User.objects.create(username='admin', is_staff=True)
+        File.objects.bulk_create(
+            (
+                File(
+                    creator=user,
+                    name=f'{number:05d}_report.txt',
+                    file=f'user_{user.id}/{number:05d}_report.txt',
+                    size=number * 1024,
+                    data_created=1700000000 + number,
+                    hash=generating_uuid(),
+                )
+                for user in users
+                for number in range(cls.files_per_user)
+            ),
+            batch_size=2000,
+        )
+        UserUsage.objects.bulk_create(
+            UserUsage(user=user, file_count=cls.files_per_user, total_size=0) for user in users
+        )
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.client = APIClient()
+        get_cache().clear()
+        # События скачивания не должны переходить из одного теста в другой
+        self.addCleanup(download_recorder.flush)
+
+    def test_list_by_user_uses_index(self):
+        queryset = File.objects.filter(creator=self.user).order_by('-data_created', '-id')[:50]
+        self.assertUsesIndex(queryset)
+
+    def test_list_filters_use_index(self):
+        self.assertUsesIndex(File.objects.filter(creator=self.user, size__gte=1024, size__lte=4096))
+        self.assertUsesIndex(
+            File.objects.filter(creator=self.user, data_created__gte=1700000010).order_by('-data_created', '-id')
+        )
+
+    def test_download_by_hash_uses_index(self):
+        file_obj = File.objects.filter(creator=self.user).first()
+        self.assertUsesIndex(File.objects.filter(hash=file_obj.hash))
+
+    def test_admin_user_list_uses_index(self):
+        # Страница курсорной пагинации: поиск по первичному ключу и присоединение счётчиков по индексу
+        queryset = User.objects.select_related('usage').filter(id__gt=self.user.id).order_by('id')[:100]
+        self.assertUsesIndex(queryset, table='auth_user')
+        self.assertUsesIndex(queryset, table='mycloud_userusage')
+
+    def test_file_list_query_count(self):
+        self.client.force_authenticate(self.user)
+        # Маркер изменений для ETag и страница файлов
+        response = self.assertMaxQueries(2, self.client.get, '/api/v1/filelist/?page_size=50')
+        self.assertEqual(len(response.data['files']), 50)
+        response = self.assertMaxQueries(2, self.client.get, response.data['next'])
+        self.assertEqual(len(response.data['files']), 50)
+
+    @override_settings(API_PAGE_SIZE=100)
+    def test_admin_user_list_query_count(self):
+        self.client.force_authenticate(self.admin)
+        # Маркер изменений для ETag и страница пользователей со счётчиками
+        response = self.assertMaxQueries(2, self.client.get, '/api/v1/admin/users/')
+        self.assertEqual(len(response.data['results']), 100)
+        self.assertEqual(response.data['results'][0]['total_files'], self.files_per_user)
+        response = self.assertMaxQueries(2, self.client.get, response.data['next'])
+        self.assertEqual(len(response.data['results']), 100)
+
+    def test_admin_user_files_query_count(self):
+        self.client.force_authenticate(self.admin)
+        url = f'/api/v1/admin/users/{self.user.id}/files/?page_size=20'
+        response = self.assertMaxQueries(3, self.client.get, url)
+        self.assertEqual(len(response.data['results']), 20)
+
+    def test_download_query_count(self):
+        file_obj = File.objects.filter(creator=self.user).first()
+        path = os.path.join(MEDIA_ROOT, str(file_obj.file))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as file:
+            file.write(b'content')
+        with override_settings(DOWNLOAD_STATS_FLUSH_INTERVAL=3600):
+            response = self.assertMaxQueries(1, self.client.get, f'/api/v1/download/{file_obj.hash}/')
+            self.assertEqual(b''.join(response.streaming_content), b'content')
+            # Повторное скачивание берёт сведения о файле из кэша, а дата скачивания пишется отложенно
+            response = self.assertMaxQueries(0, self.client.get, f'/api/v1/download/{file_obj.hash}/')
+            self.assertEqual(b''.join(response.streaming_content), b'content')
+            # Обновление файлов и маркеров изменений их владельцев
+            self.assertMaxQueries(2, download_recorder.flush)
+        file_obj.refresh_from_db()
+        self.assertEqual(file_obj.download_count, 2)
+        self.assertIsNotNone(file_obj.date_download)
+
+    def test_download_cache_invalidated_on_rename(self):
+        file_obj = File.objects.filter(creator=self.user).first()
+        self.assertEqual(get_file_info(str(file_obj.hash))['name'], file_obj.name)
+        self.client.force_authenticate(self.user)
+        self.client.patch(f'/api/v1/filelist/{file_obj.id}/', {'name': 'renamed.txt'}, format='json')
+        self.assertEqual(get_file_info(str(file_obj.hash))['name'], 'renamed.txt')
+        # Ссылка на скачивание не меняется через API, прежняя запись кэша остаётся верной
+        self.client.patch(
+            f'/api/v1/filelist/{file_obj.id}/', {'name': 'again.txt', 'hash': str(generating_uuid())}, format='json'
+        )
+        self.assertEqual(get_file_info(str(file_obj.hash))['name'], 'again.txt')
+
+    def test_download_unknown_hash(self):
+        response = self.assertMaxQueries(0, self.client.get, '/api/v1/download/not-a-uuid/')
+        self.assertEqual(response.status_code, 404)
+
+    def test_async_download_streams_ranges(self):
+        file_obj = File.objects.filter(creator=self.user).first()
+        path = os.path.join(MEDIA_ROOT, str(file_obj.file))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as file:
+            file.write(b'0123456789')
+
+        async def fetch(headers=None):
+            request = AsyncRequestFactory().get(f'/api/v1/download/{file_obj.hash}/', headers=headers)
+            response = await download_file(request, str(file_obj.hash))
+            return response, b''.join([chunk async for chunk in response.streaming_content])
+
+        with override_settings(DOWNLOAD_STATS_FLUSH_INTERVAL=3600):
+            response, content = async_to_sync(fetch)()
+            self.assertEqual(response.status_code, 200)
+            self.assertTrue(response.is_async)
+            self.assertEqual(content, b'0123456789')
+            response, content = async_to_sync(fetch)(headers={'Range': 'bytes=2-4'})
+            self.assertEqual(response.status_code, 206)
+            self.assertEqual(content, b'234')
+            download_recorder.flush()
+        file_obj.refresh_from_db()
+        self.assertEqual(file_obj.download_count, 1)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class BulkOperationTests(QueryPlanTestMixin, TestCase):
+    """
+    Пакетные операции над файлами выполняются за фиксированное количество запросов.
+    """
+    files_count = 50
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='owner')
+        cls.other = User.objects.create(username='other')
+        cls.files = File.objects.bulk_create(
+            File(
+                creator=cls.user,
+                name=f'{number:03d}_report.txt' if number % 10 else 'same.txt',
+                file=f'user_{cls.user.id}/{number:03d}_report.txt',
+                size=10,
+                hash=generating_uuid(),
+            )
+            for number in range(cls.files_count)
+        )
+        UserUsage.objects.create(user=cls.user, file_count=cls.files_count, total_size=10 * cls.files_count)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        get_cache().clear()
+
+    def test_bulk_delete(self):
+        ids = [file_obj.id for file_obj in self.files]
+        response = self.assertMaxQueries(
+            7, self.client.post, '/api/v1/filelist/bulk-delete/', {'ids': ids + [10 ** 9]}, format='json'
+        )
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(sorted(response.data['deleted']), sorted(ids))
+        self.assertEqual(response.data['not_found'], [10 ** 9])
+        self.assertFalse(File.objects.filter(creator=self.user).exists())
+        usage = UserUsage.objects.get(user=self.user)
+        self.assertEqual((usage.file_count, usage.total_size), (0, 0))
+
+        # Содержимое освобождает фоновая задача
+        job = Job.objects.get(pk=response.data['job']['id'])
+        self.assertEqual((job.kind, job.status), ('remove_contents', Job.PENDING))
+        self.assertEqual(run_pending(), 1)
+        response = self.client.get(response['Location'])
+        self.assertEqual(response.data['status'], Job.DONE)
+        self.assertEqual(response.data['result'], {'files': self.files_count})
+
+    def test_bulk_delete_foreign_files(self):
+        self.client.force_authenticate(self.other)
+        response = self.client.post('/api/v1/filelist/bulk-delete/', {'ids': [self.files[0].id]}, format='json')
+        self.assertEqual(response.data['deleted'], [])
+        self.assertTrue(File.objects.filter(pk=self.files[0].id).exists())
+
+    def test_bulk_update(self):
+        changes = [{'id': file_obj.id, 'comment': f'comment {file_obj.id}'} for file_obj in self.files]
+        changes[0]['name'] = 'renamed.txt'
+        # Выборка, bulk_update в транзакции и маркер изменений владельцев
+        response = self.assertMaxQueries(
+            5, self.client.patch, '/api/v1/filelist/bulk-update/', {'files': changes}, format='json'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(File.objects.get(pk=self.files[0].id).name, 'renamed.txt')
+        self.assertEqual(File.objects.filter(comment__startswith='comment').count(), self.files_count)
+
+        response = self.client.patch(
+            '/api/v1/filelist/bulk-update/', {'files': [{'id': 10 ** 9, 'name': 'x'}]}, format='json'
+        )
+        self.assertEqual(response.status_code, 404)
+
+    def test_zip_download(self):
+        files = self.files[:3] + [self.files[10]]
+        for file_obj in files:
+            path = os.path.join(MEDIA_ROOT, str(file_obj.file))
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as file:
+                file.write(str(file_obj.file).encode())
+        ids = ','.join(str(file_obj.id) for file_obj in files)
+        response = self.client.get(f'/api/v1/filelist/zip/?ids={ids}')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        with zipfile.ZipFile(io.BytesIO(b''.join(response.streaming_content))) as archive:
+            self.assertIsNone(archive.testzip())
+            contents = {name: archive.read(name) for name in archive.namelist()}
+        # Одинаковые имена в архиве получают номер
+        self.assertEqual(set(contents), {'001_report.txt', '002_report.txt', 'same.txt', 'same (1).txt'})
+        self.assertEqual(contents['001_report.txt'], str(self.files[1].file).encode())
+
+    def test_zip_download_strips_paths_from_names(self):
+        files = self.files[1:5]
+        for file_obj, name in zip(files, ('../../.bashrc', '..\\..\\evil.txt', '/etc/passwd', '..')):
+            File.objects.filter(pk=file_obj.pk).update(name=name)
+            path = os.path.join(MEDIA_ROOT, str(file_obj.file))
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as file:
+                file.write(b'content')
+        ids = ','.join(str(file_obj.id) for file_obj in files)
+        response = self.client.get(f'/api/v1/filelist/zip/?ids={ids}')
+        with zipfile.ZipFile(io.BytesIO(b''.join(response.streaming_content))) as archive:
+            names = archive.namelist()
+        self.assertEqual(set(names), {'bashrc', 'evil.txt', 'passwd', f'{files[3].id}.bin'})
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, JOB_RETRY_DELAY=0, JOB_QUEUE_EAGER=False)
+class JobQueueTests(TestCase):
+    """
+    Фоновые задачи: удаление пользователя и повтор при ошибке.
+    """
+
+    def setUp(self):
+        self.client = APIClient()
+        self.admin = User.objects.create(username='admin', is_staff=True)
+        self.client.force_authenticate(self.admin)
+
+    def test_user_deletion_is_queued(self):
+        user = User.objects.create(username='victim')
+        File.objects.create(creator=user, name='a.txt', file=f'user_{user.id}/a.txt', size=1)
+        directory = os.path.join(MEDIA_ROOT, f'user_{user.id}')
+        os.makedirs(directory, exist_ok=True)
+
+        response = self.client.delete(f'/api/v1/admin/users/{user.id}/')
+        self.assertEqual(response.status_code, 202)
+        user.refresh_from_db()
+        self.assertFalse(user.is_active)
+        self.assertNotIn(user.id, [item['id'] for item in self.client.get('/api/v1/admin/users/').data['results']])
+
+        self.assertEqual(run_pending(), 1)
+        self.assertFalse(User.objects.filter(pk=user.id).exists())
+        self.assertFalse(File.objects.filter(creator_id=user.id).exists())
+        self.assertFalse(os.path.exists(directory))
+        self.assertEqual(Job.objects.get(pk=response.data['job']['id']).status, Job.DONE)
+
+    def test_failed_user_deletion_returns_user_to_list(self):
+        user = User.objects.create(username='victim')
+        response = self.client.delete(f'/api/v1/admin/users/{user.id}/')
+        listed = self.client.get('/api/v1/admin/users/')
+        self.assertNotIn(user.id, [item['id'] for item in listed.data['results']])
+
+        Job.objects.filter(pk=response.data['job']['id']).update(max_attempts=1)
+        with mock.patch('mycloud.tasks.remove_user_content', side_effect=OSError('storage unavailable')):
+            self.assertEqual(run_pending(), 1)
+        self.assertEqual(Job.objects.get(pk=response.data['job']['id']).status, Job.FAILED)
+        # Пользователь не удалён: администратор снова видит его, сохранённый список устарел
+        response = self.client.get('/api/v1/admin/users/', HTTP_IF_NONE_MATCH=listed['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(user.id, [item['id'] for item in response.data['results']])
+
+    def test_user_deletion_releases_shared_blobs_once(self):
+        user = User.objects.create(username='victim')
+        other = User.objects.create(username='other')
+        for owner, content in ((user, b'shared content'), (other, b'shared content'), (user, b'own content')):
+            self.client.force_authenticate(owner)
+            response = self.client.post(
+                '/api/v1/filelist/', {'file': SimpleUploadedFile('a.txt', content)}, format='multipart'
+            )
+            self.assertEqual(response.status_code, 201)
+        shared = Blob.objects.get(digest=hashlib.sha256(b'shared content').hexdigest())
+        own = Blob.objects.get(digest=hashlib.sha256(b'own content').hexdigest())
+        self.assertEqual(shared.ref_count, 2)
+
+        # Хранилище недоступно при первой попытке: повтор задачи не должен потерять или повторно снять ссылки
+        delete = default_storage.delete
+        failures = [OSError('storage unavailable')]
+
+        def flaky_delete(name):
+            if failures:
+                raise failures.pop()
+            return delete(name)
+
+        job = Job.objects.create(kind='delete_user', payload={'user_id': user.id}, max_attempts=2)
+        with mock.patch.object(default_storage, 'delete', side_effect=flaky_delete):
+            self.assertEqual(run_pending(), 2)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.DONE, 2))
+        self.assertFalse(User.objects.filter(pk=user.id).exists())
+        shared.refresh_from_db()
+        self.assertEqual(shared.ref_count, 1)
+        self.assertTrue(default_storage.exists(shared.file.name))
+        self.assertFalse(Blob.objects.filter(pk=own.pk).exists())
+
+    def test_failed_job_is_retried(self):
+        calls = []
+
+        @job_handler('test_flaky')
+        def flaky():
+            calls.append(1)
+            if len(calls) < 2:
+                raise RuntimeError('temporary failure')
+            return {'calls': len(calls)}
+
+        job = Job.objects.create(kind='test_flaky', max_attempts=2)
+        self.assertEqual(run_pending(), 2)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts, job.result), (Job.DONE, 2, {'calls': 2}))
+        self.assertIn('temporary failure', job.last_error)
+
+    def test_job_visible_to_creator_only(self):
+        job = Job.objects.create(kind='sweep_orphans', creator=self.admin)
+        other = User.objects.create(username='other')
+        self.client.force_authenticate(other)
+        self.assertEqual(self.client.get(f'/api/v1/jobs/{job.id}/').status_code, 404)
+
+
+class ReconcileTests(TestCase):
+    """
+    Сверка MEDIA_ROOT с таблицами File и Blob.
+    """
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp(prefix='mycloud-reconcile-')
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        override = override_settings(MEDIA_ROOT=self.media_root)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.user = User.objects.create(username='owner')
+
+    def write(self, name, age=24 * 60 * 60):
+        path = os.path.join(self.media_root, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as file:
+            file.write(b'x')
+        mtime = seconds_since_epoch() - age
+        os.utime(path, (mtime, mtime))
+        return path
+
+    def test_iter_media_files_resumes_in_order(self):
+        names = ['a/1', 'a/b/2', 'a/c', 'b', 'c/d/e/3', 'uploads/x.part']
+        for name in names:
+            self.write(name)
+        walked = [name for name, _ in iter_media_files(self.media_root, exclude={'uploads'})]
+        self.assertEqual(walked, sorted(names[:-1], key=lambda name: name.split('/')))
+        for position, name in enumerate(walked):
+            resumed = [item for item, _ in iter_media_files(self.media_root, after=name, exclude={'uploads'})]
+            self.assertEqual(resumed, walked[position + 1:])
+
+    def test_reconcile_report_and_repair(self):
+        user_directory = f'user_{self.user.id}'
+        kept = File.objects.create(creator=self.user, name='kept.txt', file=f'{user_directory}/kept.txt', size=1)
+        self.write(str(kept.file))
+        File.objects.create(creator=self.user, name='lost.txt', file=f'{user_directory}/lost.txt', size=1)
+        UserUsage.objects.create(user=self.user, file_count=2, total_size=2)
+        orphan = self.write(f'{user_directory}/orphan.txt')
+        young = self.write(f'{user_directory}/young.txt', age=0)
+        blob = Blob.objects.create(digest='a' * 64, file='blobs/aa/aa/' + 'a' * 64, size=1, ref_count=3)
+        self.write(blob.file.name)
+        File.objects.create(creator=self.user, name='blob.txt', file=blob.file.name, size=1, blob=blob)
+        UserUsage.objects.filter(user=self.user).update(file_count=3, total_size=3)
+
+        found = []
+        summary = Reconciler(batch_size=2, report=lambda kind, detail: found.append((kind, detail))).run()
+        self.assertEqual(summary, {ORPHAN_FILE: 1, DANGLING_ROW: 1, BLOB_REFS: 1})
+        self.assertIn((ORPHAN_FILE, f'{user_directory}/orphan.txt'), found)
+        self.assertTrue(os.path.exists(orphan))
+
+        Reconciler(repair=True, batch_size=2).run()
+        self.assertFalse(os.path.exists(orphan))
+        self.assertTrue(os.path.exists(young))
+        self.assertEqual(list(File.objects.values_list('name', flat=True).order_by('name')), ['blob.txt', 'kept.txt'])
+        self.assertEqual(Blob.objects.get(pk=blob.pk).ref_count, 1)
+        self.assertEqual(UserUsage.objects.get(user=self.user).file_count, 2)
+        self.assertEqual(Reconciler(batch_size=2).run(), {ORPHAN_FILE: 0, DANGLING_ROW: 0, BLOB_REFS: 0})
+
+    def test_reconcile_resumes_from_checkpoint(self):
+        for number in range(5):
+            self.write(f'user_{self.user.id}/{number}.txt')
+        checkpoint = self.media_root + '.checkpoint'
+        self.addCleanup(lambda: os.path.exists(checkpoint) and os.remove(checkpoint))
+
+        def interrupt(kind, detail):
+            if detail.endswith('2.txt'):
+                raise KeyboardInterrupt
+        with self.assertRaises(KeyboardInterrupt):
+            Reconciler(batch_size=2, checkpoint=checkpoint, report=interrupt).run()
+
+        found = []
+        Reconciler(batch_size=2, checkpoint=checkpoint, report=lambda kind, detail: found.append(detail)).run()
+        # Первая пачка (0, 1) сохранена в checkpoint, сверка продолжается со второй
+        self.assertEqual(found, [f'user_{self.user.id}/{number}.txt' for number in range(2, 5)])
+        self.assertFalse(os.path.exists(checkpoint))
+
+    def test_rows_are_checked_against_storage_listing(self):
+        for number in range(5):
+            name = f'user_{self.user.id}/{number}.txt'
+            self.write(name)
+            File.objects.create(creator=self.user, name=f'{number}.txt', file=name, size=1)
+        with mock.patch.object(default_storage, 'exists') as exists:
+            summary = Reconciler(repair=True, batch_size=2).run()
+        exists.assert_not_called()
+        self.assertEqual(summary[DANGLING_ROW], 0)
+
+    def test_repair_refused_when_storage_looks_unavailable(self):
+        for number in range(5):
+            name = f'user_{self.user.id}/{number}.txt'
+            File.objects.create(creator=self.user, name=f'{number}.txt', file=name, size=1)
+        with self.assertRaises(UnsafeRepairError):
+            Reconciler(repair=True, batch_size=2).run()
+        self.assertEqual(File.objects.count(), 5)
+        with self.assertRaises(CommandError):
+            call_command('reconcile_storage', '--repair', stdout=io.StringIO())
+        self.assertEqual(File.objects.count(), 5)
+
+        call_command('reconcile_storage', '--repair', '--force', stdout=io.StringIO())
+        self.assertFalse(File.objects.exists())
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, DOWNLOAD_STATS_FLUSH_INTERVAL=3600)
+class DigestTests(TestCase):
+    """
+    Хэш содержимого считается при загрузке и используется как ETag.
+    """
+    content = b'digest test content'
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create(username='owner')
+        self.client.force_authenticate(self.user)
+        get_cache().clear()
+        self.addCleanup(download_recorder.flush)
+
+    def upload(self, **data):
+        return self.client.post(
+            '/api/v1/filelist/', {'file': SimpleUploadedFile('notes.txt', self.content), **data}, format='multipart'
+        )
+
+    def test_upload_stores_digest_and_serves_it_as_etag(self):
+        digest = hashlib.sha256(self.content).hexdigest()
+        response = self.upload()
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['digest'], digest)
+        file_obj = File.objects.get(pk=response.data['id'])
+        self.assertEqual(file_obj.digest, digest)
+
+        response = self.client.get(f'/api/v1/download/{file_obj.hash}/')
+        self.assertEqual(response['ETag'], f'"{digest}"')
+        response = self.client.get(f'/api/v1/download/{file_obj.hash}/', HTTP_IF_NONE_MATCH=f'"{digest}"')
+        self.assertEqual(response.status_code, 304)
+        with override_settings(DOWNLOAD_BACKEND='nginx'):
+            response = self.client.get(f'/api/v1/download/{file_obj.hash}/', HTTP_IF_NONE_MATCH=f'"{digest}"')
+            self.assertEqual(response.status_code, 304)
+
+    def test_upload_with_wrong_digest_is_rejected(self):
+        response = self.upload(digest='0' * 64)
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(File.objects.filter(creator=self.user).exists())
+
+    def test_upload_session_short_circuits_known_content(self):
+        digest = self.upload().data['digest']
+        response = self.client.post(
+            '/api/v1/uploads/', {'name': 'again.txt', 'size': len(self.content), 'digest': digest.upper()}, format='json'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.data['duplicate'])
+        self.assertEqual(self.client.get(f'/api/v1/filelist/?digest={digest}').data['files'][0]['digest'], digest)
+
+    def test_upload_session_verifies_digest(self):
+        response = self.client.post(
+            '/api/v1/uploads/', {'name': 'a.txt', 'size': len(self.content), 'digest': '1' * 64}, format='json'
+        )
+        self.assertEqual(response.status_code, 201)
+        session_id = response.data['id']
+        self.client.put(
+            f'/api/v1/uploads/{session_id}/chunks/0/', self.content, content_type='application/octet-stream'
+        )
+        response = self.client.post(f'/api/v1/uploads/{session_id}/complete/')
+        self.assertEqual(response.status_code, 202)
+        run_pending()
+        job = Job.objects.get(pk=response.data['job']['id'])
+        self.assertEqual(job.status, Job.FAILED)
+        self.assertEqual(job.attempts, 1)
+        self.assertIn('does not match expected', job.last_error)
+        # Сессия остаётся, части можно переслать и завершить загрузку снова
+        self.assertIsNone(self.client.get(f'/api/v1/uploads/{session_id}/').data['job'])
+        self.assertFalse(File.objects.filter(creator=self.user).exists())
+
+
+class ReshardTests(TestCase):
+    """
+    Перенос файлов в шардированную раскладку.
+    """
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp(prefix='mycloud-reshard-')
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        override = override_settings(MEDIA_ROOT=self.media_root)
+        override.enable()
+        self.addCleanup(override.disable)
+        get_cache().clear()
+        self.user = User.objects.create(username='owner')
+
+    def write(self, name):
+        path = os.path.join(self.media_root, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as file:
+            file.write(name.encode())
+        return path
+
+    def test_reshard_moves_flat_files(self):
+        files = []
+        for number in range(5):
+            name = f'user_{self.user.id}/{number}_report.txt'
+            self.write(name)
+            files.append(File.objects.create(creator=self.user, name=f'{number}_report.txt', file=name, size=1))
+        digest = 'ab' * 32
+        blob = Blob.objects.create(digest=digest, file=f'blobs/{digest}', size=1, ref_count=1)
+        self.write(blob.file.name)
+        File.objects.create(creator=self.user, name='blob.txt', file=blob.file.name, size=1, blob=blob)
+        get_file_info(str(files[0].hash))
+
+        self.assertEqual(reshard(dry_run=True), {'files': 5, 'blobs': 1})
+        self.assertEqual(reshard(batch_size=2, grace=0), {'files': 5, 'blobs': 1})
+        for file_obj in files:
+            file_obj.refresh_from_db()
+            parts = str(file_obj.file).split('/')
+            self.assertEqual(len(parts), 4)
+            self.assertEqual(parts[0], f'user_{self.user.id}')
+            with open(os.path.join(self.media_root, str(file_obj.file)), 'rb') as file:
+                self.assertEqual(file.read(), f'user_{self.user.id}/{parts[-1]}'.encode())
+        self.assertEqual(get_file_info(str(files[0].hash))['path'], str(files[0].file))
+        # В каталоге пользователя остались только подкаталоги шардов
+        with os.scandir(os.path.join(self.media_root, f'user_{self.user.id}')) as entries:
+            self.assertTrue(all(entry.is_dir() for entry in entries))
+        self.assertEqual(File.objects.get(blob=blob).file.name, f'blobs/ab/ab/{digest}')
+        self.assertFalse(os.path.exists(os.path.join(self.media_root, f'blobs/{digest}')))
+        # Повторный запуск ничего не переносит
+        self.assertEqual(reshard(grace=0), {'files': 0, 'blobs': 0})
+
+
+class LoggingTests(TestCase):
+    """
+    Фоновая запись структурированного лога, request_id и выборка записей.
+    """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix='mycloud-log-')
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+        self.path = os.path.join(self.directory, 'app.log')
+        self.logger = logging.getLogger('mycloud.tests.logging')
+        self.logger.propagate = False
+        self.addCleanup(setattr, self.logger, 'propagate', True)
+
+    def handler(self, **options):
+        handler = BackgroundRotatingFileHandler(self.path, **options)
+        handler.setFormatter(JsonFormatter())
+        handler.addFilter(RequestIdFilter())
+        self.logger.addHandler(handler)
+        self.addCleanup(self.logger.removeHandler, handler)
+        self.addCleanup(handler.close)
+        return handler
+
+    def records(self):
+        with open(self.path, encoding='utf-8') as file:
+            return [json.loads(line) for line in file]
+
+    def test_records_are_written_as_json_with_request_id(self):
+        handler = self.handler()
+
+        def view(request):
+            self.logger.info('Listing %d files', 3, extra={'user_id': 7})
+            try:
+                1 / 0
+            except ZeroDivisionError:
+                self.logger.exception('Failed')
+            return HttpResponse()
+
+        response = RequestIdMiddleware(view)(RequestFactory().get('/', HTTP_X_REQUEST_ID='lb-42'))
+        self.assertEqual(response['X-Request-ID'], 'lb-42')
+        handler.flush()
+        listing, failure = self.records()
+        self.assertEqual((listing['message'], listing['request_id'], listing['user_id']), ('Listing 3 files', 'lb-42', 7))
+        self.assertEqual(failure['level'], 'ERROR')
+        self.assertIn('ZeroDivisionError', failure['exc'])
+
+        response = self.client.get('/api/v1/filelist/')
+        self.assertEqual(len(response['X-Request-ID']), 32)
+
+    def test_files_are_rotated_by_size(self):
+        handler = self.handler(max_bytes=1024, backup_count=2)
+        for number in range(100):
+            self.logger.info('Record number %d', number)
+        handler.flush()
+        self.assertTrue(os.path.exists(f'{self.path}.1'))
+        self.assertLessEqual(os.path.getsize(self.path), 1024)
+
+    def test_sampling_keeps_warnings(self):
+        sampling = SamplingFilter({'mycloud.downloads': 0})
+        record = lambda name, level: logging.LogRecord(name, level, __file__, 0, 'event', None, None)
+        self.assertFalse(sampling.filter(record('mycloud.downloads', logging.INFO)))
+        self.assertTrue(sampling.filter(record('mycloud.downloads', logging.WARNING)))
+        self.assertTrue(sampling.filter(record('mycloud', logging.INFO)))
+        half = SamplingFilter({'mycloud': 0.5})
+        # Записи одного запроса сохраняются или отбрасываются вместе
+        decisions = set()
+        for _ in range(5):
+            event = record('mycloud.downloads', logging.INFO)
+            event.request_id = 'same-request'
+            decisions.add(half.filter(event))
+        self.assertEqual(len(decisions), 1)
+
+
+@override_settings(JOB_QUEUE_EAGER=False, AUTH_CACHE_TIMEOUT=300)
+class AuthCacheTests(TestCase):
+    """
+    Кэш аутентификации по токену и Basic.
+    """
+
+    def setUp(self):
+        get_cache().clear()
+        self.user = User.objects.create_user(username='owner', password='Secret-pass-1')
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+
+    def auth_queries(self, **credentials):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/v1/admin/users/', **credentials)
+        return response, [query['sql'] for query in queries if 'authtoken_token' in query['sql']
+                          or 'FROM "auth_user" WHERE "auth_user"."username"' in query['sql']]
+
+    def test_token_is_resolved_from_cache_until_logout(self):
+        credentials = {'HTTP_AUTHORIZATION': f'Token {self.token.key}'}
+        response, queries = self.auth_queries(**credentials)
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(len(queries), 1)
+        response, queries = self.auth_queries(**credentials)
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(queries, [])
+
+        # Статус администратора применяется сразу
+        admin = User.objects.create(username='admin', is_staff=True)
+        self.client.force_authenticate(admin)
+        self.client.patch(f'/api/v1/admin/users/{self.user.id}/')
+        self.client.force_authenticate(None)
+        self.assertEqual(self.client.get('/api/v1/admin/users/', **credentials).status_code, 200)
+
+        self.assertEqual(self.client.post('/auth/token/logout/', **credentials).status_code, 204)
+        self.assertEqual(self.client.get('/api/v1/admin/users/', **credentials).status_code, 401)
+
+    def test_deleted_user_loses_access(self):
+        credentials = {'HTTP_AUTHORIZATION': f'Token {self.token.key}'}
+        self.assertEqual(self.client.get('/api/v1/filelist/', **credentials).status_code, 200)
+        admin = User.objects.create(username='admin', is_staff=True)
+        self.client.force_authenticate(admin)
+        self.assertEqual(self.client.delete(f'/api/v1/admin/users/{self.user.id}/').status_code, 202)
+        self.client.force_authenticate(None)
+        self.assertEqual(self.client.get('/api/v1/filelist/', **credentials).status_code, 401)
+
+    def test_load_benchmark_cleanup_revokes_access(self):
+        credentials = {'HTTP_AUTHORIZATION': f'Token {self.token.key}'}
+        self.assertEqual(self.client.get('/api/v1/filelist/', **credentials).status_code, 200)
+        BenchLoadCommand(stdout=io.StringIO()).cleanup(None, self.user, [])
+        self.assertEqual(self.client.get('/api/v1/filelist/', **credentials).status_code, 401)
+        self.assertTrue(Job.objects.filter(kind='delete_user', payload={'user_id': self.user.id}).exists())
+
+    def test_basic_password_check_is_cached(self):
+        valid = {'HTTP_AUTHORIZATION': 'Basic ' + base64.b64encode(b'owner:Secret-pass-1').decode()}
+        wrong = {'HTTP_AUTHORIZATION': 'Basic ' + base64.b64encode(b'owner:wrong').decode()}
+        response, queries = self.auth_queries(**valid)
+        self.assertEqual((response.status_code, len(queries)), (403, 1))
+        response, queries = self.auth_queries(**valid)
+        self.assertEqual((response.status_code, queries), (403, []))
+        self.assertEqual(self.client.get('/api/v1/admin/users/', **wrong).status_code, 401)
+
+        self.user.set_password('Other-pass-2')
+        self.user.save()
+        self.assertEqual(self.client.get('/api/v1/admin/users/', **valid).status_code, 401)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, DOWNLOAD_STATS_FLUSH_INTERVAL=3600)
+class ConditionalListTests(TestCase):
+    """
+    Слабые ETag списков файлов и пользователей и рендерер orjson.
+    """
+
+    def setUp(self):
+        get_cache().clear()
+        self.user = User.objects.create(username='owner')
+        self.admin = User.objects.create(username='admin', is_staff=True)
+        self.files = [
+            File.objects.create(creator=self.user, name=f'{number}.txt', file=f'user_{self.user.id}/{number}.txt', size=1)
+            for number in range(3)
+        ]
+        record_usage(self.user.id, files=3, size=3)
+        self.client = APIClient()
+
+    def assertNotModified(self, url, etag, queries=1):
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(response.content, b'')
+        self.assertLessEqual(len(captured), queries)
+
+    def test_file_list_revalidation(self):
+        self.client.force_authenticate(self.user)
+        response = self.client.get('/api/v1/filelist/')
+        etag = response['ETag']
+        self.assertTrue(etag.startswith('W/"'))
+        self.assertEqual(response['Cache-Control'], 'private, no-cache')
+        self.assertNotModified('/api/v1/filelist/', etag)
+        # Другие параметры запроса - другой ответ
+        self.assertNotEqual(self.client.get('/api/v1/filelist/?page_size=1')['ETag'], etag)
+
+        self.client.patch(f'/api/v1/filelist/{self.files[0].id}/', {'comment': 'changed'}, format='json')
+        response = self.client.get('/api/v1/filelist/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+        etag = response['ETag']
+        download_recorder.record(self.files[1].id, seconds_since_epoch(), True)
+        download_recorder.flush()
+        response = self.client.get('/api/v1/filelist/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(sum(file['download_count'] for file in response.data['files']), 1)
+
+    def test_admin_lists_revalidation(self):
+        self.client.force_authenticate(self.admin)
+        users_etag = self.client.get('/api/v1/admin/users/')['ETag']
+        files_url = f'/api/v1/admin/users/{self.user.id}/files/'
+        files_etag = self.client.get(files_url)['ETag']
+        self.assertNotModified('/api/v1/admin/users/', users_etag)
+        self.assertNotModified(files_url, files_etag, queries=2)
+
+        self.client.patch(f'/api/v1/admin/users/{self.user.id}/')
+        response = self.client.get('/api/v1/admin/users/', HTTP_IF_NONE_MATCH=users_etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(next(user for user in response.data['results'] if user['id'] == self.user.id)['is_staff'])
+
+        users_etag = response['ETag']
+        User.objects.create(username='newcomer')
+        self.assertEqual(self.client.get('/api/v1/admin/users/', HTTP_IF_NONE_MATCH=users_etag).status_code, 200)
+
+        self.client.post('/api/v1/filelist/bulk-delete/', {'ids': [self.files[0].id]}, format='json')
+        self.assertEqual(self.client.get(files_url, HTTP_IF_NONE_MATCH=files_etag).status_code, 200)
+
+    def test_orjson_renderer_matches_json_renderer(self):
+        data = {'files': [{'id': 1, 'name': 'отчёт.txt', 'size': Decimal('1.5'), 'hash': generating_uuid()}], 1: None}
+        self.assertEqual(json.loads(ORJSONRenderer().render(data)), json.loads(JSONRenderer().render(data)))
+        self.assertEqual(ORJSONRenderer().render(None), b'')
+        self.assertIn(b'\n  ', ORJSONRenderer().render(data, 'application/json; indent=4'))
+
+
+class MetricsTests(TestCase):
+    """
+    Метрики запросов и эндпоинт /metrics.
+    """
+    content = b'metrics test content' * 100
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create(username='owner')
+        self.client.force_authenticate(self.user)
+        get_cache().clear()
+        self.addCleanup(download_recorder.flush)
+
+    def sample(self, name, **labels):
+        return REGISTRY.get_sample_value(name, labels) or 0
+
+    def test_request_metrics_are_recorded(self):
+        view = {'view': 'api/v1/filelist/', 'method': 'GET'}
+        requests = self.sample('mycloud_request_duration_seconds_count', **view)
+        queries = self.sample('mycloud_request_db_queries_sum', **view)
+        with override_settings(METRICS_SERVER_TIMING=True):
+            response = self.client.get('/api/v1/filelist/')
+        self.assertRegex(response['Server-Timing'], r'app;dur=[\d.]+, db;dur=[\d.]+;desc="[1-9]\d* queries"')
+        self.assertEqual(self.sample('mycloud_request_duration_seconds_count', **view), requests + 1)
+        self.assertGreater(self.sample('mycloud_request_db_queries_sum', **view), queries)
+
+        file_obj = File.objects.get(pk=self.client.post(
+            '/api/v1/filelist/', {'file': SimpleUploadedFile('notes.txt', self.content)}, format='multipart'
+        ).data['id'])
+        view = {'view': 'api/v1/download/<str:hash>/', 'method': 'GET'}
+        read = self.sample('mycloud_storage_bytes_total', direction='read', **view)
+        requests = self.sample('mycloud_request_duration_seconds_count', **view)
+        response = self.client.get(f'/api/v1/download/{file_obj.hash}/')
+        self.assertRegex(response['Content-Disposition'], r'^attachment; filename=\d+_notes\.txt$')
+        # Потоковый ответ учитывается после передачи тела
+        self.assertEqual(b''.join(response.streaming_content), self.content)
+        self.assertEqual(self.sample('mycloud_request_duration_seconds_count', **view), requests + 1)
+        self.assertEqual(self.sample('mycloud_storage_bytes_total', direction='read', **view), read + len(self.content))
+
+        with override_settings(METRICS_PUBLIC=True):
+            response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'mycloud_request_duration_seconds_bucket{', response.content)
+
+    def test_streaming_file_is_observed_on_close(self):
+        path = os.path.join(tempfile.mkdtemp(prefix='mycloud-metrics-'), 'blob')
+        self.addCleanup(shutil.rmtree, os.path.dirname(path))
+        with open(path, 'wb') as file:
+            file.write(self.content)
+
+        def view(request):
+            response = FileResponse(open(path, 'rb'), content_type='text/plain')
+            response['Content-Disposition'] = 'attachment; filename=notes.txt'
+            return response
+        view_labels = {'view': UNMATCHED_VIEW, 'method': 'GET'}
+        requests = self.sample('mycloud_request_duration_seconds_count', **view_labels)
+        response = MetricsMiddleware(view)(RequestFactory().get('/'))
+        # Файл остаётся доступен WSGI-серверу для sendfile, заголовки view не перезаписаны
+        self.assertIsInstance(response.file_to_stream.fileno(), int)
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename=notes.txt')
+        self.assertEqual(response['Content-Length'], str(len(self.content)))
+        self.assertEqual(b''.join(response.streaming_content), self.content)
+        self.assertEqual(self.sample('mycloud_request_duration_seconds_count', **view_labels), requests)
+        response.close()
+        response.close()
+        self.assertEqual(self.sample('mycloud_request_duration_seconds_count', **view_labels), requests + 1)
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_metrics_endpoint_requires_token(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer secret').status_code, 200)
+
+    @override_settings(METRICS_TOKEN='', METRICS_PUBLIC=False)
+    def test_metrics_endpoint_is_closed_without_token(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 404)
+
+
+@unittest.skipIf(Image is None, 'Pillow is not installed')
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, JOB_QUEUE_EAGER=False, PREVIEW_SIZE=64)
+class PreviewTests(TestCase):
+    """
+    Превью изображений строятся фоновой задачей и удаляются вместе с содержимым.
+    """
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create(username='owner')
+        self.client.force_authenticate(self.user)
+        get_cache().clear()
+
+    def image(self, size=(400, 200), mode='RGBA'):
+        output = io.BytesIO()
+        Image.new(mode, size, (200, 30, 30, 128)).save(output, 'PNG')
+        return output.getvalue()
+
+    def upload(self, content, name):
+        response = self.client.post(
+            '/api/v1/filelist/', {'file': SimpleUploadedFile(name, content)}, format='multipart'
+        )
+        self.assertEqual(response.status_code, 201)
+        return File.objects.get(pk=response.data['id'])
+
+    def test_preview_is_generated_and_cached(self):
+        file_obj = self.upload(self.image(), 'photo.png')
+        self.assertFalse(file_obj.has_preview)
+        response = self.client.get(f'/api/v1/preview/{file_obj.hash}/')
+        self.assertEqual(response.status_code, 404)
+
+        self.assertEqual(run_pending(), 1)
+        file_obj.refresh_from_db()
+        self.assertTrue(file_obj.has_preview)
+        self.assertTrue(self.client.get('/api/v1/filelist/').data['files'][0]['has_preview'])
+
+        response = self.client.get(f'/api/v1/preview/{file_obj.hash}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+        self.assertIn('immutable', response['Cache-Control'])
+        with Image.open(io.BytesIO(response.content)) as preview:
+            self.assertEqual(preview.size, (64, 32))
+        response = self.client.get(f'/api/v1/preview/{file_obj.hash}/', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_preview_is_shared_and_removed_with_content(self):
+        content = self.image()
+        first = self.upload(content, 'photo.png')
+        second = self.upload(content, 'copy.png')
+        self.assertEqual(run_pending(), 2)
+        first.refresh_from_db()
+        self.assertEqual(first.file, second.file)
+        preview = preview_name(str(first.file))
+        self.assertTrue(default_storage.exists(preview))
+
+        self.assertEqual(self.client.delete(f'/api/v1/filedelete/{first.id}/').status_code, 204)
+        self.assertTrue(default_storage.exists(preview))
+        self.assertEqual(self.client.delete(f'/api/v1/filedelete/{second.id}/').status_code, 204)
+        self.assertFalse(default_storage.exists(preview))
+        self.assertEqual(self.client.get(f'/api/v1/preview/{second.hash}/').status_code, 404)
+
+    def test_only_images_are_previewed(self):
+        self.upload(b'plain text', 'notes.txt')
+        self.assertFalse(Job.objects.exists())
+        broken = self.upload(b'not really a jpeg', 'broken.jpg')
+        self.assertEqual(run_pending(), 1)
+        broken.refresh_from_db()
+        self.assertFalse(broken.has_preview)
+        self.assertEqual(Job.objects.get().status, Job.DONE)
+
+
+@override_settings(
+    MEDIA_ROOT=MEDIA_ROOT, FILE_COMPRESSION='gzip', FILE_COMPRESSION_MIN_SIZE=1024,
+    DOWNLOAD_STATS_FLUSH_INTERVAL=3600, UPLOAD_MIN_CHUNK_SIZE=1024,
+)
+class CompressionTests(TestCase):
+    """
+    Прозрачное сжатие содержимого в хранилище.
+    """
+    content = b'2024-01-01 12:00:00 INFO request handled in 12 ms\n' * 2000
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create(username='owner')
+        self.client.force_authenticate(self.user)
+        get_cache().clear()
+        self.addCleanup(download_recorder.flush)
+
+    def upload(self, content, name='server.log'):
+        response = self.client.post(
+            '/api/v1/filelist/', {'file': SimpleUploadedFile(name, content)}, format='multipart'
+        )
+        self.assertEqual(response.status_code, 201)
+        return File.objects.get(pk=response.data['id'])
+
+    def test_compressible_upload_is_stored_compressed(self):
+        file_obj = self.upload(self.content)
+        self.assertEqual((file_obj.encoding, file_obj.size), ('gzip', len(self.content)))
+        self.assertLess(file_obj.stored_size, len(self.content) // 10)
+        self.assertEqual(default_storage.size(str(file_obj.file)), file_obj.stored_size)
+        self.assertEqual(UserUsage.objects.get(user=self.user).total_size, len(self.content))
+        digest = hashlib.sha256(self.content).hexdigest()
+        self.assertEqual(file_obj.digest, digest)
+
+        # Клиент без Accept-Encoding получает распакованный файл
+        response = self.client.get(f'/api/v1/download/{file_obj.hash}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('Content-Encoding', response)
+        self.assertEqual(int(response['Content-Length']), len(self.content))
+        self.assertEqual(b''.join(response.streaming_content), self.content)
+        self.assertEqual(response['ETag'], f'"{digest}"')
+        self.assertIn('Accept-Encoding', response['Vary'])
+
+        # Клиент с gzip получает сжатые байты как есть
+        response = self.client.get(f'/api/v1/download/{file_obj.hash}/', HTTP_ACCEPT_ENCODING='br, gzip;q=0.8')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['ETag'], f'"{digest}-gzip"')
+        self.assertEqual(gzip.decompress(b''.join(response.streaming_content)), self.content)
+        response = self.client.get(
+            f'/api/v1/download/{file_obj.hash}/', HTTP_ACCEPT_ENCODING='gzip', HTTP_IF_NONE_MATCH=f'"{digest}-gzip"'
+        )
+        self.assertEqual(response.status_code, 304)
+        response = self.client.get(f'/api/v1/download/{file_obj.hash}/', HTTP_ACCEPT_ENCODING='gzip;q=0')
+        self.assertNotIn('Content-Encoding', response)
+
+    def test_incompressible_upload_is_stored_as_is(self):
+        content = os.urandom(64 * 1024)
+        file_obj = self.upload(content, 'photo.jpg')
+        self.assertEqual((file_obj.encoding, file_obj.stored_size), ('', None))
+        response = self.client.get(f'/api/v1/download/{file_obj.hash}/', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertNotIn('Content-Encoding', response)
+        self.assertEqual(b''.join(response.streaming_content), content)
+
+    @override_settings(FILE_COMPRESSION='zstd', FILE_DEDUPLICATION=False)
+    def test_chunked_upload_with_zstd(self):
+        try:
+            import zstandard
+        except ImportError:
+            self.skipTest('zstandard is not installed')
+        chunk_size = 32 * 1024
+        response = self.client.post(
+            '/api/v1/uploads/', {'name': 'dump.csv', 'size': len(self.content), 'chunk_size': chunk_size}, format='json'
+        )
+        session_id = response.data['id']
+        for index in range(response.data['total_chunks']):
+            self.client.put(
+                f'/api/v1/uploads/{session_id}/chunks/{index}/',
+                self.content[index * chunk_size:(index + 1) * chunk_size], content_type='application/octet-stream',
+            )
+        response = self.client.post(f'/api/v1/uploads/{session_id}/complete/')
+        self.assertEqual(response.status_code, 202)
+        run_pending()
+        file_obj = File.objects.get(pk=Job.objects.get(pk=response.data['job']['id']).result['file']['id'])
+        self.assertEqual(file_obj.encoding, 'zstd')
+        with default_storage.open(str(file_obj.file)) as file:
+            self.assertEqual(zstandard.ZstdDecompressor().decompressobj().decompress(file.read()), self.content)
+
+        response = self.client.get(f'/api/v1/filelist/zip/?ids={file_obj.id}')
+        with zipfile.ZipFile(io.BytesIO(b''.join(response.streaming_content))) as archive:
+            self.assertEqual(archive.read(archive.namelist()[0]), self.content)
+
+
+@override_settings(DB_REPLICA_ALIAS='replica', DB_REPLICA_STICKY_SECONDS=10)
+class ReplicaRoutingTests(TestCase):
+    """
+    Чтение из реплики в представлениях только на чтение и закрепление за основной базой после записи.
+    """
+
+    def setUp(self):
+        get_cache().clear()
+        self.user = User.objects.create(username='owner')
+        self.router = ReplicaRouter()
+        self.factory = RequestFactory()
+
+    def run_request(self, request, view):
+        request.user = self.user
+        return ReplicaMiddleware(view)(request)
+
+    def test_reads_go_to_replica_until_write(self):
+        aliases = []
+
+        def view(request):
+            aliases.append(self.router.db_for_read(File))
+            self.assertTrue(read_from_replica(request, request.user))
+            aliases.append(self.router.db_for_read(File))
+            self.assertTrue(read_from_primary())
+            aliases.append(self.router.db_for_read(File))
+            read_from_replica(request, request.user)
+            aliases.append(self.router.db_for_write(File))
+            aliases.append(self.router.db_for_read(File))
+            return HttpResponse()
+
+        response = self.run_request(self.factory.get('/api/v1/filelist/'), view)
+        self.assertEqual(aliases, ['default', 'replica', 'default', 'default', 'default'])
+        # Запись в GET (статистика скачиваний) не закрепляет клиента
+        self.assertNotIn(PRIMARY_COOKIE, response.cookies)
+        self.assertFalse(self.router.allow_migrate('replica', 'mycloud'))
+        self.assertIsNone(self.router.allow_migrate('default', 'mycloud'))
+
+    def test_read_your_writes_after_upload(self):
+        def upload(request):
+            self.router.db_for_write(File)
+            return HttpResponse(status=201)
+
+        response = self.run_request(self.factory.post('/api/v1/filelist/'), upload)
+        cookie = response.cookies[PRIMARY_COOKIE]
+        self.assertEqual(cookie['max-age'], 10)
+
+        def list_files(request):
+            return HttpResponse(str(read_from_replica(request, request.user)))
+
+        # Тот же браузер с cookie и тот же пользователь без cookie читают из основной базы
+        self.factory.cookies[PRIMARY_COOKIE] = cookie.value
+        self.assertEqual(self.run_request(self.factory.get('/api/v1/filelist/'), list_files).content, b'False')
+        self.factory.cookies.clear()
+        self.assertEqual(self.run_request(self.factory.get('/api/v1/filelist/'), list_files).content, b'False')
+        get_cache().clear()
+        self.assertEqual(self.run_request(self.factory.get('/api/v1/filelist/'), list_files).content, b'True')
+
+    @override_settings(DB_REPLICA_ALIAS='')
+    def test_without_replica(self):
+        def view(request):
+            return HttpResponse()
+
+        with self.assertRaises(MiddlewareNotUsed):
+            ReplicaMiddleware(view)
+        self.assertEqual(self.router.db_for_read(File), 'default')
+
+
+class BenchTests(TestCase):
+    """
+    Сводки и сравнение отчётов нагрузочных команд.
+    """
+
+    def test_summary_and_regressions(self):
+        self.assertEqual(parse_size('1K'), 1024)
+        self.assertEqual(parse_size('2G'), 2 * 1024 ** 3)
+        self.assertEqual(parse_size('512'), 512)
+        durations = [index / 100 for index in range(1, 101)]
+        self.assertEqual(percentile(durations, 50), 0.5)
+        self.assertEqual(percentile(durations, 99), 0.99)
+        summary = summarize(durations, elapsed=10, size=1000)
+        self.assertEqual(summary['per_second'], 10)
+        self.assertEqual(summary['bytes_per_second'], 100)
+
+        baseline = {'list': summary, 'removed': summary}
+        self.assertEqual(compare_reports({'list': summary}, baseline, 0.1), [])
+        slower = summarize([value * 2 for value in durations], elapsed=20, size=1000)
+        regressions = {(name, metric) for name, metric, *_ in compare_reports({'list': slower}, baseline, 0.1)}
+        self.assertIn(('list', 'p95'), regressions)
+        self.assertIn(('list', 'per_second'), regressions)
+
+    def test_serializer_benchmarks_leave_no_data(self):
+        directory = tempfile.mkdtemp(prefix='mycloud-bench-')
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        media_root = os.path.join(directory, 'media')
+        output = os.path.join(directory, 'report.json')
+        with override_settings(MEDIA_ROOT=media_root):
+            call_command(
+                'bench_serializers', users=5, files=20, creates=2, repeat=1, output=output, stdout=io.StringIO()
+            )
+            self.assertEqual(list(iter_media_files(media_root)), [])
+        self.assertFalse(User.objects.exists())
+        self.assertFalse(File.objects.exists())
+        with open(output) as file:
+            report = json.load(file)
+        self.assertEqual(report['benchmark'], 'serializers')
+        self.assertEqual(
+            set(report['results']), {'file_write_create', 'file_read_list', 'file_list_render', 'user_admin_list'}
+        )
+        self.assertEqual(report['results']['file_read_list']['count'], 1)
+
+
+@unittest.skipIf(mock_aws is None, 'moto is not installed')
+@override_settings(
+    STORAGES={'default': {'BACKEND': 'mycloud.backends.S3Storage'}},
+    S3_BUCKET='mycloud-tests', S3_PREFIX='media', S3_REGION='us-east-1', S3_ENDPOINT_URL='',
+    S3_ACCESS_KEY_ID='testing', S3_SECRET_ACCESS_KEY='testing', S3_PRESIGNED_DOWNLOADS=True,
+    DOWNLOAD_STATS_FLUSH_INTERVAL=3600, JOB_QUEUE_EAGER=True,
+)
+class S3StorageTests(TestCase):
+    """
+    Хранение файлов в S3-совместимом хранилище (эмулируется moto).
+    """
+    content = b's3 test content'
+
+    def setUp(self):
+        mock = mock_aws()
+        mock.start()
+        self.addCleanup(mock.stop)
+        default_storage.client.create_bucket(Bucket='mycloud-tests')
+        self.client = APIClient()
+        self.user = User.objects.create(username='owner')
+        self.client.force_authenticate(self.user)
+        get_cache().clear()
+        self.addCleanup(download_recorder.flush)
+
+    def keys(self):
+        response = default_storage.client.list_objects_v2(Bucket='mycloud-tests')
+        return sorted(item['Key'] for item in response.get('Contents', ()))
+
+    def upload(self):
+        response = self.client.post(
+            '/api/v1/filelist/', {'file': SimpleUploadedFile('notes.txt', self.content)}, format='multipart'
+        )
+        self.assertEqual(response.status_code, 201)
+        return File.objects.get(pk=response.data['id'])
+
+    def test_upload_download_and_delete(self):
+        file_obj = self.upload()
+        self.assertEqual(self.keys(), [f'media/{file_obj.file}'])
+
+        response = self.client.get(f'/api/v1/download/{file_obj.hash}/')
+        self.assertEqual(response.status_code, 302)
+        self.assertIn('X-Amz-Signature=', response['Location'])
+        self.assertIn('response-content-disposition=attachment', response['Location'])
+
+        response = self.client.delete(f'/api/v1/filedelete/{file_obj.id}/')
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(self.keys(), [])
+
+    @override_settings(STORAGES={'default': {'BACKEND': 'mycloud.backends.S3Storage'}}, S3_PRESIGNED_DOWNLOADS=False)
+    def test_download_streams_without_presigned_urls(self):
+        file_obj = self.upload()
+        response = self.client.get(f'/api/v1/download/{file_obj.hash}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), self.content)
+        response = self.client.get(f'/api/v1/download/{file_obj.hash}/', HTTP_RANGE='bytes=3-6')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b''.join(response.streaming_content), self.content[3:7])
+
+    def test_chunked_upload_uses_multipart(self):
+        chunk_size = default_storage.min_upload_part_size
+        content = os.urandom(chunk_size) + b'tail'
+        response = self.client.post(
+            '/api/v1/uploads/', {'name': 'big.bin', 'size': len(content), 'chunk_size': chunk_size // 2}, format='json'
+        )
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post(
+            '/api/v1/uploads/', {'name': 'big.bin', 'size': len(content), 'chunk_size': chunk_size}, format='json'
+        )
+        self.assertEqual(response.status_code, 201)
+        session_id = response.data['id']
+        # Части принимаются в любом порядке
+        for index in (1, 0):
+            response = self.client.put(
+                f'/api/v1/uploads/{session_id}/chunks/{index}/',
+                content[index * chunk_size:(index + 1) * chunk_size], content_type='application/octet-stream',
+            )
+            self.assertEqual(response.status_code, 200)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(f'/api/v1/uploads/{session_id}/complete/')
+        self.assertEqual(response.status_code, 202)
+        result = Job.objects.get(pk=response.data['job']['id']).result
+        self.assertEqual(result['file']['digest'], hashlib.sha256(content).hexdigest())
+
+        file_obj = File.objects.get(pk=result['file']['id'])
+        self.assertEqual(self.keys(), [f'media/{file_obj.file}'])
+        with default_storage.open(str(file_obj.file)) as file:
+            self.assertEqual(file.read(), content)
+
+    def test_user_deletion_removes_prefix(self):
+        with override_settings(FILE_DEDUPLICATION=False):
+            self.upload()
+        admin = User.objects.create(username='admin', is_staff=True)
+        self.client.force_authenticate(admin)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.delete(f'/api/v1/admin/users/{self.user.id}/')
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(self.keys(), [])
@@ -0,0 +1,41 @@
+from django.core.files.uploadhandler import MemoryFileUploadHandler, TemporaryFileUploadHandler
+
+from .utils import new_hasher
+
+
+class HashingUploadHandlerMixin:
+    """
+    Считает хэш содержимого (FILE_DIGEST_ALGORITHM) по мере поступления данных загрузки.
+
+    Хэш вычисляется в том же проходе, в котором обработчик пишет данные в память или на диск,
+    и сохраняется в атрибуте digest загруженного файла, повторное чтение файла не требуется.
+    """
+
+    def new_file(self, *args, **kwargs):
+        self.hasher = new_hasher()
+        super().new_file(*args, **kwargs)
+
+    def receive_data_chunk(self, raw_data, start):
+        remaining = super().receive_data_chunk(raw_data, start)
+        if remaining is None:
+            # Данные приняты этим обработчиком, а не переданы следующему
+            self.hasher.update(raw_data)
+        return remaining
+
+    def file_complete(self, file_size):
+        file = super().file_complete(file_size)
+        if file is not None:
+            file.digest = self.hasher.hexdigest()
+        return file
+
+
+class HashingMemoryFileUploadHandler(HashingUploadHandlerMixin, MemoryFileUploadHandler):
+    """
+    Обработчик небольших загрузок в память с подсчётом хэша.
+    """
+
+
+class HashingTemporaryFileUploadHandler(HashingUploadHandlerMixin, TemporaryFileUploadHandler):
+    """
+    Обработчик загрузок во временный файл с подсчётом хэша.
+    """
@@ -0,0 +1,298 @@
+import io
+import asyncio
+import logging
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import transaction
+
+from .models import File, UploadChunk, UploadSession
+from .compression import choose_encoding
+from .jobs import enqueue
+from .previews import schedule_preview
+from .storage import acquire_blob, file_digest, place_content
+from .usage import record_usage
+from .utils import build_unique_name, seconds_since_epoch, user_directory_path
+
+logger = logging.getLogger('mycloud')
+
+UPLOADS_DIRECTORY = 'uploads'
+WRITE_BLOCK_SIZE = 64 * 1024
+
+
+class ChunkError(Exception):
+    """
+    Ошибка приёма части файла: неверный номер, смещение или размер.
+    """
+
+
+def staging_name(session):
+    """
+    Функция для получения имени промежуточного файла сессии загрузки в хранилище
+    """
+    return f'{UPLOADS_DIRECTORY}/{session.id}.part'
+
+
+class _ChunkReader:
+    """
+    Поток тела запроса, ограниченный размером части: отдаёт ровно length байт
+    и выбрасывает ChunkError, если тело короче или длиннее.
+    """
+
+    def __init__(self, stream, index, length):
+        # DRF отдаёт None вместо потока для пустого тела (Content-Length: 0)
+        self.stream = stream if stream is not None else io.BytesIO()
+        self.index = index
+        self.remaining = length
+        self.length = length
+
+    def read(self, size=-1):
+        if not self.remaining:
+            if self.stream.read(1):
+                raise ChunkError(f'Chunk {self.index} must be exactly {self.length} bytes')
+            return b''
+        size = self.remaining if size is None or size < 0 else min(size, self.remaining)
+        data = self.stream.read(min(size, WRITE_BLOCK_SIZE))
+        if not data:
+            raise ChunkError(f'Chunk {self.index} must be exactly {self.length} bytes')
+        self.remaining -= len(data)
+        return data
+
+
+def allocate(session):
+    """
+    Начинает загрузку в хранилище: на диске создаётся промежуточный файл нужного размера,
+    в который части пишутся по своим смещениям, в S3 - multipart upload.
+
+    Args:
+        session (UploadSession): сессия загрузки.
+    """
+    session.upload_id = default_storage.create_upload(staging_name(session), session.size)
+    if session.upload_id:
+        UploadSession.objects.filter(pk=session.pk).update(upload_id=session.upload_id)
+
+
+def chunk_bounds(session, index):
+    """
+    Возвращает смещение и ожидаемый размер части.
+
+    Args:
+        session (UploadSession): сессия загрузки.
+        index (int): номер части.
+
+    Returns:
+        tuple: (offset, length) части.
+
+    Raises:
+        ChunkError: если номер части вне файла.
+    """
+    if index >= session.total_chunks:
+        raise ChunkError(f'Chunk index {index} is out of range')
+    offset = index * session.chunk_size
+    return offset, min(session.chunk_size, session.size - offset)
+
+
+def write_chunk_data(session, index, stream, content_range=None):
+    """
+    Записывает часть из потока запроса по её смещению в промежуточный файл хранилища.
+
+    Тело запроса читается блоками и сразу пишется в хранилище, часть не держится в памяти целиком.
+    Функция не обращается к базе, поэтому её можно выполнять в пуле потоков.
+
+    Args:
+        session (UploadSession): сессия загрузки.
+        index (int): номер части.
+        stream: файлоподобный поток тела запроса.
+        content_range (str | None): заголовок Content-Range для сверки смещения.
+
+    Returns:
+        tuple: (offset, length, etag) записанной части.
+
+    Raises:
+        ChunkError: если смещение или размер части не совпадают с ожидаемыми или сборка файла уже начата.
+    """
+    if session.job_id is not None:
+        raise ChunkError('Upload session is already being completed')
+    offset, length = chunk_bounds(session, index)
+    if content_range and content_range != f'bytes {offset}-{offset + length - 1}/{session.size}':
+        raise ChunkError(f'Content-Range {content_range} does not match chunk {index}')
+
+    etag = default_storage.write_upload_part(
+        staging_name(session), session.upload_id, index, offset, _ChunkReader(stream, index, length)
+    )
+    return offset, length, etag
+
+
+def write_chunk(session, index, stream, content_range=None):
+    """
+    Записывает часть в промежуточный файл хранилища и отмечает её принятой.
+
+    Args:
+        session (UploadSession): сессия загрузки.
+        index (int): номер части.
+        stream: файлоподобный поток тела запроса.
+        content_range (str | None): заголовок Content-Range для сверки смещения.
+
+    Returns:
+        UploadChunk: запись о принятой части.
+
+    Raises:
+        ChunkError: если смещение или размер части не совпадают с ожидаемыми.
+    """
+    offset, length, etag = write_chunk_data(session, index, stream, content_range)
+    chunk, _ = UploadChunk.objects.update_or_create(
+        session=session, index=index, defaults={'offset': offset, 'size': length, 'etag': etag}
+    )
+    UploadSession.objects.filter(pk=session.pk).update(data_updated=seconds_since_epoch())
+    return chunk
+
+
+async def awrite_chunk(session, index, stream, content_range=None):
+    """
+    Асинхронный вариант write_chunk: запись в хранилище выполняется в пуле потоков,
+    запросы к базе - асинхронным ORM.
+    """
+    offset, length, etag = await asyncio.to_thread(write_chunk_data, session, index, stream, content_range)
+    chunk, _ = await UploadChunk.objects.aupdate_or_create(
+        session=session, index=index, defaults={'offset': offset, 'size': length, 'etag': etag}
+    )
+    await UploadSession.objects.filter(pk=session.pk).aupdate(data_updated=seconds_since_epoch())
+    return chunk
+
+
+def schedule_finalize(session):
+    """
+    Ставит в очередь сборку файла из принятых частей (задача finalize_upload).
+
+    Сессия блокируется на время проверки, поэтому повторный запрос завершения
+    возвращает уже поставленную задачу, а не запускает вторую сборку.
+
+    Args:
+        session (UploadSession): сессия загрузки.
+
+    Returns:
+        Job: задача сборки файла.
+
+    Raises:
+        ChunkError: если приняты не все части.
+    """
+    with transaction.atomic():
+        session = UploadSession.objects.select_for_update().select_related('job').get(pk=session.pk)
+        if session.job is not None:
+            return session.job
+        received = session.chunks.count()
+        if received != session.total_chunks:
+            raise ChunkError(f'Received {received} of {session.total_chunks} chunks')
+        session.job = enqueue('finalize_upload', {'session_id': str(session.pk)}, creator=session.creator)
+        session.save(update_fields=['job'])
+    logger.info(f'Upload session {session.pk} queued for completion as job {session.job.id}')
+    return session.job
+
+
+def _lock_session(session):
+    # Сессию могли отменить или уже завершить повторной попыткой задачи
+    return UploadSession.objects.select_for_update().filter(pk=session.pk).exists()
+
+
+def finalize(session):
+    """
+    Завершает загрузку: переносит собранный файл в каталог пользователя и создаёт запись File.
+
+    Выполняется задачей finalize_upload, а не в запросе клиента: хэш считается одним проходом
+    по собранному файлу, потому что части приходят в произвольном порядке и в разные процессы.
+    На диске части уже лежат на своих местах в промежуточном файле, в S3 объект собирается
+    из частей на стороне хранилища, поэтому файл не копируется через приложение, а переносится
+    в пределах хранилища. Хэш сверяется с хэшем, переданным клиентом при создании сессии.
+    Сжимаемое содержимое (FILE_COMPRESSION) переписывается сжатым ещё одним проходом.
+    Запись File создаётся под блокировкой сессии, поэтому повтор задачи не создаёт второй файл.
+
+    Args:
+        session (UploadSession): сессия загрузки.
+
+    Returns:
+        File | None: созданный объект File или None, если сессия уже завершена или отменена.
+
+    Raises:
+        ChunkError: если приняты не все части или хэш собранного файла не совпал с ожидаемым.
+    """
+    parts = list(session.chunks.order_by('index').values_list('index', 'etag'))
+    if len(parts) != session.total_chunks:
+        raise ChunkError(f'Received {len(parts)} of {session.total_chunks} chunks')
+
+    name = staging_name(session)
+    default_storage.complete_upload(name, session.upload_id, parts)
+    digest = file_digest(name)
+    if session.digest and session.digest != digest:
+        raise ChunkError(f'Assembled file digest {digest} does not match expected {session.digest}')
+
+    unique_name = build_unique_name(session.name)
+    file_obj = File(
+        creator=session.creator, name=unique_name, size=session.size, comment=session.comment, digest=digest
+    )
+    session_id = session.pk
+
+    if settings.FILE_DEDUPLICATION:
+        with transaction.atomic():
+            if not _lock_session(session):
+                return None
+            file_obj.blob = acquire_blob(digest, session.size, name)
+            file_obj.file.name = file_obj.blob.file.name
+            file_obj.encoding = file_obj.blob.encoding
+            file_obj.stored_size = file_obj.blob.stored_size
+            file_obj.save()
+            record_usage(file_obj.creator_id, files=1, size=file_obj.size)
+            session.delete()
+            schedule_preview(file_obj)
+        logger.info(f'Upload session {session_id} stored as blob {file_obj.blob.digest}')
+        return file_obj
+
+    file_obj.file.name = default_storage.get_available_name(user_directory_path(file_obj, unique_name))
+    file_obj.encoding = choose_encoding(name, session.size)
+    with transaction.atomic():
+        if not _lock_session(session):
+            return None
+        file_obj.file.name, file_obj.stored_size = place_content(name, file_obj.file.name, file_obj.encoding)
+        file_obj.save()
+        record_usage(file_obj.creator_id, files=1, size=file_obj.size)
+        session.delete()
+        schedule_preview(file_obj)
+    logger.info(f'Upload session {session_id} assembled into {file_obj.file.name}')
+    return file_obj
+
+
+def discard(session):
+    """
+    Удаляет сессию загрузки вместе с промежуточным файлом.
+
+    Args:
+        session (UploadSession): сессия загрузки.
+    """
+    name = staging_name(session)
+    session.delete()
+    default_storage.abort_upload(name, session.upload_id)
+
+
+def collect_expired(ttl):
+    """
+    Удаляет брошенные сессии загрузки и промежуточные файлы без сессии.
+
+    Args:
+        ttl (int): время жизни сессии без активности, секунды.
+
+    Returns:
+        int: количество удалённых сессий.
+    """
+    deadline = seconds_since_epoch() - ttl
+    expired = 0
+    for session in UploadSession.objects.filter(data_updated__lt=deadline).iterator():
+        discard(session)
+        expired += 1
+
+    active = {f'{pk}.part' for pk in UploadSession.objects.values_list('pk', flat=True)}
+    # Обход в порядке сортировки начинается с каталога uploads и заканчивается на первом файле вне его
+    for name, modified in default_storage.iter_files(f'{UPLOADS_DIRECTORY}/'):
+        if not name.startswith(f'{UPLOADS_DIRECTORY}/'):
+            break
+        if name.rpartition('/')[2] not in active and modified < deadline:
+            default_storage.delete(name)
+    return expired
@@ -0,0 +1,174 @@
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Count, F, Max, Sum
+from django.db.models.functions import Greatest
+
+from .models import File, Job, UserUsage
+from .utils import seconds_since_epoch
+
+
+def _counter(field, delta):
+    if delta < 0:
+        return Greatest(F(field) + delta, 0)
+    return F(field) + delta
+
+
+def record_usage(user_id, files=0, size=0):
+    """
+    Изменяет счётчики использования хранилища пользователем.
+
+    Вызывается внутри transaction.atomic вместе с созданием или удалением файлов,
+    чтобы счётчики и строки File менялись одной транзакцией. Уменьшение не опускает
+    счётчик ниже нуля: если счётчик разошёлся с таблицей File, удаление файлов не должно
+    падать на ограничении положительного поля, расхождение исправляет rebuild_usage.
+
+    Args:
+        user_id (int): ID пользователя.
+        files (int): изменение количества файлов.
+        size (int): изменение общего размера, байт.
+    """
+    values = {
+        'file_count': _counter('file_count', files),
+        'total_size': _counter('total_size', int(size)),
+        'last_activity': seconds_since_epoch(),
+        'version': F('version') + 1,
+    }
+    if not UserUsage.objects.filter(user_id=user_id).update(**values):
+        UserUsage.objects.get_or_create(user_id=user_id)
+        UserUsage.objects.filter(user_id=user_id).update(**values)
+
+
+def mark_changed(user_id):
+    """
+    Отмечает изменение файлов или данных пользователя без изменения счётчиков использования.
+
+    Args:
+        user_id (int): ID пользователя.
+    """
+    if not UserUsage.objects.filter(user_id=user_id).update(version=F('version') + 1):
+        UserUsage.objects.get_or_create(user_id=user_id, defaults={'version': 1})
+
+
+def mark_files_changed(files):
+    """
+    Отмечает изменение владельцев файлов одним запросом с подзапросом по File.
+
+    Args:
+        files (QuerySet): изменённые файлы.
+    """
+    UserUsage.objects.filter(user_id__in=files.values('creator_id')).update(version=F('version') + 1)
+
+
+def get_version(user_id):
+    """
+    Возвращает маркер изменений файлов и данных пользователя.
+
+    Args:
+        user_id (int): ID пользователя.
+
+    Returns:
+        int: значение UserUsage.version, 0 для пользователя без записи UserUsage.
+    """
+    return UserUsage.objects.filter(user_id=user_id).values_list('version', flat=True).first() or 0
+
+
+def listed_users():
+    """
+    Возвращает пользователей для списка администратора: всех, кроме ожидающих удаления.
+
+    Деактивированные пользователи остаются в списке, как и пользователи, задача удаления
+    которых завершилась ошибкой: администратор видит их и может удалить повторно.
+
+    Returns:
+        QuerySet: пользователи без поставленной или выполняющейся задачи удаления.
+    """
+    return User.objects.exclude(usage__deletion_job__status__in=(Job.PENDING, Job.RUNNING))
+
+
+def get_users_version(users):
+    """
+    Возвращает маркер изменений списка пользователей одним агрегирующим запросом.
+
+    Маркеры пользователей только растут, поэтому сумма меняется при изменении любого из них,
+    а количество и наибольший ID - при добавлении и удалении пользователей.
+
+    Args:
+        users (QuerySet): пользователи списка.
+
+    Returns:
+        tuple: (количество, наибольший ID, сумма маркеров).
+    """
+    values = users.order_by().aggregate(count=Count('id'), last=Max('id'), version=Sum('usage__version'))
+    return values['count'], values['last'] or 0, values['version'] or 0
+
+
+def get_total_size(user_id):
+    """
+    Возвращает общий размер файлов пользователя по счётчику, без агрегации по File.
+
+    Args:
+        user_id (int): ID пользователя.
+
+    Returns:
+        int: общий размер файлов, байт.
+    """
+    return UserUsage.objects.filter(user_id=user_id).values_list('total_size', flat=True).first() or 0
+
+
+def quota_exceeded(user_id, size):
+    """
+    Проверяет, превысит ли пользователь квоту USER_STORAGE_QUOTA, добавив size байт.
+
+    Args:
+        user_id (int): ID пользователя.
+        size (int): размер добавляемых данных, байт.
+
+    Returns:
+        bool: True, если квота задана и будет превышена.
+    """
+    quota = settings.USER_STORAGE_QUOTA
+    return bool(quota) and get_total_size(user_id) + size > quota
+
+
+def compute_usage():
+    """
+    Считает фактическое использование хранилища по таблице File одним агрегирующим запросом.
+
+    Returns:
+        dict: {user_id: (file_count, total_size)} для пользователей, у которых есть файлы.
+    """
+    rows = File.objects.values('creator').annotate(file_count=Count('id'), total_size=Sum('size'))
+    return {row['creator']: (row['file_count'], int(row['total_size'] or 0)) for row in rows}
+
+
+def rebuild_usage(repair=True):
+    """
+    Сверяет счётчики UserUsage с фактическими строками File и при необходимости исправляет их.
+
+    Args:
+        repair (bool): перезаписать расхождения фактическими значениями.
+
+    Returns:
+        list: расхождения в виде (user_id, (file_count, total_size) по счётчику, фактические значения).
+    """
+    actual = compute_usage()
+    stored = dict(
+        (user_id, (file_count, total_size))
+        for user_id, file_count, total_size in UserUsage.objects.values_list('user_id', 'file_count', 'total_size')
+    )
+    mismatches = []
+    for user_id in User.objects.values_list('id', flat=True).iterator():
+        expected = actual.get(user_id, (0, 0))
+        current = stored.get(user_id, (0, 0))
+        if current != expected:
+            mismatches.append((user_id, current, expected))
+
+    if repair:
+        with transaction.atomic():
+            for user_id, _, (file_count, total_size) in mismatches:
+                UserUsage.objects.update_or_create(
+                    user_id=user_id, defaults={'file_count': file_count, 'total_size': total_size}
+                )
+                mark_changed(user_id)
+    return mismatches
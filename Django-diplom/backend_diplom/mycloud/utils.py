@@ -1,13 +1,25 @@
 import random
 import uuid
+import hashlib
 from datetime import datetime
 import pytz
+from django.conf import settings
+
+def shard_directories(key):
+    """
+    Функция для получения подкаталогов шардирования по шестнадцатеричному ключу: 'ab/cd' при
+    MEDIA_SHARD_DEPTH = 2 и MEDIA_SHARD_WIDTH = 2, пустая строка при MEDIA_SHARD_DEPTH = 0
+    """
+    width = settings.MEDIA_SHARD_WIDTH
+    return '/'.join(key[level * width:(level + 1) * width] for level in range(settings.MEDIA_SHARD_DEPTH))
 
 def user_directory_path(instance, filename):
     """
-    Функция для динамического определения пути для сохранения файла
+    Функция для динамического определения пути для сохранения файла: user_<id>/<шард>/<имя>,
+    шард считается по имени файла, чтобы файлы пользователя равномерно распределялись по подкаталогам
     """
-    return 'user_{0}/{1}'.format(instance.creator.id, filename)
+    shard = shard_directories(hashlib.md5(filename.encode()).hexdigest())
+    return '/'.join(part for part in ('user_{0}'.format(instance.creator_id), shard, filename) if part)
 
 def seconds_since_epoch():
     """
@@ -21,4 +33,32 @@ def generating_uuid():
     """
     Функция для получения уникального индентификатора
     """
-    return uuid.uuid1(random.randint(10, 10**12))
\ No newline at end of file
+    return uuid.uuid1(random.randint(10, 10**12))
+
+def build_unique_name(original_name):
+    """
+    Функция для формирования уникального имени файла с меткой времени и расширением
+    """
+    name_parts = original_name.rsplit('.', 1)
+    if len(name_parts) == 2:
+        name, extension = name_parts
+    else:
+        name = name_parts[0]
+        extension = ''
+
+    if not extension:
+        extension = 'bin'
+
+    return f"{seconds_since_epoch()}_{name}.{extension}"
+
+def new_hasher():
+    """
+    Функция для получения объекта хэша содержимого по алгоритму FILE_DIGEST_ALGORITHM
+    """
+    return hashlib.new(settings.FILE_DIGEST_ALGORITHM)
+
+def is_valid_digest(value):
+    """
+    Функция для проверки, что строка похожа на хэш FILE_DIGEST_ALGORITHM в шестнадцатеричном виде
+    """
+    return len(value) == new_hasher().digest_size * 2 and all(char in '0123456789abcdef' for char in value)
@@ -1,40 +1,79 @@
-import os
-import shutil
 import logging
 
 from django.conf import settings
-
+from django.core.files.storage import default_storage
 from django.http import HttpResponse
 from django.shortcuts import render, get_object_or_404
 from django.contrib.auth.models import User
+from django.db import transaction
 
 from rest_framework import generics, status
-from rest_framework.authentication import TokenAuthentication
 from rest_framework.permissions import AllowAny, IsAuthenticated, IsAdminUser
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
-from .models import File
-from .serializers import FileReadSerializer, FileWriteSerializer, UserSerializer
+from . import uploads
+from .authentication import CachedTokenAuthentication
+from .cache import get_file_info, invalidate_file_info
+from .conditional import list_etag, list_not_modified, with_list_etag
+from .download_stats import download_recorder
+from .downloads import archive_member_name, not_modified, send_file, zip_response
+from .filters import FileFilterBackend
+from .jobs import enqueue
+from .models import File, Job, UploadSession
+from .pagination import FileCursorPagination, UserCursorPagination
+from .previews import PREVIEW_CONTENT_TYPE, preview_name
+from .routers import read_from_primary, read_from_replica
+from .serializers import BulkFileIdsSerializer, BulkFileUpdateSerializer, FileReadSerializer, FileUpdateSerializer, \
+    FileWriteSerializer, JobSerializer, UploadSessionSerializer, UserSerializer
+from .storage import delete_files, remove_file_content
+from .tasks import schedule_user_deletion
+from .usage import get_users_version, get_version, listed_users, mark_changed, mark_files_changed, record_usage
 from .utils import seconds_since_epoch
-from django.utils.encoding import iri_to_uri
 
 logger = logging.getLogger('mycloud')
+# Частые события скачивания пишутся с долей LOG_SAMPLING
+download_logger = logging.getLogger('mycloud.downloads')
+
+
+def job_accepted(job, **data):
+    """
+    Формирует ответ HTTP 202 о поставленной в очередь задаче со ссылкой для опроса её состояния.
+    """
+    return Response(
+        {**data, 'job': JobSerializer(job).data},
+        status=status.HTTP_202_ACCEPTED,
+        headers={'Location': f'/api/v1/jobs/{job.id}/'},
+    )
+
 class UserListView(generics.ListAPIView):
     """
     View для получения всех Пользователей.
 
-    - queryset: все объекты User, отсортированные по id.
+    - queryset: объекты User без ожидающих удаления (см. listed_users), отсортированные по id,
+      со счётчиками UserUsage в том же запросе.
     - serializer_class: UserSerializer.
+    - pagination_class: курсорная пагинация по id (?page_size=&cursor=), страница не больше API_MAX_PAGE_SIZE.
     - permission_classes: только администраторы.
     """
-    queryset = User.objects.all().order_by('id')
+    queryset = listed_users().select_related('usage').order_by('id')
     serializer_class = UserSerializer
+    pagination_class = UserCursorPagination
     permission_classes = (IsAdminUser,)
 
     def get(self, request, *args, **kwargs):
+        """
+        Возвращает страницу списка пользователей ({"next", "previous", "results"})
+        или HTTP 304, если список не менялся с прошлого запроса клиента.
+        Маркер изменений считается одним агрегирующим запросом без выборки пользователей.
+        """
         logger.info('Fetching all users')
-        return super().get(request, *args, **kwargs)
+        read_from_replica(request, request.user)
+        etag = list_etag(request, get_users_version(listed_users()))
+        response = list_not_modified(request, etag)
+        if response is not None:
+            return response
+        return with_list_etag(super().get(request, *args, **kwargs), etag)
 
 class UserDetailView(APIView):
     """
@@ -46,23 +85,22 @@ class UserDetailView(APIView):
 
     def delete(self, request, pk, format=None):
         """
-        Удаляет пользователя и его файлы.
+        Ставит в очередь удаление пользователя и его файлов. Общее содержимое (Blob) удаляется,
+        только если на него не осталось ссылок других пользователей.
 
         Args:
             request (HttpRequest): HTTP запрос.
             pk (int): ID пользователя.
 
         Returns:
-            Response: HTTP 204 при успешном удалении.
+            Response: HTTP 202 с состоянием фоновой задачи.
         """
         user = get_object_or_404(User, pk=pk)
         logger.info(f'Deleting user {user.id}')
-        user_directory = os.path.join(settings.MEDIA_ROOT, f'user_{user.id}')
-        if os.path.exists(user_directory):
-            shutil.rmtree(user_directory)
-        user.delete()
-        logger.info(f'User {pk} deleted successfully')
-        return Response(status=status.HTTP_204_NO_CONTENT)
+        # Пользователь сразу теряет доступ и пропадает из списка, данные удаляет воркер
+        job = schedule_user_deletion(user, creator=request.user)
+        logger.info(f'User {pk} scheduled for deletion, job {job.id}')
+        return job_accepted(job)
 
     def patch(self, request, pk, format=None):
         """
@@ -77,6 +115,7 @@ class UserDetailView(APIView):
         """
         user = get_object_or_404(User, pk=pk)
         user.is_staff = not user.is_staff
+        # Сохранение сбрасывает кэш аутентификации и ETag списков (mycloud.signals), права меняются сразу
         user.save()
         logger.info(f'User {user.id} admin status changed to {user.is_staff}')
         return Response(status=status.HTTP_200_OK)
@@ -86,45 +125,71 @@ class UserFileListView(APIView):
     View для получения файлов конкретного пользователя.
 
     - permission_classes: только администраторы.
+    - filter_backends, pagination_class: те же фильтры, пагинация и ?fields=, что и у UserPostList.
     """
     permission_classes = [IsAdminUser]
+    filter_backends = [FileFilterBackend]
+    pagination_class = FileCursorPagination
 
     def get(self, request, user_id, format=None):
         """
-        Получает все файлы указанного пользователя.
+        Получает файлы указанного пользователя.
 
         Args:
             request (HttpRequest): HTTP запрос.
             user_id (int): ID пользователя.
 
         Returns:
-            Response: JSON ответ с данными файлов пользователя.
+            Response: страница файлов пользователя ({"next", "previous", "results"})
+            или HTTP 304, если файлы не менялись с прошлого запроса клиента.
         """
-
-    def get(self, request, user_id, format=None):
+        read_from_replica(request, request.user)
         user = get_object_or_404(User, id=user_id)
         logger.info(f'Fetching files for user {user.id}')
-        files = File.objects.filter(creator=user)
-        serializer = FileReadSerializer(files, many=True)
-        logger.info(f'Retrieved {len(files)} files for user {user.id}')
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        etag = list_etag(request, (user.id, get_version(user.id)))
+        response = list_not_modified(request, etag)
+        if response is not None:
+            return response
+        files = File.objects.filter(creator=user).order_by('-data_created', '-id')
+        for backend in self.filter_backends:
+            files = backend().filter_queryset(request, files, self)
+        paginator = self.pagination_class()
+        page = paginator.paginate_queryset(files, request, view=self)
+        serializer = FileReadSerializer(page, many=True, context={'request': request})
+        logger.info(f'Retrieved page of {len(page)} files for user {user.id}')
+        return with_list_etag(paginator.get_paginated_response(serializer.data), etag)
 
 class FileAPIUpdate(generics.RetrieveUpdateAPIView):
     """
     View для чтения и обновления файлов.
 
     - queryset: все объекты File.
-    - serializer_class: FileWriteSerializer.
+    - serializer_class: FileUpdateSerializer, содержимое, размер и хэши только для чтения.
     - permission_classes: только аутентифицированные пользователи.
     """
     queryset = File.objects.all()
-    serializer_class = FileWriteSerializer
+    serializer_class = FileUpdateSerializer
     permission_classes = (IsAuthenticated, )
 
     def update(self, request, *args, **kwargs):
         logger.info(f'Updating file {self.get_object().id}')
         return super().update(request, *args, **kwargs)
 
+    def perform_update(self, serializer):
+        """
+        Сохраняет изменения и сбрасывает кэш сведений о файле для скачивания.
+        Кэш сбрасывается по хэшу до сохранения, чтобы не оставить запись под прежней ссылкой.
+
+        Args:
+            serializer (FileUpdateSerializer): валидированный сериализатор.
+        """
+        previous_hash = serializer.instance.hash
+        instance = serializer.save()
+        mark_changed(instance.creator_id)
+        invalidate_file_info(previous_hash)
+        if instance.hash != previous_hash:
+            invalidate_file_info(instance.hash)
+
 class FileAPIDestroy(generics.RetrieveDestroyAPIView):
     """
     View для удаления файлов.
@@ -139,7 +204,8 @@ class FileAPIDestroy(generics.RetrieveDestroyAPIView):
 
     def perform_destroy(self, instance):
         """
-        Удаляет файл и его запись в базе данных.
+        Удаляет запись файла в базе данных и его содержимое.
+        Общее с другими файлами содержимое (Blob) удаляется только вместе с последней ссылкой.
 
         Args:
             instance (File): объект файла.
@@ -148,11 +214,12 @@ class FileAPIDestroy(generics.RetrieveDestroyAPIView):
             Response: HTTP 204 при успешном удалении.
         """
         file_id = instance.id
-        file_path = instance.file.path
-        super(FileAPIDestroy, self).perform_destroy(instance)
-        if file_path:
-            if os.path.isfile(file_path):
-                os.remove(file_path)
+        file_path = instance.file.name
+        with transaction.atomic():
+            super(FileAPIDestroy, self).perform_destroy(instance)
+            record_usage(instance.creator_id, files=-1, size=-instance.size)
+        invalidate_file_info(instance.hash)
+        remove_file_content(instance)
         logger.info(f'Destroyed file {file_id} and removed file from {file_path}')
         return Response(status=status.HTTP_204_NO_CONTENT)
 
@@ -167,6 +234,14 @@ class FileDownloadView(APIView):
         """
         Возвращает файл для скачивания по его hash.
 
+        Файл отдаётся потоково с поддержкой Range/If-Range и условных запросов
+        по ETag/Last-Modified, поэтому память воркера не зависит от размера файла.
+        При DOWNLOAD_BACKEND nginx/sendfile передачу выполняет фронт-прокси,
+        при хранилище S3 клиент перенаправляется на подписанную ссылку.
+        Сведения о файле берутся из кэша, при промахе - из реплики базы (или из основной, если
+        файла ещё нет в реплике). Дата и счётчик скачиваний записываются отложенно пачками
+        (см. mycloud.download_stats).
+
         Args:
             request (HttpRequest): HTTP запрос.
             hash (str): хеш файла.
@@ -174,32 +249,76 @@ class FileDownloadView(APIView):
         Returns:
             HttpResponse: файл для скачивания или сообщение об ошибке.
         """
-        try:
-            file_obj = get_object_or_404(File, hash=hash)
-        except Exception as e:
+        read_from_replica(request)
+        file_info = get_file_info(hash)
+        if file_info is None and read_from_primary():
+            # Ссылкой на только что загруженный файл могут воспользоваться раньше, чем он попадёт в реплику
+            file_info = get_file_info(hash)
+        if file_info is None:
             return HttpResponse("File not found", status=404)
 
-        file_path = str(file_obj.file)
-        file_name = str(file_obj.name)
-        logger.info(f'Download requested for file: {file_name} with hash: {hash}')
+        file_path = file_info['path']
+        file_name = file_info['name']
+        download_logger.info(f'Download requested for file: {file_name} with hash: {hash}')
         expansion = file_name.split('.')[-1] if '.' in file_name else ''
-        path_file_obj = os.path.join(settings.MEDIA_ROOT, file_path)
-        if os.path.exists(path_file_obj):
-            file_obj.date_download = seconds_since_epoch()
-            file_obj.save()
-            logger.info(f'File {file_name} found, preparing for download')
-            with open(path_file_obj, 'rb') as file:
-                response = HttpResponse(file, content_type='application/force-download')
-
-                if not expansion:
-                    file_name += '.bin'
-
-                response['Content-Disposition'] = f'attachment; filename=' + iri_to_uri(file_name)
-                logger.info(f'File {file_name} ready for download')
-                return response
-        else:
-            logger.error(f'File not found: {path_file_obj}')
+        if not expansion:
+            file_name += '.bin'
+
+        try:
+            response = send_file(
+                request, file_path, file_name, etag=file_info['etag'],
+                encoding=file_info.get('encoding', ''), size=file_info['size'],
+            )
+        except FileNotFoundError:
+            logger.error(f'File not found: {file_path}')
             return HttpResponse("File not found", status=404)
+        if response.status_code in (status.HTTP_200_OK, status.HTTP_206_PARTIAL_CONTENT, status.HTTP_302_FOUND):
+            # Докачка диапазонов обновляет дату, но не считается новым скачиванием
+            counted = response.status_code != status.HTTP_206_PARTIAL_CONTENT or \
+                response.get('Content-Range', '').startswith('bytes 0-')
+            download_recorder.record(file_info['id'], seconds_since_epoch(), counted)
+            download_logger.info(f'File {file_name} ready for download')
+        return response
+
+class FilePreviewView(APIView):
+    """
+    View для получения превью файла по hash.
+
+    - permission_classes: доступ для всех, как у скачивания.
+    """
+    permission_classes = (AllowAny, )
+
+    def get(self, request, hash, format=None):
+        """
+        Возвращает превью файла, построенное фоновой задачей после загрузки.
+
+        Сведения о файле берутся из кэша, поэтому превью обходится одним чтением небольшого файла
+        из хранилища. Содержимое по hash не меняется, и ответ кэшируется браузером надолго.
+
+        Args:
+            request (HttpRequest): HTTP запрос.
+            hash (str): хеш файла.
+
+        Returns:
+            HttpResponse: изображение JPEG или HTTP 404, если файла или превью нет.
+        """
+        file_info = get_file_info(hash)
+        if file_info is None:
+            return HttpResponse("File not found", status=404)
+
+        etag = f'{file_info["etag"]}-preview'
+        response = not_modified(request, etag)
+        if response is None:
+            try:
+                with default_storage.open(preview_name(file_info['path']), 'rb') as file:
+                    data = file.read()
+            except FileNotFoundError:
+                return HttpResponse("Preview not found", status=404)
+            response = HttpResponse(data, content_type=PREVIEW_CONTENT_TYPE)
+            response['ETag'] = f'"{etag}"'
+        # private: превью удалённого файла не должно оставаться в общих кэшах
+        response['Cache-Control'] = f'private, max-age={settings.PREVIEW_CACHE_MAX_AGE}, immutable'
+        return response
 
 class UserPostList(generics.ListCreateAPIView):
     """
@@ -207,9 +326,13 @@ class UserPostList(generics.ListCreateAPIView):
 
     - authentication_classes: токеновая аутентификация.
     - permission_classes: только аутентифицированные пользователи.
+    - filter_backends: фильтры name, size_min, size_max, created_after, created_before.
+    - pagination_class: курсорная пагинация по (data_created, id), страница не больше API_MAX_PAGE_SIZE.
     """
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = (IsAuthenticated, )
+    filter_backends = [FileFilterBackend]
+    pagination_class = FileCursorPagination
 
     def get_queryset(self):
         """
@@ -218,10 +341,7 @@ class UserPostList(generics.ListCreateAPIView):
         Returns:
             QuerySet: файлы пользователя.
         """
-        user = self.request.user
-        files = File.objects.filter(creator=user).order_by('-data_created')
-        logger.info(f'Found {len(files)} files for user {user.id}')
-        return files
+        return File.objects.filter(creator=self.request.user).order_by('-data_created', '-id')
 
     def get_serializer_class(self):
         """
@@ -236,24 +356,328 @@ class UserPostList(generics.ListCreateAPIView):
 
     def list(self, request, *args, **kwargs):
         """
-        Возвращает данные файлов текущего пользователя и информацию о его статусе.
+        Возвращает страницу файлов текущего пользователя, ссылки next и previous
+        на соседние страницы и информацию о его статусе.
 
         Args:
             request (HttpRequest): HTTP запрос.
 
         Returns:
-            Response: JSON ответ с данными файлов и статусом пользователя.
+            Response: JSON ответ с данными файлов и статусом пользователя
+            или HTTP 304, если они не менялись с прошлого запроса клиента.
         """
         user = self.request.user
         logger.info(f'Listing files for user {user.id}')
-        files = self.get_queryset()
-        serializer = self.get_serializer(files, many=True)
+        read_from_replica(request, user)
+        # Проверка до выборки файлов: неизменившийся список стоит одного запроса к UserUsage
+        etag = list_etag(request, get_version(user.id))
+        response = list_not_modified(request, etag)
+        if response is not None:
+            return response
+        files = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(files)
+        serializer = self.get_serializer(page, many=True)
         data = {
             'isAdmin': user.is_staff,
-            'files': serializer.data
+            'files': serializer.data,
+            'next': self.paginator.get_next_link(),
+            'previous': self.paginator.get_previous_link(),
         }
         logger.info(f'Listed files for user {user.id}')
-        return Response(data, status=status.HTTP_200_OK)
+        return with_list_etag(Response(data, status=status.HTTP_200_OK), etag)
+
+class UploadSessionCreateView(generics.CreateAPIView):
+    """
+    View для создания сессии возобновляемой загрузки файла частями.
+
+    - serializer_class: UploadSessionSerializer.
+    - permission_classes: только аутентифицированные пользователи.
+    """
+    serializer_class = UploadSessionSerializer
+    permission_classes = (IsAuthenticated, )
+
+    def create(self, request, *args, **kwargs):
+        """
+        Создаёт сессию загрузки. Если клиент передал digest, а у пользователя уже есть файл
+        с таким содержимым, сессия не создаётся и возвращается существующий файл.
+
+        Args:
+            request (HttpRequest): HTTP запрос.
+
+        Returns:
+            Response: HTTP 201 с данными сессии или HTTP 200 с {"duplicate": true, "file": ...}.
+        """
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        digest = serializer.validated_data.get('digest')
+        if digest:
+            existing = File.objects.filter(
+                creator=request.user, digest=digest, size=serializer.validated_data['size']
+            ).order_by('-data_created', '-id').first()
+            if existing is not None:
+                logger.info(f'Upload of {digest} by user {request.user.id} matches file {existing.id}')
+                return Response(
+                    {'duplicate': True, 'file': FileReadSerializer(existing).data}, status=status.HTTP_200_OK
+                )
+        self.perform_create(serializer)
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+    def perform_create(self, serializer):
+        """
+        Создаёт сессию и промежуточный файл под неё.
+
+        Args:
+            serializer (UploadSessionSerializer): валидированный сериализатор.
+        """
+        session = serializer.save()
+        uploads.allocate(session)
+        logger.info(f'Upload session {session.id} created for user {session.creator_id}, {session.size} bytes')
+
+class UploadSessionDetailView(APIView):
+    """
+    View для получения состояния и отмены сессии загрузки.
+
+    - permission_classes: только аутентифицированные пользователи.
+    """
+    permission_classes = (IsAuthenticated, )
+
+    def get(self, request, session_id, format=None):
+        """
+        Возвращает состояние сессии, включая номера уже принятых частей.
+
+        Args:
+            request (HttpRequest): HTTP запрос.
+            session_id (UUID): ID сессии загрузки.
+
+        Returns:
+            Response: JSON ответ с данными сессии.
+        """
+        session = get_object_or_404(UploadSession, pk=session_id, creator=request.user)
+        serializer = UploadSessionSerializer(session, context={'request': request})
+        return Response(serializer.data, status=status.HTTP_200_OK)
+
+    def delete(self, request, session_id, format=None):
+        """
+        Отменяет сессию и удаляет принятые части.
+
+        Args:
+            request (HttpRequest): HTTP запрос.
+            session_id (UUID): ID сессии загрузки.
+
+        Returns:
+            Response: HTTP 204 при успешном удалении.
+        """
+        session = get_object_or_404(UploadSession, pk=session_id, creator=request.user)
+        uploads.discard(session)
+        logger.info(f'Upload session {session_id} discarded')
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+class UploadChunkView(APIView):
+    """
+    View для приёма одной части файла. Тело запроса - сырые байты части.
+
+    - permission_classes: только аутентифицированные пользователи.
+    """
+    permission_classes = (IsAuthenticated, )
+
+    def put(self, request, session_id, index, format=None):
+        """
+        Записывает часть по её смещению. Повторная отправка части перезаписывает её.
+
+        Args:
+            request (HttpRequest): HTTP запрос.
+            session_id (UUID): ID сессии загрузки.
+            index (int): номер части.
+
+        Returns:
+            Response: JSON ответ со смещением и размером принятой части.
+        """
+        session = get_object_or_404(UploadSession, pk=session_id, creator=request.user)
+        try:
+            chunk = uploads.write_chunk(session, index, request.stream, request.headers.get('Content-Range'))
+        except uploads.ChunkError as e:
+            logger.error(f'Upload session {session_id}: {e}')
+            return Response({'detail': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({'index': chunk.index, 'offset': chunk.offset, 'size': chunk.size}, status=status.HTTP_200_OK)
+
+class UploadSessionCompleteView(APIView):
+    """
+    View для завершения загрузки и создания файла пользователя.
+
+    - permission_classes: только аутентифицированные пользователи.
+    """
+    permission_classes = (IsAuthenticated, )
+
+    def post(self, request, session_id, format=None):
+        """
+        Ставит в очередь сборку файла из принятых частей. Хэш собранного файла считается задачей,
+        данные созданного файла возвращаются в поле result.file задачи.
+
+        Args:
+            request (HttpRequest): HTTP запрос.
+            session_id (UUID): ID сессии загрузки.
+
+        Returns:
+            Response: HTTP 202 с состоянием задачи в поле job или HTTP 409, если приняты не все части.
+        """
+        session = get_object_or_404(UploadSession, pk=session_id, creator=request.user)
+        try:
+            job = uploads.schedule_finalize(session)
+        except uploads.ChunkError as e:
+            return Response({'detail': str(e)}, status=status.HTTP_409_CONFLICT)
+        return job_accepted(job, session=str(session.pk))
+
+class BulkFileMixin:
+    """
+    Общие методы пакетных операций: файлы пользователя, администратору доступны все файлы.
+    """
+
+    def get_queryset(self):
+        """
+        Возвращает файлы, доступные текущему пользователю.
+
+        Returns:
+            QuerySet: все файлы для администратора, иначе файлы пользователя.
+        """
+        if self.request.user.is_staff:
+            return File.objects.all()
+        return File.objects.filter(creator=self.request.user)
+
+class FileBulkDeleteView(BulkFileMixin, APIView):
+    """
+    View для удаления нескольких файлов одним запросом.
+
+    - permission_classes: только аутентифицированные пользователи.
+    """
+    permission_classes = (IsAuthenticated, )
+
+    def post(self, request, format=None):
+        """
+        Удаляет записи файлов одной транзакцией, содержимое освобождает фоновая задача.
+
+        Args:
+            request (HttpRequest): HTTP запрос с {"ids": [...]}.
+
+        Returns:
+            Response: JSON ответ с ID удалённых и не найденных файлов,
+            HTTP 202 с состоянием задачи в поле job, если что-то удалено.
+        """
+        serializer = BulkFileIdsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        ids = serializer.validated_data['ids']
+        deleted, contents = delete_files(self.get_queryset().filter(pk__in=ids))
+        logger.info(f'User {request.user.id} deleted {len(deleted)} files in bulk')
+        deleted_ids = set(deleted)
+        data = {'deleted': deleted, 'not_found': [file_id for file_id in ids if file_id not in deleted_ids]}
+        if not contents:
+            return Response(data, status=status.HTTP_200_OK)
+        job = enqueue('remove_contents', {'contents': contents}, creator=request.user)
+        return job_accepted(job, **data)
+
+class FileBulkUpdateView(BulkFileMixin, APIView):
+    """
+    View для изменения имени и комментария нескольких файлов одним запросом.
+
+    - permission_classes: только аутентифицированные пользователи.
+    """
+    permission_classes = (IsAuthenticated, )
+
+    def patch(self, request, format=None):
+        """
+        Изменяет файлы одним bulk_update. Если хотя бы один файл не найден, ничего не меняется.
+
+        Args:
+            request (HttpRequest): HTTP запрос с {"files": [{"id", "name", "comment"}, ...]}.
+
+        Returns:
+            Response: JSON ответ с данными изменённых файлов.
+        """
+        serializer = BulkFileUpdateSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        changes = {item.pop('id'): item for item in serializer.validated_data['files']}
+        files = list(self.get_queryset().filter(pk__in=changes).order_by('id'))
+        missing = set(changes) - {file_obj.id for file_obj in files}
+        if missing:
+            return Response(
+                {'detail': 'Файлы не найдены.', 'not_found': sorted(missing)}, status=status.HTTP_404_NOT_FOUND
+            )
+
+        fields = set()
+        for file_obj in files:
+            for field, value in changes[file_obj.id].items():
+                setattr(file_obj, field, value)
+                fields.add(field)
+        if fields:
+            File.objects.bulk_update(files, sorted(fields), batch_size=500)
+            mark_files_changed(File.objects.filter(pk__in=changes))
+            invalidate_file_info(*(file_obj.hash for file_obj in files))
+        logger.info(f'User {request.user.id} updated {len(files)} files in bulk')
+        return Response(
+            {'files': FileReadSerializer(files, many=True, context={'request': request}).data},
+            status=status.HTTP_200_OK
+        )
+
+class FileBulkDownloadView(BulkFileMixin, APIView):
+    """
+    View для скачивания нескольких файлов одним ZIP-архивом.
+
+    - permission_classes: только аутентифицированные пользователи.
+    """
+    permission_classes = (IsAuthenticated, )
+
+    def get(self, request, format=None):
+        """
+        Отдаёт ZIP-архив с файлами из ?ids=1,2,3, собираемый на лету.
+
+        Args:
+            request (HttpRequest): HTTP запрос.
+
+        Returns:
+            StreamingHttpResponse: архив с найденными файлами.
+        """
+        serializer = BulkFileIdsSerializer(data={'ids': [
+            file_id for file_id in request.query_params.get('ids', '').split(',') if file_id
+        ]})
+        serializer.is_valid(raise_exception=True)
+        files = self.get_queryset().filter(pk__in=serializer.validated_data['ids']).order_by('name', 'id') \
+            .only('id', 'name', 'file', 'encoding', 'size', 'data_created')
+
+        entries = []
+        names = set()
+        for file_obj in files:
+            if not default_storage.exists(str(file_obj.file)):
+                logger.error(f'File not found: {file_obj.file}')
+                continue
+            # Одинаковые имена в архиве различаются номером: report (1).txt
+            name = archive_member_name(file_obj.name) or f'{file_obj.id}.bin'
+            stem, dot, extension = name.rpartition('.')
+            number = 1
+            while name in names:
+                name = f'{stem} ({number}).{extension}' if dot else f'{extension} ({number})'
+                number += 1
+            names.add(name)
+            entries.append((name, str(file_obj.file), file_obj.encoding, file_obj.size, file_obj.data_created))
+        if not entries:
+            return Response({'detail': 'Файлы не найдены.'}, status=status.HTTP_404_NOT_FOUND)
+
+        logger.info(f'User {request.user.id} downloads {len(entries)} files as ZIP')
+        return zip_response(entries, f'files_{seconds_since_epoch()}.zip')
+
+class JobDetailView(generics.RetrieveAPIView):
+    """
+    View для опроса состояния фоновой задачи.
+
+    - serializer_class: JobSerializer.
+    - permission_classes: только аутентифицированные пользователи, задача доступна поставившему её
+      пользователю и администраторам.
+    """
+    serializer_class = JobSerializer
+    permission_classes = (IsAuthenticated, )
+
+    def get_queryset(self):
+        if self.request.user.is_staff:
+            return Job.objects.all()
+        return Job.objects.filter(creator=self.request.user)
 
 # handle_requirements()
 #TODO Все настройки для files static
@@ -1,5 +1,5 @@
 import { FC } from 'react'
-import { useQuery } from 'react-query'
+import { useInfiniteQuery } from 'react-query'
 import { useParams } from 'react-router-dom'
 import { fetchUserFiles } from '../../../services/API'
 import { FileItem } from '../FileItem/FileItem'
@@ -12,7 +12,12 @@ import './AdminUserFiles.css'
  */
 export const AdminUserFiles: FC = () => {
     const { userId } = useParams<{ userId: string }>()
-    const { data: files, error, isLoading } = useQuery(['userFiles', userId], () => fetchUserFiles(userId))
+    const { data, error, isLoading, hasNextPage, fetchNextPage, isFetchingNextPage } = useInfiniteQuery(
+        ['userFiles', userId],
+        ({ pageParam }) => fetchUserFiles(userId, pageParam),
+        { getNextPageParam: lastPage => lastPage.next ?? undefined },
+    )
+    const files = data?.pages.flatMap(page => page.results)
 
     if (isLoading) return <div>Loading...</div>
     if (error instanceof Error) return <div>Произошла ошибка: {error.message}</div>
@@ -25,6 +30,11 @@ export const AdminUserFiles: FC = () => {
                     <FileItem key={file.id} file={file} />
                 ))}
             </div>
+            {hasNextPage && (
+                <button className="load-more" disabled={isFetchingNextPage} onClick={() => fetchNextPage()}>
+                    {isFetchingNextPage ? 'Загрузка...' : 'Показать ещё'}
+                </button>
+            )}
         </div>
     )
 }
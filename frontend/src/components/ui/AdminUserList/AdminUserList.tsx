@@ -1,5 +1,5 @@
 import { FC } from 'react'
-import { useMutation, useQuery, useQueryClient } from 'react-query'
+import { useInfiniteQuery, useMutation, useQueryClient } from 'react-query'
 import { useNavigate } from 'react-router-dom'
 import { deleteUser, fetchUsers, toggleAdminStatus } from '../../../services/API'
 import './AdminUserList.css'
@@ -11,7 +11,12 @@ import './AdminUserList.css'
  */
 export const UserList: FC = () => {
     const queryClient = useQueryClient()
-    const { data: users, error, isLoading } = useQuery('users', fetchUsers)
+    const { data, error, isLoading, hasNextPage, fetchNextPage, isFetchingNextPage } = useInfiniteQuery(
+        'users',
+        ({ pageParam }) => fetchUsers(pageParam),
+        { getNextPageParam: lastPage => lastPage.next ?? undefined },
+    )
+    const users = data?.pages.flatMap(page => page.results)
     const navigate = useNavigate()
 
     const mutationDelete = useMutation(deleteUser, {
@@ -67,6 +72,11 @@ export const UserList: FC = () => {
                     ))}
                 </tbody>
             </table>
+            {hasNextPage && (
+                <button className="load-more" disabled={isFetchingNextPage} onClick={() => fetchNextPage()}>
+                    {isFetchingNextPage ? 'Загрузка...' : 'Показать ещё'}
+                </button>
+            )}
         </div>
     )
 }
\ No newline at end of file
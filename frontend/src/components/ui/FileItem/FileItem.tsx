@@ -98,6 +98,14 @@ export const FileItem: FC<FileProps> = ({ file }) => {
                 </div>
             ) : (
                 <div className="file-info">
+                {file.has_preview && (
+                    <img
+                        className="file-preview"
+                        src={`${baseUrl}/api/v1/preview/${file.hash}/`}
+                        alt={file.name}
+                        loading="lazy"
+                    />
+                )}
                 <h3>{file.name}</h3>
                 <p>Описание: {file.comment}</p>
                 <p>Размер: {Number(file.size) / 1000000} MB</p>
@@ -1,4 +1,4 @@
-import { useMutation, useQuery, useQueryClient } from "react-query"
+import { useInfiniteQuery, useMutation, useQueryClient } from "react-query"
 import { FC, useRef, useState } from "react"
 import { getFiles, uploadFile } from "../../../services/API"
 import { FileItem } from "../FileItem/FileItem"
@@ -17,7 +17,12 @@ export const FileManager: FC = () => {
     const [selectedFile, setSelectedFile] = useState<File | null>(null)
     const [comment, setComment] = useState<string>('')
 
-    const { data: files, error, isLoading } = useQuery('files', getFiles)
+    const { data, error, isLoading, hasNextPage, fetchNextPage, isFetchingNextPage } = useInfiniteQuery(
+        'files',
+        ({ pageParam }) => getFiles(pageParam),
+        { getNextPageParam: lastPage => lastPage.next ?? undefined },
+    )
+    const files = data?.pages.flatMap(page => page.files)
 
     const mutationUpload = useMutation(uploadFile, {
         onSuccess: () => {
@@ -72,10 +77,15 @@ export const FileManager: FC = () => {
                 </button>
             </div>
             <ul className="file-list">
-                {files && files.files.map((file: TypeFile) => (
+                {files?.map((file: TypeFile) => (
                     <FileItem key={file.id} file={file} />
                 ))}
             </ul>
+            {hasNextPage && (
+                <button className="load-more" disabled={isFetchingNextPage} onClick={() => fetchNextPage()}>
+                    {isFetchingNextPage ? 'Загрузка...' : 'Показать ещё'}
+                </button>
+            )}
         </div>
     )
 }
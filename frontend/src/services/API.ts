@@ -26,12 +26,13 @@ const setAuthToken = (token: string | null) => {
 }
 
 /**
- * Получает список пользователей с сервера.
- * @returns Промис, который разрешается массивом объектов TypeUser.
+ * Получает страницу списка пользователей с сервера.
+ * @param pageUrl Ссылка next предыдущей страницы, без неё запрашивается первая страница.
+ * @returns Промис, который разрешается страницей объектов TypeUser.
  */
-export const fetchUsers = async (): Promise<TypeUser[]> => {
+export const fetchUsers = async (pageUrl?: string): Promise<TypePage<TypeUser>> => {
 	setAuthToken(localStorage.getItem('token'))
-	const { data } = await axiosInstance.get('/api/v1/admin/users/')
+	const { data } = await axiosInstance.get(pageUrl || '/api/v1/admin/users/')
 	return data
 }
 
@@ -54,12 +55,13 @@ export const toggleAdminStatus = async (userId: number): Promise<void> => {
 }
 
 /**
- * Получает список файлов для определенного пользователя.
+ * Получает страницу списка файлов для определенного пользователя.
  * @param userId Идентификатор пользователя.
- * @returns Промис, который разрешается массивом объектов TypeFile.
+ * @param pageUrl Ссылка next предыдущей страницы, без неё запрашивается первая страница.
+ * @returns Промис, который разрешается страницей объектов TypeFile.
  */
-export const fetchUserFiles = async (userId: string | undefined | number): Promise<TypeFile[]> => {
-	const { data } = await axiosInstance.get(`/api/v1/admin/users/${userId}/files/`)
+export const fetchUserFiles = async (userId: string | undefined | number, pageUrl?: string): Promise<TypePage<TypeFile>> => {
+	const { data } = await axiosInstance.get(pageUrl || `/api/v1/admin/users/${userId}/files/`)
 	return data
 }
 
@@ -73,12 +75,13 @@ export const getLogout = async (): Promise<void> => {
 }
 
 /**
- * Получает список файлов с сервера.
+ * Получает страницу списка файлов с сервера.
+ * @param pageUrl Ссылка next предыдущей страницы, без неё запрашивается первая страница.
  * @returns Промис, который разрешается объектом TypeAnswerFileList.
  */
-export const getFiles = async (): Promise<TypeAnswerFileList> => {
+export const getFiles = async (pageUrl?: string): Promise<TypeAnswerFileList> => {
 	setAuthToken(localStorage.getItem('token'))
-	const response = await axiosInstance.get('/api/v1/filelist/')
+	const response = await axiosInstance.get(pageUrl || '/api/v1/filelist/')
 	return response.data
 }
 
@@ -30,11 +30,14 @@ type UploadFileWithCommentData = {
 type TypeFile = {
     id: number
     name: string
-    size: string
+    size: number
     data_created: number
     date_download: number
     comment: string
     hash: string
+    digest: string | null
+    stored_size: number | null
+    has_preview: boolean
 }
 
 /**
@@ -50,10 +53,21 @@ type TypeUser = {
     total_size: number;
 }
 
+/**
+ * Тип данных, описывающий страницу списка с курсорной пагинацией.
+ */
+type TypePage<T> = {
+    next: string | null
+    previous: string | null
+    results: T[]
+}
+
 /**
  * Тип данных, описывающий ответ на запрос списка файлов.
  */
 type TypeAnswerFileList = {
     isAdmin: string
     files: TypeFile[]
+    next: string | null
+    previous: string | null
 }
\ No newline at end of file